@@ -5,9 +5,18 @@ Contains core logic and classes
 """
 from .client import API_CLIENT
 from .map_validator import MapValidator
+from .network_metrics import (
+    NETWORK_METRICS,
+    NetworkMetrics
+)
 from .project_manager import ProjectManager
 from .map_exporter import (
     MapExportSettings,
-    MapPublisher
+    MapPublisher,
+    OutputCompression
+)
+from .export_estimator import (
+    ExportEstimate,
+    ExportEstimator
 )
 from .provider import SoarEarthProvider
@@ -14,13 +14,17 @@ __copyright__ = 'Copyright 2022, North Road'
 __revision__ = '$Format:%H$'
 
 import json
+import time
+from collections import defaultdict
 from enum import Enum
+from functools import partial
 from pathlib import Path
 from typing import (
     Optional,
     List,
     Dict,
-    Tuple
+    Tuple,
+    Callable
 )
 
 from qgis.PyQt import sip
@@ -49,6 +53,9 @@ from qgis.core import (
     QgsNetworkAccessManager
 )
 
+from .listings_cache import ListingsCache
+from .network_metrics import NETWORK_METRICS
+
 
 class ListingType(Enum):
     """
@@ -145,14 +152,54 @@ class User:
         return res
 
 
-class Listing:
+class Listing:  # pylint: disable=too-many-instance-attributes
     """
     Encapsulates a soar.earth dataset listing
+
+    The geometry, metadata and timestamp attributes are stored in their raw
+    JSON form, and are only converted to QGIS/Qt objects the first time
+    they are accessed.
     """
 
+    __slots__ = (
+        'owner',
+        '_metadata',
+        '_metadata_json',
+        'preview_url',
+        'user',
+        'description',
+        'min_zoom',
+        'listing_type',
+        'title',
+        'tags',
+        '_created_at',
+        '_created_at_seconds',
+        'total_comments',
+        'filename',
+        'total_views',
+        'id',
+        'filehash',
+        'total_likes',
+        'categories',
+        '_geometry',
+        '_geometry_wkt',
+        '_updated_at',
+        '_updated_at_seconds',
+        'tile_url',
+        'server_url',
+        'layer_name',
+        'layer_crs',
+        'file_size',
+        'domain_name',
+        'files',
+        '_tile_url_expiry_at',
+        '_tile_url_expiry_at_seconds',
+    )
+
     def __init__(self):
         self.owner: Optional[str] = None
-        self.metadata = {}
+        self._metadata: Optional[dict] = None
+        self._metadata_json: Optional[str] = None
         self.preview_url: Optional[str] = None
         self.user: Optional[User] = None
         self.description: Optional[str] = None
@@ -160,7 +207,8 @@ class Listing:
         self.listing_type: ListingType = ListingType.TileLayer
         self.title: Optional[str] = None
         self.tags: List[str] = []
-        self.created_at: QDateTime = QDateTime()
+        self._created_at: Optional[QDateTime] = None
+        self._created_at_seconds: Optional[int] = None
         self.total_comments: int = 0
         self.filename: Optional[str] = None
         self.total_views: int = 0
@@ -168,8 +216,10 @@ class Listing:
         self.filehash: Optional[str] = None
         self.total_likes: int = 0
         self.categories: List[str] = []
-        self.geometry: Optional[QgsGeometry] = None
-        self.updated_at: QDateTime = QDateTime()
+        self._geometry: Optional[QgsGeometry] = None
+        self._geometry_wkt: Optional[str] = None
+        self._updated_at: Optional[QDateTime] = None
+        self._updated_at_seconds: Optional[int] = None
         self.tile_url: Optional[str] = None
         self.server_url: Optional[str] = None
         self.layer_name: Optional[str] = None
@@ -177,7 +227,112 @@ class Listing:
         self.file_size: Optional[int] = None
         self.domain_name: Optional[str] = None
         self.files: List[str] = []
-        self.tile_url_expiry_at: QDateTime = QDateTime()
+        self._tile_url_expiry_at: Optional[QDateTime] = None
+        self._tile_url_expiry_at_seconds: Optional[int] = None
+
+    @staticmethod
+    def _seconds_to_datetime(seconds: Optional[int]) -> QDateTime:
+        """
+        Converts seconds since epoch to a QDateTime
+        """
+        if seconds is None:
+            return QDateTime()
+        return QDateTime.fromSecsSinceEpoch(seconds)
+
+    @property
+    def metadata(self) -> dict:
+        """
+        Returns the listing's metadata
+        """
+        if self._metadata is None:
+            self._metadata = json.loads(self._metadata_json) if self._metadata_json else {}
+            self._metadata_json = None
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata: dict):
+        """
+        Sets the listing's metadata
+        """
+        self._metadata = metadata
+        self._metadata_json = None
+
+    @property
+    def geometry(self) -> Optional[QgsGeometry]:
+        """
+        Returns the listing's footprint geometry, in EPSG:4326
+        """
+        if self._geometry_wkt is not None:
+            self._geometry = QgsGeometry.fromWkt(self._geometry_wkt)
+            self._geometry_wkt = None
+        return self._geometry
+
+    @geometry.setter
+    def geometry(self, geometry: Optional[QgsGeometry]):
+        """
+        Sets the listing's footprint geometry, in EPSG:4326
+        """
+        self._geometry = geometry
+        self._geometry_wkt = None
+
+    def has_geometry(self) -> bool:
+        """
+        Returns True if the listing has a valid (non-null) footprint geometry.
+
+        This requires the geometry to be parsed, so that footprints with
+        invalid WKT are treated as missing.
+        """
+        geometry = self.geometry
+        return geometry is not None and not geometry.isNull()
+
+    @property
+    def created_at(self) -> QDateTime:
+        """
+        Returns the listing's creation date time
+        """
+        if self._created_at is None:
+            self._created_at = Listing._seconds_to_datetime(self._created_at_seconds)
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, created_at: QDateTime):
+        """
+        Sets the listing's creation date time
+        """
+        self._created_at = created_at
+
+    @property
+    def updated_at(self) -> QDateTime:
+        """
+        Returns the listing's last updated date time
+        """
+        if self._updated_at is None:
+            self._updated_at = Listing._seconds_to_datetime(self._updated_at_seconds)
+        return self._updated_at
+
+    @updated_at.setter
+    def updated_at(self, updated_at: QDateTime):
+        """
+        Sets the listing's last updated date time
+        """
+        self._updated_at = updated_at
+
+    @property
+    def tile_url_expiry_at(self) -> QDateTime:
+        """
+        Returns the date time at which the listing's tile URL expires
+        """
+        if self._tile_url_expiry_at is None:
+            self._tile_url_expiry_at = Listing._seconds_to_datetime(
+                self._tile_url_expiry_at_seconds)
+        return self._tile_url_expiry_at
+
+    @tile_url_expiry_at.setter
+    def tile_url_expiry_at(self, expiry: QDateTime):
+        """
+        Sets the date time at which the listing's tile URL expires
+        """
+        self._tile_url_expiry_at = expiry
 
     def __repr__(self):
         return f'<Listing: "{self.title}">'
@@ -348,9 +503,7 @@ class Listing:
         """
         res = Listing()
         res.owner = input_json.get('owner')
-        metadata_json = input_json.get('metadata')
-        if metadata_json:
-            res.metadata = json.loads(metadata_json)
+        res._metadata_json = input_json.get('metadata')
         res.preview_url = input_json.get('previewUrl')
         res.description = input_json.get('description')
         min_zoom = input_json.get('minZoom')
@@ -370,7 +523,7 @@ class Listing:
         res.tags = input_json.get('tags', [])
         created_at_seconds = input_json.get('createdAt')
         if created_at_seconds is not None:
-            res.created_at = QDateTime.fromSecsSinceEpoch(int(created_at_seconds))
+            res._created_at_seconds = int(created_at_seconds)
         total_comments = input_json.get('totalComments')
         if total_comments is not None:
             res.total_comments = int(total_comments)
@@ -387,7 +540,7 @@ class Listing:
             res.total_likes = int(total_likes)
         wkt = input_json.get('geometryWKT')
         if wkt:
-            res.geometry = QgsGeometry.fromWkt(wkt)
+            res._geometry_wkt = wkt
 
         res.tile_url = input_json.get('tileUrl')
         res.server_url = input_json.get('serverUrl')
@@ -399,13 +552,13 @@ class Listing:
 
         updated_at_seconds = input_json.get('updatedAt')
         if updated_at_seconds is not None:
-            res.updated_at = QDateTime.fromSecsSinceEpoch(int(updated_at_seconds))
+            res._updated_at_seconds = int(updated_at_seconds)
 
         res.domain_name = input_json.get('domainName')
 
         tile_url_expiry = input_json.get('tileUrlExpiryAt')
         if tile_url_expiry is not None:
-            res.tile_url_expiry_at = QDateTime.fromSecsSinceEpoch(int(tile_url_expiry))
+            res._tile_url_expiry_at_seconds = int(tile_url_expiry)
 
         return res
 
@@ -476,6 +629,9 @@ class ApiClient(QObject):
     LOGIN_ENDPOINT = 'user/login'
     UPLOAD_ENDPOINT = 'listings/upload'
 
+    # time for which fetched listings are reused by fetch_listing
+    LISTING_MEMO_TTL_SECONDS = 60
+
     error_occurred = pyqtSignal(str)
     login_error_occurred = pyqtSignal(str)
     fetched_token = pyqtSignal()
@@ -491,6 +647,14 @@ class ApiClient(QObject):
 
         self.login_reply: Optional[QNetworkReply] = None
 
+        self.listings_cache = ListingsCache()
+
+        # in-flight listing fetches and their waiting callbacks, by (listing id, domain)
+        self._listing_replies: Dict[Tuple[int, str], QNetworkReply] = {}
+        self._listing_callbacks: Dict[Tuple[int, str], List[Callable]] = defaultdict(list)
+        # recently fetched listings, as (fetch time, listing), by (listing id, domain)
+        self._listing_memo: Dict[Tuple[int, str], Tuple[float, Listing]] = {}
+
     def login(self, username: str, password: str, domain: str = 'soar.earth'):
         """
         Logins and authorizes a user
@@ -555,6 +719,10 @@ class ApiClient(QObject):
 
         The returned network request must be retrieved via QgsNetworkAccessManager,
         and the reply parsed by parse_listings_reply
+
+        If a (possibly stale) cached response exists for the query, the request
+        will be made conditional so that the server can confirm that the cached
+        response is still valid.
         """
         params = query.to_query_parameters()
 
@@ -565,8 +733,49 @@ class ApiClient(QObject):
             }
         network_request = self._build_request(self.LISTINGS_ENDPOINT, headers, params)
 
+        cache_key = ListingsCache.cache_key(params, domain)
+        network_request.setAttribute(QNetworkRequest.Attribute.User, cache_key)
+
+        cache_entry = self.listings_cache.entry(cache_key)
+        if cache_entry is not None:
+            if cache_entry.etag:
+                network_request.setRawHeader(b'If-None-Match', cache_entry.etag.encode())
+            if cache_entry.last_modified:
+                network_request.setRawHeader(b'If-Modified-Since',
+                                             cache_entry.last_modified.encode())
+
         return network_request
 
+    def cached_listings(self,
+                        query: ListingQuery,
+                        domain: str = 'soar.earth',
+                        allow_stale: bool = False) -> Optional[List[Listing]]:
+        """
+        Returns the listings for a query from the local cache, if a fresh
+        response is available.
+
+        If allow_stale is True then an expired cached response will also be
+        returned, e.g. for display while fresh results are being retrieved.
+
+        Returns None if no suitable cached response exists, in which case the
+        listings should be retrieved via request_listings.
+        """
+        cache_key = ListingsCache.cache_key(query.to_query_parameters(), domain)
+        if allow_stale:
+            body = self.listings_cache.body(cache_key)
+        else:
+            body = self.listings_cache.fresh_body(cache_key)
+        if body is None:
+            return None
+
+        if not allow_stale:
+            NETWORK_METRICS.record_cache_hit(self.LISTINGS_ENDPOINT)
+
+        try:
+            return ApiClient._parse_listings_json(body)
+        except (ValueError, KeyError):
+            return None
+
     def request_listing(self,
                         listing_id: int,
                         domain: str = 'soar.earth', ) -> QNetworkRequest:
@@ -583,6 +792,63 @@ class ApiClient(QObject):
 
         return network_request
 
+    def fetch_listing(self,
+                      listing_id: int,
+                      callback: Callable[[Optional[Listing]], None],
+                      domain: str = 'soar.earth'):
+        """
+        Fetches a fully-populated listing (async), calling callback with the
+        listing (or None if the fetch failed) when complete.
+
+        Concurrent fetches for the same listing share a single network request,
+        and recently fetched listings are reused without contacting the server.
+        In this case the callback will be called immediately.
+        """
+        key = (int(listing_id), domain or '')
+
+        memo = self._listing_memo.get(key)
+        if memo is not None:
+            fetched_at, listing = memo
+            if time.time() - fetched_at < self.LISTING_MEMO_TTL_SECONDS:
+                NETWORK_METRICS.record_cache_hit(f'{self.LISTINGS_ENDPOINT}/{listing_id}')
+                callback(listing)
+                return
+
+            del self._listing_memo[key]
+
+        self._listing_callbacks[key].append(callback)
+        if key in self._listing_replies:
+            # already being fetched
+            return
+
+        request = self.request_listing(listing_id, domain)
+        reply = QgsNetworkAccessManager.instance().get(request)
+        self._listing_replies[key] = reply
+        reply.finished.connect(partial(self._fetch_listing_finished, key, reply))
+
+    def _fetch_listing_finished(self, key: Tuple[int, str], reply: QNetworkReply):
+        """
+        Called when a listing fetch has finished
+        """
+        if sip.isdeleted(self):
+            return
+
+        if self._listing_replies.get(key) != reply:
+            return
+
+        del self._listing_replies[key]
+        callbacks = self._listing_callbacks.pop(key, [])
+
+        listing = self.parse_listing_reply(reply)
+        if listing is not None:
+            now = time.time()
+            self._listing_memo = {k: v for k, v in self._listing_memo.items()
+                                  if now - v[0] < self.LISTING_MEMO_TTL_SECONDS}
+            self._listing_memo[key] = (now, listing)
+
+        for callback in callbacks:
+            callback(listing)
+
     def parse_listings_reply(self, reply: QNetworkReply) -> List[Listing]:
         """
         Parse a listings reply and return as a list of Listings objects
@@ -597,9 +863,57 @@ class ApiClient(QObject):
             self.error_occurred.emit(reply.errorString())
             return []
 
-        listings_json = json.loads(reply.readAll().data().decode())['listings']
+        cache_key = reply.request().attribute(QNetworkRequest.Attribute.User)
+        status = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if status == 304:
+            # cached response is still valid
+            body = self.listings_cache.body(cache_key) if cache_key else None
+            if body is None:
+                # cached response was evicted while the request was in flight
+                return []
+
+            self.listings_cache.mark_revalidated(cache_key)
+            return ApiClient._parse_listings_json(body)
+
+        body = reply.readAll().data()
+        if cache_key:
+            self.listings_cache.store(
+                cache_key,
+                body,
+                etag=ApiClient.raw_header(reply, b'ETag'),
+                last_modified=ApiClient.raw_header(reply, b'Last-Modified')
+            )
+
+        return ApiClient._parse_listings_json(body)
+
+    @staticmethod
+    def _parse_listings_json(body: bytes) -> List[Listing]:
+        """
+        Parses a listings response body to a list of Listing objects
+        """
+        listings_json = json.loads(body.decode())['listings']
         return [Listing.from_json(listing) for listing in listings_json]
 
+    @staticmethod
+    def raw_header(reply: QNetworkReply, header: bytes) -> Optional[str]:
+        """
+        Returns a raw header value from a reply, if set
+        """
+        if not reply.hasRawHeader(header):
+            return None
+        return reply.rawHeader(header).data().decode()
+
+    def stream_listings_reply(self, reply: QNetworkReply) -> 'ListingsReplyStream':
+        """
+        Incrementally parses a listings reply as data arrives from the network.
+
+        The returned stream emits each Listing as soon as it has been completely
+        received, followed by the finished signal once the reply is complete.
+        """
+        from .listings_stream import ListingsReplyStream  # pylint: disable=import-outside-toplevel
+
+        return ListingsReplyStream(self, reply, parent=reply)
+
     def parse_listing_reply(self, reply: QNetworkReply) -> Optional[Listing]:
         """
         Parse a listing reply and return as a fully-populated Listing object
@@ -721,6 +1035,7 @@ class ApiClient(QObject):
             url.setQuery(ApiClient._to_url_query(params))
 
         network_request = QNetworkRequest(url)
+        NETWORK_METRICS.tag_request(network_request, endpoint)
 
         combined_headers = self.headers
         if headers:
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""Map export cost estimation
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import heapq
+from functools import partial
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple
+)
+
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QElapsedTimer,
+    QObject,
+    QSize,
+    QThread,
+    pyqtSignal
+)
+from qgis.core import (
+    QgsMapLayer,
+    QgsMapRendererSequentialJob,
+    QgsMapSettings,
+    QgsSettings
+)
+
+from .map_exporter import MapExportSettings
+from .tiled_renderer import TiledMapRenderer
+
+# exports predicted to use more memory than this are rendered in smaller tiles
+DEFAULT_MAX_EXPORT_MEMORY_MB = 2048
+# exports predicted to take longer than these times (in seconds) are warned about
+DEFAULT_WARN_RENDER_TIME = 600
+DEFAULT_WARN_UPLOAD_TIME = 600
+# assumed upload bandwidth, until an upload has been measured
+DEFAULT_UPLOAD_BANDWIDTH_MBPS = 10
+
+# tile sizes are never reduced below this size
+MIN_TILE_SIZE = 256
+
+
+class LayerRenderCost:
+    """
+    The sampled cost of rendering a map layer, as a fixed time per render job
+    and a time per rendered pixel
+    """
+
+    __slots__ = ('fixed_seconds', 'seconds_per_pixel')
+
+    def __init__(self, fixed_seconds: float = 0, seconds_per_pixel: float = 0):
+        self.fixed_seconds = fixed_seconds
+        self.seconds_per_pixel = seconds_per_pixel
+
+    def render_time(self, pixels: int) -> float:
+        """
+        Returns the estimated time in seconds to render the layer over an
+        area of pixels
+        """
+        return self.fixed_seconds + self.seconds_per_pixel * pixels
+
+
+class ExportEstimate:  # pylint: disable=too-few-public-methods
+    """
+    Estimated costs for a map export
+    """
+
+    def __init__(self):
+        self.tile_size: int = 0
+        self.tile_count: int = 0
+        self.peak_memory: int = 0
+        self.render_time: float = 0
+        self.file_size: int = 0
+        self.upload_time: float = 0
+        # True if the tile size was reduced to limit memory use
+        self.tile_size_reduced: bool = False
+        self.warnings: List[str] = []
+
+
+class ExportEstimator(QObject):
+    """
+    Estimates the memory use, render time, output size and upload time for
+    map exports.
+
+    Render costs are sampled per layer via low resolution trial renders of
+    the export map settings, using a lowered DPI so that the trial renders
+    are made at the same map scale as the full export.
+    """
+
+    # maximum dimensions of the trial renders, in pixels
+    TRIAL_SIZES = (128, 256)
+
+    # emitted when the layer render costs have been sampled
+    sampling_finished = pyqtSignal()
+
+    def __init__(self, map_settings: QgsMapSettings, parent=None):
+        super().__init__(parent)
+        self.map_settings = map_settings
+        # sampled render costs, by layer id
+        self.layer_costs: Dict[str, LayerRenderCost] = {}
+
+        # remaining trial renders, as the layer, maximum dimension and
+        # whether the render is timed
+        self._pending_trials: List[Tuple[QgsMapLayer, int, bool]] = []
+        # timed trial render pixel counts and durations, by layer id
+        self._samples: Dict[str, List[Tuple[int, float]]] = {}
+        self._job: Optional[QgsMapRendererSequentialJob] = None
+        # jobs are kept alive until finished, including canceled jobs
+        self._jobs: Set[QgsMapRendererSequentialJob] = set()
+        self._timer = QElapsedTimer()
+
+    @staticmethod
+    def max_memory() -> int:
+        """
+        Returns the maximum memory use (in bytes) for exports before tiles are reduced
+        """
+        return QgsSettings().value('soar/export_max_memory_mb',
+                                   DEFAULT_MAX_EXPORT_MEMORY_MB, int) * 1024 * 1024
+
+    @staticmethod
+    def upload_bandwidth() -> float:
+        """
+        Returns the upload bandwidth, in bytes per second
+        """
+        return QgsSettings().value('soar/export_upload_bandwidth_mbps',
+                                   DEFAULT_UPLOAD_BANDWIDTH_MBPS, float) * 1000000 / 8
+
+    @staticmethod
+    def set_upload_bandwidth(bytes_per_second: float):
+        """
+        Stores a measured upload bandwidth, in bytes per second
+        """
+        QgsSettings().setValue('soar/export_upload_bandwidth_mbps',
+                               bytes_per_second * 8 / 1000000)
+
+    def trial_map_settings(self, max_dimension: int) -> QgsMapSettings:
+        """
+        Returns map settings for a trial render with the specified maximum
+        dimension, at the same scale as the full export
+        """
+        size = self.map_settings.outputSize()
+        factor = min(1, max_dimension / max(size.width(), size.height(), 1))
+
+        trial_settings = QgsMapSettings(self.map_settings)
+        trial_settings.setOutputSize(QSize(max(1, round(size.width() * factor)),
+                                           max(1, round(size.height() * factor))))
+        trial_settings.setOutputDpi(self.map_settings.outputDpi() * factor)
+        return trial_settings
+
+    def sample(self):
+        """
+        Starts sampling the render cost for each layer in the map, by timing trial renders.
+
+        The trial renders run in the background, one at a time, and
+        sampling_finished is emitted when they are complete. Each layer is
+        rendered once before the timed renders, so that all timed renders
+        are made against the same (warm) provider caches.
+        """
+        self.cancel()
+        self.layer_costs = {}
+        self._samples = {}
+        for layer in self.map_settings.layers():
+            self._pending_trials.append((layer, self.TRIAL_SIZES[0], False))
+            self._pending_trials.extend((layer, max_dimension, True)
+                                        for max_dimension in self.TRIAL_SIZES)
+
+        self._start_next_trial()
+
+    def is_sampling(self) -> bool:
+        """
+        Returns True if trial renders are in progress
+        """
+        return self._job is not None
+
+    def cancel(self):
+        """
+        Cancels any in progress sampling, without blocking
+        """
+        self._pending_trials = []
+        job = self._job
+        self._job = None
+        if job is not None:
+            job.cancelWithoutBlocking()
+
+    def reset(self):
+        """
+        Cancels any in progress sampling, and discards the sampled render costs
+        """
+        self.cancel()
+        self.layer_costs = {}
+
+    def _start_next_trial(self):
+        """
+        Starts the next pending trial render
+        """
+        if not self._pending_trials:
+            self._job = None
+            for layer_id, samples in self._samples.items():
+                self.layer_costs[layer_id] = self._fit_cost(samples)
+            self.sampling_finished.emit()
+            return
+
+        layer, max_dimension, timed = self._pending_trials.pop(0)
+        trial_settings = self.trial_map_settings(max_dimension)
+        trial_settings.setLayers([layer])
+        size = trial_settings.outputSize()
+
+        self._job = QgsMapRendererSequentialJob(trial_settings)
+        self._jobs.add(self._job)
+        self._job.finished.connect(
+            partial(self._trial_finished, self._job, layer.id(),
+                    size.width() * size.height(), timed))
+        self._timer.start()
+        self._job.start()
+
+    def _trial_finished(self, job: QgsMapRendererSequentialJob,
+                        layer_id: str, pixels: int, timed: bool):
+        """
+        Called when a trial render job is finished
+        """
+        self._jobs.discard(job)
+        if job is not self._job:
+            # canceled
+            return
+
+        if timed:
+            self._samples.setdefault(layer_id, []).append(
+                (pixels, self._timer.elapsed() / 1000))
+        self._start_next_trial()
+
+    @staticmethod
+    def _fit_cost(samples: List[Tuple[int, float]]) -> LayerRenderCost:
+        """
+        Fits a layer render cost to the pixel counts and durations of the
+        small and large trial renders
+        """
+        (small_pixels, small_time), (large_pixels, large_time) = samples
+        seconds_per_pixel = 0
+        if large_pixels > small_pixels:
+            seconds_per_pixel = max(0.0, (large_time - small_time) /
+                                    (large_pixels - small_pixels))
+        fixed_seconds = max(0.0, small_time - seconds_per_pixel * small_pixels)
+        return LayerRenderCost(fixed_seconds, seconds_per_pixel)
+
+    def is_sampled(self) -> bool:
+        """
+        Returns True if the layer render costs have been sampled
+        """
+        if self.is_sampling():
+            return False
+        return bool(self.layer_costs) or not self.map_settings.layers()
+
+    def estimate(self, settings: MapExportSettings) -> ExportEstimate:
+        """
+        Estimates the costs of an export.
+
+        If the predicted memory use exceeds the configured limit, the tile size
+        is reduced until it fits (down to MIN_TILE_SIZE).
+        """
+        estimate = ExportEstimate()
+        estimate.tile_size = settings.tile_size
+        if estimate.tile_size <= 0:
+            estimate.tile_size = max(settings.size.width(), settings.size.height())
+
+        max_parallel_jobs = max(1, settings.max_parallel_jobs)
+        max_memory = self.max_memory()
+        while True:
+            widths = self.render_sizes(settings.size.width(), estimate.tile_size)
+            heights = self.render_sizes(settings.size.height(), estimate.tile_size)
+            estimate.peak_memory = self._peak_memory(widths, heights, max_parallel_jobs)
+            if estimate.peak_memory <= max_memory or estimate.tile_size <= MIN_TILE_SIZE:
+                break
+            estimate.tile_size = max(MIN_TILE_SIZE, estimate.tile_size // 2)
+            estimate.tile_size_reduced = True
+
+        estimate.tile_count = len(widths) * len(heights)
+        estimate.render_time = self._render_time(widths, heights, max_parallel_jobs)
+        estimate.file_size = settings.estimated_file_size()
+        estimate.upload_time = estimate.file_size / self.upload_bandwidth()
+
+        if estimate.peak_memory > max_memory:
+            estimate.warnings.append(
+                self.tr('The export may use more memory than is available'))
+        if estimate.render_time > QgsSettings().value('soar/export_warn_render_time',
+                                                      DEFAULT_WARN_RENDER_TIME, float):
+            estimate.warnings.append(self.tr('The export may take a long time to render'))
+        if estimate.upload_time > QgsSettings().value('soar/export_warn_upload_time',
+                                                      DEFAULT_WARN_UPLOAD_TIME, float):
+            estimate.warnings.append(self.tr('The export may take a long time to upload'))
+
+        return estimate
+
+    @staticmethod
+    def render_sizes(size: int, tile_size: int) -> List[int]:
+        """
+        Returns the rendered sizes of the tiles along one dimension of a map,
+        including the margins rendered around each tile (matching
+        TiledMapRenderer.render_rect()).
+
+        The render areas of the tiles are the products of the rendered sizes
+        along each dimension.
+        """
+        if tile_size <= 0:
+            tile_size = size
+        margin = TiledMapRenderer.LABEL_MARGIN
+        return [min(start + tile_size + margin, size) - max(start - margin, 0)
+                for start in range(0, size, tile_size)]
+
+    def _peak_memory(self, widths: List[int], heights: List[int], max_parallel_jobs: int) -> int:
+        """
+        Returns the predicted peak memory use for rendering, in bytes
+        """
+        # parallel render jobs use an image per layer, plus a labeling
+        # image and the final composed image
+        images_per_job = len(self.map_settings.layers()) + 2
+        # the largest render areas are all formed from the largest sizes in each dimension
+        largest_areas = sorted((width * height
+                                for width in heapq.nlargest(max_parallel_jobs, widths)
+                                for height in heapq.nlargest(max_parallel_jobs, heights)),
+                               reverse=True)
+        concurrent_pixels = sum(largest_areas[:max_parallel_jobs])
+        return concurrent_pixels * images_per_job * 4
+
+    def _render_time(self, widths: List[int], heights: List[int], max_parallel_jobs: int) -> float:
+        """
+        Returns the predicted time to render, in seconds
+        """
+        tile_count = len(widths) * len(heights)
+        total_area = sum(widths) * sum(heights)
+
+        total_time = 0
+        for cost in self.layer_costs.values():
+            total_time += cost.fixed_seconds * tile_count + cost.seconds_per_pixel * total_area
+
+        # tiles are rendered concurrently, with each layer in a tile rendered in parallel
+        parallelism = min(QThread.idealThreadCount(),
+                          max_parallel_jobs * max(1, len(self.layer_costs)))
+        return total_time / max(1, parallelism)
+
+    @staticmethod
+    def tr(string: str) -> str:
+        """
+        Translates a string
+        """
+        return QCoreApplication.translate('ExportEstimator', string)
+
+    @staticmethod
+    def format_duration(seconds: Optional[float]) -> str:
+        """
+        Formats an estimated duration for display
+        """
+        if seconds is None:
+            return '?'
+        if seconds < 60:
+            return ExportEstimator.tr('{} s').format(max(1, round(seconds)))
+        if seconds < 3600:
+            return ExportEstimator.tr('{} min').format(round(seconds / 60))
+        return ExportEstimator.tr('{:.1f} h').format(seconds / 3600)
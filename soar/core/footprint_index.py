@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Spatial index of listing footprints
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+from bisect import bisect_left
+from heapq import merge
+from typing import (
+    List,
+    Optional
+)
+
+from qgis.core import (
+    QgsGeometry,
+    QgsSpatialIndex
+)
+
+from .client import Listing
+
+
+class ListingFootprintIndex:
+    """
+    An in-memory spatial index over the footprints of fetched listings.
+
+    The index tracks the area of interest (in EPSG:4326) which was used to
+    fetch the listings, so that it can be determined whether a different area
+    of interest can be answered locally from the fetched listings.
+    """
+
+    def __init__(self, coverage: Optional[QgsGeometry] = None):
+        # a null coverage geometry indicates that the listings were not spatially filtered
+        self.coverage: Optional[QgsGeometry] = coverage \
+            if coverage is not None and not coverage.isEmpty() else None
+        self._listings: List[Listing] = []
+        self._index: Optional[QgsSpatialIndex] = None
+        self._indexed_count = 0
+        # positions of the indexed listings without footprints, in ascending order
+        self._no_geometry: List[int] = []
+        self._prepared_coverage = None
+
+    def __len__(self):
+        return len(self._listings)
+
+    def add_listings(self, listings: List[Listing]):
+        """
+        Adds listings to the index
+        """
+        self._listings.extend(listings)
+
+    def listings(self) -> List[Listing]:
+        """
+        Returns all listings in the index, in the order they were added
+        """
+        return self._listings
+
+    def covers(self, aoi: Optional[QgsGeometry]) -> bool:
+        """
+        Returns True if the area of interest is completely covered by the
+        area used to fetch the indexed listings
+        """
+        if self.coverage is None:
+            return True
+
+        if aoi is None or aoi.isEmpty():
+            return False
+
+        if self._prepared_coverage is None:
+            self._prepared_coverage = QgsGeometry.createGeometryEngine(self.coverage.constGet())
+            self._prepared_coverage.prepareGeometry()
+
+        return self._prepared_coverage.contains(aoi.constGet())
+
+    def intersecting(self, aoi: Optional[QgsGeometry], start: int = 0) -> List[Listing]:
+        """
+        Returns the indexed listings which intersect an area of interest (in EPSG:4326),
+        in the order they were added.
+
+        If start is specified, only listings added at or after this position will
+        be considered.
+
+        Listings without footprints are always included.
+        """
+        if aoi is None or aoi.isEmpty():
+            return self._listings[start:]
+
+        self._update_index()
+
+        candidates = sorted(idx for idx in self._index.intersects(aoi.boundingBox())
+                            if idx >= start)
+
+        engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+        engine.prepareGeometry()
+
+        matches = [idx for idx in candidates
+                   if engine.intersects(self._listings[idx].geometry.constGet())]
+        no_geometry = self._no_geometry[bisect_left(self._no_geometry, start):]
+
+        return [self._listings[idx] for idx in merge(matches, no_geometry)]
+
+    @staticmethod
+    def filter_listings(listings: List[Listing], aoi: QgsGeometry) -> List[Listing]:
+        """
+        Filters a list of listings to those which intersect an area of interest
+        (in EPSG:4326), without building an index.
+
+        Listings without footprints are always included.
+        """
+        engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+        engine.prepareGeometry()
+
+        return [listing for listing in listings
+                if not listing.has_geometry() or engine.intersects(listing.geometry.constGet())]
+
+    def _update_index(self):
+        """
+        Adds any new listings to the spatial index. The index is built lazily,
+        so that footprint geometries are only parsed when required.
+        """
+        if self._index is None:
+            self._index = QgsSpatialIndex()
+
+        for idx in range(self._indexed_count, len(self._listings)):
+            listing = self._listings[idx]
+            if listing.has_geometry():
+                self._index.addFeature(idx, listing.geometry.boundingBox())
+            else:
+                self._no_geometry.append(idx)
+
+        self._indexed_count = len(self._listings)
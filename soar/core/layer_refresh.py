@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Soar layer URI refresh scheduling
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+from functools import partial
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set
+)
+
+from qgis.PyQt import sip
+from qgis.PyQt.QtCore import (
+    Qt,
+    QObject,
+    pyqtSignal
+)
+from qgis.core import (
+    QgsProject,
+    QgsMapLayer,
+    QgsSettings
+)
+
+from .client import (
+    API_CLIENT,
+    Listing
+)
+from .network_metrics import NETWORK_METRICS
+
+
+class LayerRefreshScheduler(QObject):
+    """
+    Refreshes the tile URLs of Soar layers in bulk.
+
+    Layers are grouped by their listing ID so that each listing is only
+    fetched once, and listings are fetched through a bounded number of
+    concurrent requests, with listings for visible layers fetched first.
+    """
+
+    DEFAULT_MAX_CONCURRENT = 4
+
+    # emitted with the number of completed and total listings to refresh
+    progress_changed = pyqtSignal(int, int)
+    finished = pyqtSignal()
+
+    def __init__(self, project: QgsProject, parent=None):
+        super().__init__(parent)
+        self.project = project
+
+        self._queue: List[int] = []
+        self._active: Set[int] = set()
+        self._layers: Dict[int, List[QgsMapLayer]] = {}
+
+        self._completed = 0
+        self._total = 0
+        self._starting = False
+
+    @staticmethod
+    def max_concurrent() -> int:
+        """
+        Returns the maximum number of concurrent listing requests
+        """
+        return max(1, QgsSettings().value('soar/max_concurrent_layer_refreshes',
+                                          LayerRefreshScheduler.DEFAULT_MAX_CONCURRENT, int))
+
+    def is_active(self) -> bool:
+        """
+        Returns True if layers are currently being refreshed
+        """
+        return bool(self._queue or self._active)
+
+    def add_layers(self, layers: List[QgsMapLayer]):
+        """
+        Schedules a list of layers for refresh
+        """
+        for layer in layers:
+            listing_id = int(layer.customProperty('_soar_layer_id'))
+            if listing_id in self._layers:
+                if layer not in self._layers[listing_id]:
+                    self._layers[listing_id].append(layer)
+                continue
+
+            self._layers[listing_id] = [layer]
+            self._queue.append(listing_id)
+            self._total += 1
+
+        if not self._queue:
+            return
+
+        # visible layers are refreshed first
+        self._queue.sort(key=self._priority)
+        self.progress_changed.emit(self._completed, self._total)
+        self._start_next()
+
+    def cancel(self):
+        """
+        Cancels all queued refreshes. Requests which are already in progress
+        will still be completed.
+        """
+        for listing_id in self._queue:
+            del self._layers[listing_id]
+        self._total -= len(self._queue)
+        self._queue = []
+
+        if not self._active:
+            self._reset()
+
+    def _priority(self, listing_id: int) -> int:
+        """
+        Returns the refresh priority for a listing, with lower values
+        refreshed first
+        """
+        root = self.project.layerTreeRoot()
+        for layer in self._layers.get(listing_id, []):
+            if sip.isdeleted(layer):
+                continue
+            node = root.findLayer(layer.id())
+            if node is not None and node.isVisible():
+                return 0
+
+        return 1
+
+    def _start_next(self):
+        """
+        Starts queued listing requests, up to the concurrency limit
+        """
+        if self._starting:
+            return
+
+        self._starting = True
+        max_concurrent = self.max_concurrent()
+        while self._queue and len(self._active) < max_concurrent:
+            listing_id = self._queue.pop(0)
+            self._active.add(listing_id)
+            API_CLIENT.fetch_listing(listing_id, partial(self._listing_fetched, listing_id))
+        self._starting = False
+
+        if not self.is_active():
+            self._reset()
+
+    def _listing_fetched(self, listing_id: int, listing: Optional[Listing]):
+        """
+        Called when a listing has been fetched
+        """
+        if sip.isdeleted(self):
+            return
+
+        self._active.discard(listing_id)
+        layers = self._layers.pop(listing_id, [])
+        if listing is not None:
+            for layer in layers:
+                if not sip.isdeleted(layer):
+                    LayerRefreshScheduler.update_layer_uri(layer, listing)
+
+        self._completed += 1
+        self.progress_changed.emit(self._completed, self._total)
+
+        self._start_next()
+
+    def _reset(self):
+        """
+        Resets the scheduler after all refreshes have completed
+        """
+        had_work = self._total > 0
+        self._completed = 0
+        self._total = 0
+        if had_work:
+            self.finished.emit()
+
+    @staticmethod
+    def update_layer_uri(layer: QgsMapLayer, listing: Listing):
+        """
+        Updates a layer's URI using a freshly fetched listing
+        """
+        new_uri = listing.to_qgis_layer_source_string()
+        if not new_uri:
+            return
+
+        # we've overridden the layer's extent from its default
+        # This will be reset on the call to setDataSource, so we need to restore
+        # the existing extent
+        old_extent = layer.extent()
+        layer.setDataSource(new_uri, layer.name(), 'wms')
+        layer.setExtent(old_extent)
+        NETWORK_METRICS.register_layer(layer)
+
+        layer.setCustomProperty('_soar_layer_expiry',
+                                listing.tile_url_expiry_at.toString(Qt.DateFormat.ISODate))
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""Persistent listings response cache
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import hashlib
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Optional,
+    Dict
+)
+
+from qgis.PyQt.QtCore import QTimer
+from qgis.core import (
+    QgsApplication,
+    QgsSettings
+)
+
+
+class ListingsCacheEntry:
+    """
+    Metadata for a single cached listings response
+    """
+
+    def __init__(self, key: str):
+        self.key: str = key
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.stored_at: float = 0
+        self.accessed_at: float = 0
+        self.size: int = 0
+
+    def __repr__(self):
+        return f'<ListingsCacheEntry: "{self.key}">'
+
+    def to_json(self) -> dict:
+        """
+        Converts the entry to JSON
+        """
+        return {
+            'etag': self.etag,
+            'lastModified': self.last_modified,
+            'storedAt': self.stored_at,
+            'accessedAt': self.accessed_at,
+            'size': self.size
+        }
+
+    @staticmethod
+    def from_json(key: str, input_json: dict) -> 'ListingsCacheEntry':
+        """
+        Creates an entry from JSON
+        """
+        res = ListingsCacheEntry(key)
+        res.etag = input_json.get('etag')
+        res.last_modified = input_json.get('lastModified')
+        res.stored_at = float(input_json.get('storedAt', 0))
+        res.accessed_at = float(input_json.get('accessedAt', 0))
+        res.size = int(input_json.get('size', 0))
+        return res
+
+
+class ListingsCacheWriter:
+    """
+    Writes a response body into a ListingsCache incrementally, as it is
+    received.
+
+    The body is written to a temporary file, which only replaces the cached
+    response once commit() is called. If the body grows beyond the cache
+    size limit the write is abandoned.
+    """
+
+    def __init__(self, cache: 'ListingsCache', key: str):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        # unique per writer, so concurrent requests for a key don't collide
+        self._temp_path = cache.path() / f'{key}.{uuid.uuid4().hex}.partial'
+        self._file: Optional[BinaryIO] = None
+        try:
+            cache.path().mkdir(parents=True, exist_ok=True)
+            self._file = self._temp_path.open('wb')
+        except OSError:
+            self._file = None
+
+    def is_valid(self) -> bool:
+        """
+        Returns True if the body is still being written
+        """
+        return self._file is not None
+
+    def write(self, data: bytes):
+        """
+        Writes a chunk of the response body
+        """
+        if self._file is None:
+            return
+
+        self.size += len(data)
+        if self.size > self.cache.max_size():
+            self.discard()
+            return
+
+        try:
+            self._file.write(data)
+        except OSError:
+            self.discard()
+
+    def commit(self,
+               etag: Optional[str] = None,
+               last_modified: Optional[str] = None):
+        """
+        Completes the write, storing the body in the cache
+        """
+        if self._file is None:
+            return
+
+        try:
+            self._file.close()
+            self._file = None
+            self._temp_path.replace(self.cache._body_path(self.key))  # pylint: disable=protected-access
+        except OSError:
+            self.discard()
+            return
+
+        self.cache._add_entry(self.key, self.size, etag, last_modified)  # pylint: disable=protected-access
+
+    def discard(self):
+        """
+        Abandons the write, removing any partially written body
+        """
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+        try:
+            self._temp_path.unlink()
+        except OSError:
+            pass
+
+
+class ListingsCache:
+    """
+    A persistent, size limited on-disk cache of listings API responses.
+
+    Responses are keyed by the normalized query parameters and the request
+    subdomain. Entries younger than the cache TTL are considered fresh and can
+    be used without contacting the server, while stale entries can be
+    revalidated using their stored ETag/Last-Modified values. When the total
+    size of cached responses exceeds the byte budget the least recently
+    used entries are evicted.
+
+    Access times updated by cache reads are written to the index after a
+    delay (or on flush()), rather than rewriting the index on every read.
+    """
+
+    INDEX_FILE = 'index.json'
+    # delay before writing access time changes to the index
+    INDEX_WRITE_DELAY_MS = 5000
+
+    DEFAULT_TTL_SECONDS = 3600
+    DEFAULT_MAX_SIZE_BYTES = 50 * 1024 * 1024
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 ttl: Optional[int] = None,
+                 max_size: Optional[int] = None):
+        self._path: Optional[Path] = Path(path) if path else None
+        self._ttl: Optional[int] = ttl
+        self._max_size: Optional[int] = max_size
+        self._entries: Optional[Dict[str, ListingsCacheEntry]] = None
+        self._index_dirty = False
+        self._index_write_timer: Optional[QTimer] = None
+
+    @staticmethod
+    def cache_key(params: dict, domain: Optional[str] = None) -> str:
+        """
+        Returns the cache key for a set of query parameters and subdomain
+        """
+        normalized = json.dumps({
+            'params': {k: str(v) for k, v in params.items()},
+            'domain': domain or ''
+        }, sort_keys=True)
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    def path(self) -> Path:
+        """
+        Returns the directory used to store cached responses
+        """
+        if self._path is None:
+            self._path = Path(QgsApplication.qgisSettingsDirPath()) / 'cache' / 'soar' / 'listings'
+        return self._path
+
+    def ttl(self) -> int:
+        """
+        Returns the time (in seconds) for which cached responses are considered fresh
+        """
+        if self._ttl is not None:
+            return self._ttl
+        return QgsSettings().value('soar/listings_cache/ttl',
+                                   self.DEFAULT_TTL_SECONDS, int)
+
+    def set_ttl(self, ttl: int):
+        """
+        Sets the time (in seconds) for which cached responses are considered fresh
+        """
+        self._ttl = ttl
+
+    def max_size(self) -> int:
+        """
+        Returns the maximum size (in bytes) of all cached responses
+        """
+        if self._max_size is not None:
+            return self._max_size
+        return QgsSettings().value('soar/listings_cache/max_size',
+                                   self.DEFAULT_MAX_SIZE_BYTES, int)
+
+    def set_max_size(self, max_size: int):
+        """
+        Sets the maximum size (in bytes) of all cached responses.
+
+        Existing entries will be evicted if the new size is exceeded.
+        """
+        self._max_size = max_size
+        self._evict()
+        self._write_index()
+
+    def is_enabled(self) -> bool:
+        """
+        Returns True if the cache is enabled
+        """
+        return self.max_size() > 0
+
+    def entry(self, key: str) -> Optional[ListingsCacheEntry]:
+        """
+        Returns the cache entry for a key, if it exists
+        """
+        entry = self._index().get(key)
+        if entry is None or not self._body_path(key).exists():
+            return None
+        return entry
+
+    def is_fresh(self, entry: ListingsCacheEntry) -> bool:
+        """
+        Returns True if an entry is still within the cache TTL
+        """
+        return time.time() - entry.stored_at < self.ttl()
+
+    def body(self, key: str) -> Optional[bytes]:
+        """
+        Returns the cached response body for a key, and marks the
+        entry as recently used
+        """
+        entry = self.entry(key)
+        if entry is None:
+            return None
+
+        try:
+            data = self._body_path(key).read_bytes()
+        except OSError:
+            return None
+
+        entry.accessed_at = time.time()
+        self._mark_index_dirty()
+        return data
+
+    def fresh_body(self, key: str) -> Optional[bytes]:
+        """
+        Returns the cached response body for a key, only if the
+        entry is still fresh
+        """
+        entry = self.entry(key)
+        if entry is None or not self.is_fresh(entry):
+            return None
+        return self.body(key)
+
+    def store(self,
+              key: str,
+              body: bytes,
+              etag: Optional[str] = None,
+              last_modified: Optional[str] = None):
+        """
+        Stores a response body in the cache
+        """
+        if not self.is_enabled() or len(body) > self.max_size():
+            return
+
+        try:
+            self.path().mkdir(parents=True, exist_ok=True)
+            self._body_path(key).write_bytes(body)
+        except OSError:
+            return
+
+        self._add_entry(key, len(body), etag, last_modified)
+
+    def writer(self, key: str) -> Optional[ListingsCacheWriter]:
+        """
+        Returns a writer for storing a response body incrementally, or None
+        if the cache is disabled
+        """
+        if not self.is_enabled():
+            return None
+
+        writer = ListingsCacheWriter(self, key)
+        return writer if writer.is_valid() else None
+
+    def _add_entry(self,
+                   key: str,
+                   size: int,
+                   etag: Optional[str],
+                   last_modified: Optional[str]):
+        """
+        Adds the index entry for a stored response body
+        """
+        now = time.time()
+        entry = ListingsCacheEntry(key)
+        entry.etag = etag
+        entry.last_modified = last_modified
+        entry.stored_at = now
+        entry.accessed_at = now
+        entry.size = size
+        self._index()[key] = entry
+
+        self._evict()
+        self._write_index()
+
+    def mark_revalidated(self, key: str):
+        """
+        Marks an entry as revalidated against the server, resetting
+        its age
+        """
+        entry = self.entry(key)
+        if entry is None:
+            return
+
+        now = time.time()
+        entry.stored_at = now
+        entry.accessed_at = now
+        self._write_index()
+
+    def total_size(self) -> int:
+        """
+        Returns the total size (in bytes) of all cached responses
+        """
+        return sum(e.size for e in self._index().values())
+
+    def clear(self):
+        """
+        Removes all entries from the cache
+        """
+        for key in list(self._index().keys()):
+            self._remove(key)
+        self._write_index()
+
+    def flush(self):
+        """
+        Writes any pending index changes to disk
+        """
+        if self._index_dirty:
+            self._write_index()
+
+    def _body_path(self, key: str) -> Path:
+        """
+        Returns the file path for a cached response body
+        """
+        return self.path() / f'{key}.json'
+
+    def _index(self) -> Dict[str, ListingsCacheEntry]:
+        """
+        Returns the cache index, loading it from disk if required
+        """
+        if self._entries is None:
+            self._entries = {}
+            try:
+                index_json = json.loads(
+                    (self.path() / self.INDEX_FILE).read_text(encoding='utf8'))
+                for key, entry_json in index_json.items():
+                    self._entries[key] = ListingsCacheEntry.from_json(key, entry_json)
+            except (OSError, ValueError):
+                pass
+
+        return self._entries
+
+    def _mark_index_dirty(self):
+        """
+        Marks the index as changed, scheduling a delayed write to disk
+        """
+        self._index_dirty = True
+        if self._index_write_timer is None:
+            self._index_write_timer = QTimer()
+            self._index_write_timer.setSingleShot(True)
+            self._index_write_timer.setInterval(self.INDEX_WRITE_DELAY_MS)
+            self._index_write_timer.timeout.connect(self.flush)
+        if not self._index_write_timer.isActive():
+            self._index_write_timer.start()
+
+    def _write_index(self):
+        """
+        Writes the cache index to disk
+        """
+        self._index_dirty = False
+        if self._index_write_timer is not None:
+            self._index_write_timer.stop()
+
+        index_json = {key: entry.to_json() for key, entry in self._index().items()}
+        try:
+            self.path().mkdir(parents=True, exist_ok=True)
+            (self.path() / self.INDEX_FILE).write_text(json.dumps(index_json),
+                                                       encoding='utf8')
+        except OSError:
+            pass
+
+    def _remove(self, key: str):
+        """
+        Removes an entry from the cache
+        """
+        self._index().pop(key, None)
+        try:
+            self._body_path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict(self):
+        """
+        Evicts least recently used entries until the cache fits
+        within the byte budget
+        """
+        max_size = self.max_size()
+        total_size = self.total_size()
+        if total_size <= max_size:
+            return
+
+        for entry in sorted(self._index().values(), key=lambda e: e.accessed_at):
+            if total_size <= max_size:
+                break
+            total_size -= entry.size
+            self._remove(entry.key)
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""Incremental listings reply parsing
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import codecs
+import json
+from enum import Enum
+from typing import (
+    Optional,
+    List
+)
+
+from qgis.PyQt import sip
+from qgis.PyQt.QtCore import (
+    pyqtSignal,
+    QObject
+)
+from qgis.PyQt.QtNetwork import (
+    QNetworkRequest,
+    QNetworkReply
+)
+
+from .client import (
+    ApiClient,
+    Listing
+)
+from .listings_cache import ListingsCacheWriter
+
+
+class _ParserState(Enum):
+    """
+    Internal states for ListingsStreamParser
+    """
+    Start = 0
+    Key = 1
+    Colon = 2
+    Value = 3
+    ArrayStart = 4
+    Items = 5
+    Done = 6
+
+
+class ListingsStreamParser:
+    """
+    Incrementally parses a listings API response body.
+
+    Chunks of the response are passed to feed() as they are received, and
+    the JSON objects from the top-level "listings" array are returned as soon
+    as each object has been completely received.
+    """
+
+    LISTINGS_KEY = 'listings'
+
+    # consumed buffer content is discarded once it exceeds this length
+    COMPACT_THRESHOLD = 64 * 1024
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._state = _ParserState.Start
+        self._current_key: Optional[str] = None
+        self._finished = False
+
+    def is_done(self) -> bool:
+        """
+        Returns True if the complete response has been parsed
+        """
+        return self._state == _ParserState.Done
+
+    def feed(self, data: bytes) -> List[dict]:
+        """
+        Feeds a chunk of the response to the parser, returning any listing
+        objects which have been completed by the chunk
+        """
+        self._buffer += self._text_decoder.decode(data)
+        return self._parse()
+
+    def finish(self) -> List[dict]:
+        """
+        Flushes the parser after the last chunk has been received, returning
+        any remaining listing objects.
+
+        :raises ValueError: if the response was not valid or complete
+        """
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        self._finished = True
+        res = self._parse()
+        if self._state != _ParserState.Done:
+            raise ValueError('Incomplete listings response')
+        return res
+
+    def _skip_whitespace(self, extra: str = '') -> bool:
+        """
+        Skips whitespace (and any extra characters), returning True if
+        more content is available in the buffer
+        """
+        buffer = self._buffer
+        pos = self._pos
+        length = len(buffer)
+        while pos < length and (buffer[pos].isspace() or buffer[pos] in extra):
+            pos += 1
+        self._pos = pos
+        return pos < length
+
+    def _decode_value(self):
+        """
+        Attempts to decode a complete JSON value from the current position.
+
+        Returns a tuple of (success, value).
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if self._finished:
+                raise
+            return False, None
+
+        if end >= len(self._buffer) and not self._finished and self._buffer[end - 1].isdigit():
+            # a number at the end of the buffer may still be incomplete
+            return False, None
+
+        self._pos = end
+        return True, value
+
+    def _expect(self, char: str):
+        """
+        Consumes an expected character from the buffer
+        """
+        if self._buffer[self._pos] != char:
+            raise ValueError(f'Expected "{char}" at position {self._pos}')
+        self._pos += 1
+
+    def _parse(self) -> List[dict]:  # pylint: disable=too-many-branches
+        """
+        Parses as much of the buffered content as possible
+        """
+        res = []
+        while self._state != _ParserState.Done:
+            if self._state == _ParserState.Start:
+                if not self._skip_whitespace():
+                    break
+                self._expect('{')
+                self._state = _ParserState.Key
+
+            elif self._state == _ParserState.Key:
+                if not self._skip_whitespace(','):
+                    break
+                if self._buffer[self._pos] == '}':
+                    self._pos += 1
+                    self._state = _ParserState.Done
+                    break
+                ok, key = self._decode_value()
+                if not ok:
+                    break
+                self._current_key = key
+                self._state = _ParserState.Colon
+
+            elif self._state == _ParserState.Colon:
+                if not self._skip_whitespace():
+                    break
+                self._expect(':')
+                if self._current_key == self.LISTINGS_KEY:
+                    self._state = _ParserState.ArrayStart
+                else:
+                    self._state = _ParserState.Value
+
+            elif self._state == _ParserState.Value:
+                if not self._skip_whitespace():
+                    break
+                ok, _ = self._decode_value()
+                if not ok:
+                    break
+                self._state = _ParserState.Key
+
+            elif self._state == _ParserState.ArrayStart:
+                if not self._skip_whitespace():
+                    break
+                self._expect('[')
+                self._state = _ParserState.Items
+
+            elif self._state == _ParserState.Items:
+                if not self._skip_whitespace(','):
+                    break
+                if self._buffer[self._pos] == ']':
+                    self._pos += 1
+                    self._state = _ParserState.Key
+                    continue
+                ok, value = self._decode_value()
+                if not ok:
+                    break
+                res.append(value)
+
+        if self._pos > self.COMPACT_THRESHOLD:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+
+        return res
+
+
+class ListingsReplyStream(QObject):
+    """
+    Incrementally parses a listings reply as data is received from the network,
+    emitting each Listing as soon as it has been completely received
+    """
+
+    listing_received = pyqtSignal(Listing)
+    finished = pyqtSignal()
+
+    def __init__(self, client: ApiClient, reply: QNetworkReply, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self.reply = reply
+        self._parser = ListingsStreamParser()
+
+        # the body is written to the cache as it is received, instead of
+        # being held in memory until the reply has finished
+        cache_key = reply.request().attribute(QNetworkRequest.Attribute.User)
+        self._cache_writer: Optional[ListingsCacheWriter] = \
+            client.listings_cache.writer(cache_key) if cache_key else None
+
+        self.reply.readyRead.connect(self._ready_read)
+        self.reply.finished.connect(self._reply_finished)
+
+    def _ready_read(self):
+        """
+        Called when new data is available from the reply
+        """
+        if sip.isdeleted(self) or sip.isdeleted(self.reply):
+            return
+
+        if self.reply.error() != QNetworkReply.NetworkError.NoError:
+            return
+
+        status = self.reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if status is not None and not 200 <= status < 300:
+            return
+
+        data = self.reply.readAll().data()
+        if not data:
+            return
+
+        if self._cache_writer is not None:
+            self._cache_writer.write(data)
+        try:
+            listings_json = self._parser.feed(data)
+        except ValueError:
+            # malformed response, will be reported on finish
+            return
+
+        for listing_json in listings_json:
+            self.listing_received.emit(Listing.from_json(listing_json))
+
+    def _reply_finished(self):
+        """
+        Called when the reply has finished
+        """
+        if sip.isdeleted(self):
+            return
+
+        if sip.isdeleted(self.reply):
+            self._discard_cache_writer()
+            self.finished.emit()
+            return
+
+        reply = self.reply
+
+        if reply.error() == QNetworkReply.NetworkError.OperationCanceledError:
+            self._discard_cache_writer()
+            self.finished.emit()
+            return
+
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            self._discard_cache_writer()
+            self.client.error_occurred.emit(reply.errorString())
+            self.finished.emit()
+            return
+
+        status = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if status == 304:
+            self._discard_cache_writer()
+            # cached response is still valid
+            for listing in self.client.parse_listings_reply(reply):
+                self.listing_received.emit(listing)
+            self.finished.emit()
+            return
+
+        # pick up anything which arrived without a readyRead signal
+        self._ready_read()
+
+        try:
+            listings_json = self._parser.finish()
+        except ValueError:
+            self._discard_cache_writer()
+            self.client.error_occurred.emit(self.tr('Invalid listings response'))
+            self.finished.emit()
+            return
+
+        if self._cache_writer is not None:
+            self._cache_writer.commit(
+                etag=ApiClient.raw_header(reply, b'ETag'),
+                last_modified=ApiClient.raw_header(reply, b'Last-Modified')
+            )
+            self._cache_writer = None
+
+        for listing_json in listings_json:
+            self.listing_received.emit(Listing.from_json(listing_json))
+
+        self.finished.emit()
+
+    def _discard_cache_writer(self):
+        """
+        Abandons writing the response body to the cache
+        """
+        if self._cache_writer is not None:
+            self._cache_writer.discard()
+            self._cache_writer = None
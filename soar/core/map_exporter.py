@@ -14,13 +14,21 @@ __copyright__ = 'Copyright 2022, North Road'
 __revision__ = '$Format:%H$'
 
 import tempfile
+from enum import Enum
 from pathlib import Path
-from typing import List, Optional
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
 
 from osgeo import gdal
 from qgis.PyQt.QtCore import (
     QSize,
+    QElapsedTimer,
     QEventLoop,
+    QThread,
     pyqtSignal
 )
 from qgis.PyQt.QtNetwork import QNetworkReply
@@ -32,15 +40,92 @@ from qgis.core import (
     QgsCoordinateReferenceSystem,
     QgsExpressionContext,
     QgsExpressionContextUtils,
-    QgsMapRendererTask,
+    QgsFeedback,
     QgsTask,
     QgsMapSettingsUtils,
-    QgsMapDecoration
+    QgsMapDecoration,
+    QgsSettings
 )
 from qgis.gui import (
     QgsMapCanvas
 )
 
+from .tile_pyramid import TilePyramidGenerator
+from .tiled_renderer import TiledMapRenderer
+
+# maps are rendered in tiles of up to this size in pixels
+DEFAULT_EXPORT_TILE_SIZE = 2048
+# maximum number of map tiles to render at once
+DEFAULT_MAX_PARALLEL_EXPORT_JOBS = min(4, max(1, QThread.idealThreadCount() // 2))
+# internal tile size for exported GeoTIFFs
+OUTPUT_BLOCK_SIZE = 512
+DEFAULT_OUTPUT_QUALITY = 75
+# uploads smaller than this size (in bytes) are too short to measure the upload bandwidth
+MIN_MEASURED_UPLOAD_SIZE = 1024 * 1024
+
+# creation options for the intermediate file rendered before conversion to a COG
+INTERMEDIATE_CREATION_OPTIONS = ['TILED=YES', 'BIGTIFF=IF_SAFER', 'PHOTOMETRIC=RGB',
+                                 'ALPHA=YES', 'COMPRESS=DEFLATE', 'ZLEVEL=1',
+                                 'NUM_THREADS=ALL_CPUS']
+
+
+class OutputCompression(Enum):
+    """
+    Compression methods for exported maps
+    """
+    NoCompression = 'NONE'
+    Deflate = 'DEFLATE'
+    Zstd = 'ZSTD'
+    Jpeg = 'JPEG'
+    Webp = 'WEBP'
+
+    @staticmethod
+    def from_string(string: Optional[str]) -> Optional['OutputCompression']:
+        """
+        Converts a string to an OutputCompression
+        """
+        for compression in OutputCompression:
+            if compression.value == (string or '').upper():
+                return compression
+        return None
+
+    def is_lossy(self) -> bool:
+        """
+        Returns True if the compression method is lossy
+        """
+        return self in (OutputCompression.Jpeg, OutputCompression.Webp)
+
+    def is_available(self) -> bool:
+        """
+        Returns True if the compression method is supported by the GDAL build
+        """
+        if self == OutputCompression.NoCompression:
+            return True
+
+        options = gdal.GetDriverByName('GTiff').GetMetadataItem('DMD_CREATIONOPTIONLIST') or ''
+        return self.value in options
+
+    def bytes_per_pixel(self, quality: int) -> float:
+        """
+        Returns the approximate number of bytes per pixel for a typical map
+        compressed using the method.
+
+        These are rough figures for basemap-style maps, and are only intended
+        for estimating output sizes.
+        """
+        if self == OutputCompression.Deflate:
+            return 1.0
+        if self == OutputCompression.Zstd:
+            return 0.9
+        if self.is_lossy():
+            # bits per pixel increases steeply with quality
+            bits_per_pixel = 0.5 + 2.5 * (quality / 100) ** 2
+            if self == OutputCompression.Webp:
+                bits_per_pixel *= 0.75
+            return bits_per_pixel / 8
+
+        return 4
+
 
 class MapExportSettings:
     """
@@ -58,6 +143,71 @@ class MapExportSettings:
         self.output_file_name: Optional[str] = None
         self.include_decorations = True
         self.decorations: List[QgsMapDecoration] = []
+        self.tile_size: int = QgsSettings().value('soar/export_tile_size',
+                                                  DEFAULT_EXPORT_TILE_SIZE, int)
+        self.max_parallel_jobs: int = QgsSettings().value('soar/export_max_parallel_jobs',
+                                                          DEFAULT_MAX_PARALLEL_EXPORT_JOBS,
+                                                          int)
+        self.cloud_optimized: bool = QgsSettings().value('soar/export_cloud_optimized',
+                                                         True, bool)
+        self.compression: OutputCompression = OutputCompression.from_string(
+            QgsSettings().value('soar/export_compression', 'DEFLATE', str)
+        ) or OutputCompression.Deflate
+        self.quality: int = QgsSettings().value('soar/export_quality',
+                                                DEFAULT_OUTPUT_QUALITY, int)
+        # if set, a local XYZ tile pyramid (.mbtiles or .gpkg) is also generated
+        self.tile_pyramid_file_name: Optional[str] = None
+
+    def creation_options(self) -> List[str]:
+        """
+        Returns the GDAL creation options for the output file.
+
+        If cloud_optimized is True these are options for the COG driver,
+        otherwise they are options for the GTiff driver.
+        """
+        options = ['BIGTIFF=IF_SAFER',
+                   'NUM_THREADS=ALL_CPUS',
+                   f'COMPRESS={self.compression.value}']
+
+        if self.compression in (OutputCompression.Deflate, OutputCompression.Zstd):
+            options.append('PREDICTOR=YES' if self.cloud_optimized else 'PREDICTOR=2')
+        elif self.compression.is_lossy():
+            options.append(f'QUALITY={self.quality}')
+
+        if self.cloud_optimized:
+            options.extend([f'BLOCKSIZE={OUTPUT_BLOCK_SIZE}', 'OVERVIEWS=AUTO'])
+        else:
+            options.extend(['TILED=YES',
+                            f'BLOCKXSIZE={OUTPUT_BLOCK_SIZE}',
+                            f'BLOCKYSIZE={OUTPUT_BLOCK_SIZE}'])
+            if self.uses_mask_band():
+                options.append('PHOTOMETRIC=YCBCR')
+            else:
+                options.extend(['PHOTOMETRIC=RGB', 'ALPHA=YES'])
+
+        return options
+
+    def uses_mask_band(self) -> bool:
+        """
+        Returns True if the output file is written with 3 (RGB) bands and
+        transparency stored in an internal mask band, instead of an alpha band.
+
+        This is required for JPEG compression, which can't compress an alpha band.
+        (When creating a COG the driver converts the alpha band to a mask
+        automatically.)
+        """
+        return self.compression == OutputCompression.Jpeg and not self.cloud_optimized
+
+    def estimated_file_size(self) -> int:
+        """
+        Returns a rough estimate of the size of the output file, in bytes
+        """
+        size = self.size.width() * self.size.height() * \
+            self.compression.bytes_per_pixel(self.quality)
+        if self.cloud_optimized:
+            # overviews add around a third to the size
+            size *= 4 / 3
+        return int(size)
 
     def map_settings(self, map_canvas: QgsMapCanvas) -> QgsMapSettings:
         """
@@ -130,15 +280,23 @@ class MapPublisher(QgsTask):
         temp_path = Path(self.temp_dir.name)
         self.settings.output_file_name = (temp_path / 'qgis_map_export.tiff').as_posix()
 
-        render_task = QgsMapRendererTask(self.map_settings, self.settings.output_file_name,
-                               fileFormat='TIF')
-        if settings.decorations:
-            render_task.addDecorations(settings.decorations)
-        self.addSubTask(
-            render_task,
-            subTaskDependency=QgsTask.SubTaskDependency.ParentDependsOnSubTask
-        )
-
+        # when creating a COG, the map is first rendered to an intermediate file
+        # which is then converted with overviews
+        self.render_file_name: Optional[str] = None
+        if self.settings.cloud_optimized:
+            self.render_file_name = (temp_path / 'qgis_map_render.tiff').as_posix()
+
+        # tiles are rendered directly into the output file when the task is run.
+        # The renderer is created here, on the main thread, as the render jobs are
+        # prepared on the main thread while the task only writes the rendered tiles
+        self.tiled_renderer = TiledMapRenderer(self.map_settings,
+                                               self.settings.tile_size,
+                                               self.settings.max_parallel_jobs,
+                                               settings.decorations)
+
+        self.feedback = QgsFeedback()
+        self.feedback.progressChanged.connect(self._stage_progress_changed)
+        self._stage_progress_range = (0, 100)
         self.upload_start_reply: Optional[QNetworkReply] = None
 
     def cleanup(self):
@@ -148,8 +306,18 @@ class MapPublisher(QgsTask):
         self.temp_dir.cleanup()
         self.temp_dir = None
 
+    def cancel(self):  # pylint: disable=missing-function-docstring
+        self.feedback.cancel()
+        super().cancel()
+
     def run(self) -> bool:  # pylint: disable=missing-function-docstring
-        self.georeference_output()
+        if not self.render_output():
+            self.cleanup()
+            return False
+
+        if self.settings.tile_pyramid_file_name and not self.generate_tile_pyramid():
+            self.cleanup()
+            return False
 
         from .client import API_CLIENT  # pylint: disable=import-outside-toplevel
 
@@ -171,7 +339,10 @@ class MapPublisher(QgsTask):
             return False
 
         try:
+            upload_timer = QElapsedTimer()
+            upload_timer.start()
             API_CLIENT.upload_file(self.settings.output_file_name, res)
+            self.record_upload_bandwidth(upload_timer.elapsed())
             self.success.emit()
         except Exception as e:  # pylint: disable=broad-except
             self.failed.emit(str(e))
@@ -179,9 +350,148 @@ class MapPublisher(QgsTask):
         self.cleanup()
         return True
 
-    def georeference_output(self):
+    def record_upload_bandwidth(self, elapsed_ms: int):
+        """
+        Records the measured upload bandwidth, for estimating the upload
+        time of future exports
+        """
+        from .export_estimator import ExportEstimator  # pylint: disable=import-outside-toplevel
+
+        file_size = Path(self.settings.output_file_name).stat().st_size
+        if elapsed_ms > 0 and file_size >= MIN_MEASURED_UPLOAD_SIZE:
+            ExportEstimator.set_upload_bandwidth(file_size * 1000 / elapsed_ms)
+
+    def progress_stages(self) -> Dict[str, Tuple[float, float]]:
+        """
+        Returns the range of the task's progress taken by each stage of
+        the export
+        """
+        pyramid_share = 30 if self.settings.tile_pyramid_file_name else 0
+        cog_share = 20 if self.settings.cloud_optimized else 0
+        render_end = 100 - pyramid_share - cog_share
+        return {
+            'render': (0, render_end),
+            'cog': (render_end, render_end + cog_share),
+            'pyramid': (100 - pyramid_share, 100)
+        }
+
+    def _set_stage(self, stage: str):
+        """
+        Sets the current stage of the export, for progress reporting
+        """
+        self._stage_progress_range = self.progress_stages()[stage]
+        self.setProgress(self._stage_progress_range[0])
+
+    def _stage_progress_changed(self, progress: float):
+        """
+        Called when the progress of the current export stage changes
+        """
+        start, end = self._stage_progress_range
+        self.setProgress(start + progress * (end - start) / 100)
+
+    def render_output(self) -> bool:
         """
-        Applies georeferencing to the output image
+        Renders the map into the output file.
+
+        The georeferenced output dataset is created up front, and rendered
+        tiles are written straight into it. If a cloud optimized GeoTIFF is
+        required, the map is rendered to an intermediate file which is then
+        converted to a COG.
+
+        Returns False if rendering was canceled.
+        """
+        self._set_stage('render')
+        if self.settings.cloud_optimized:
+            dataset = self.create_output_dataset(self.render_file_name,
+                                                 INTERMEDIATE_CREATION_OPTIONS)
+        else:
+            dataset = self.create_output_dataset(self.settings.output_file_name,
+                                                 self.settings.creation_options(),
+                                                 self.settings.uses_mask_band())
+        if dataset is None:
+            self.failed.emit(self.tr('Could not create the export file: {}').format(
+                gdal.GetLastErrorMsg()))
+            return False
+
+        res = self.tiled_renderer.render(dataset, self.feedback)
+        del dataset
+
+        if not res or not self.settings.cloud_optimized:
+            return res
+
+        return self.write_cloud_optimized_output()
+
+    def generate_tile_pyramid(self) -> bool:
+        """
+        Generates a local XYZ tile pyramid from the output file.
+
+        Returns False if generation was canceled.
+        """
+        self._set_stage('pyramid')
+        generator = TilePyramidGenerator(self.settings.output_file_name,
+                                         self.settings.tile_pyramid_file_name)
+        return generator.generate(self.feedback)
+
+    def create_output_dataset(self,
+                              file_name: str,
+                              options: List[str],
+                              mask_band: bool = False) -> Optional[gdal.Dataset]:
+        """
+        Creates a GeoTIFF dataset for the map, with georeferencing for the map extent.
+
+        The dataset has 4 (RGBA) bands, or 3 (RGB) bands and an internal mask
+        band if mask_band is True.
+
+        Returns None if the dataset could not be created.
+        """
+        size = self.map_settings.outputSize()
+        dataset = gdal.GetDriverByName('GTiff').Create(
+            file_name, size.width(), size.height(), 3 if mask_band else 4, gdal.GDT_Byte,
+            options=options)
+        if dataset is None:
+            return None
+
+        if mask_band:
+            internal_mask = gdal.GetConfigOption('GDAL_TIFF_INTERNAL_MASK')
+            gdal.SetConfigOption('GDAL_TIFF_INTERNAL_MASK', 'YES')
+            res = dataset.CreateMaskBand(gdal.GMF_PER_DATASET)
+            gdal.SetConfigOption('GDAL_TIFF_INTERNAL_MASK', internal_mask)
+            if res != gdal.CE_None:
+                return None
+
+        dataset.SetGeoTransform(self.geotransform())
+        dataset.SetProjection(QgsCoordinateReferenceSystem('EPSG:3857').toWkt(
+            QgsCoordinateReferenceSystem.WktVariant.WKT_PREFERRED_GDAL))
+        return dataset
+
+    def write_cloud_optimized_output(self) -> bool:
+        """
+        Converts the intermediate rendered file to a cloud optimized GeoTIFF.
+
+        Overviews are built and compressed using all available CPUs.
+
+        Returns False if the conversion was canceled or failed.
+        """
+        self._set_stage('cog')
+
+        def progress(complete: float, _message, _data) -> int:
+            self._stage_progress_changed(complete * 100)
+            return 0 if self.feedback.isCanceled() else 1
+
+        dataset = gdal.Translate(self.settings.output_file_name,
+                                 self.render_file_name,
+                                 format='COG',
+                                 creationOptions=self.settings.creation_options(),
+                                 callback=progress)
+        res = dataset is not None
+        del dataset
+
+        gdal.Unlink(self.render_file_name)
+        return res and not self.feedback.isCanceled()
+
+    def geotransform(self) -> List[float]:
+        """
+        Returns the GDAL geotransform for the output image
         """
         a, b, c, d, e, f = QgsMapSettingsUtils.worldFileParameters(self.map_settings)
         c -= 0.5 * a
@@ -189,9 +499,4 @@ class MapPublisher(QgsTask):
         f -= 0.5 * d
         f -= 0.5 * e
 
-        dst_ds = gdal.Open(self.settings.output_file_name, gdal.GA_Update)
-        dst_ds.SetGeoTransform([c, a, b, f, d, e])
-        dst_ds.SetProjection(QgsCoordinateReferenceSystem('EPSG:3857').toWkt(
-            QgsCoordinateReferenceSystem.WktVariant.WKT_PREFERRED_GDAL))
-
-        del dst_ds
+        return [c, a, b, f, d, e]
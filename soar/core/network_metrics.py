@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""Network request instrumentation
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import json
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import (
+    Dict,
+    Optional,
+    Tuple
+)
+
+from qgis.PyQt.QtCore import (
+    QObject,
+    QUrl
+)
+from qgis.PyQt.QtNetwork import (
+    QNetworkRequest,
+    QNetworkReply
+)
+from qgis.core import (
+    Qgis,
+    QgsMessageLog,
+    QgsMapLayer,
+    QgsNetworkAccessManager,
+    QgsNetworkReplyContent,
+    QgsNetworkRequestParameters,
+    QgsProviderRegistry,
+    QgsSettings
+)
+
+
+class EndpointMetrics:  # pylint: disable=too-many-instance-attributes
+    """
+    Accumulated network metrics for a single endpoint
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.cancelled = 0
+        # responses served from the plugin's own caches, without a network request
+        self.cache_hits = 0
+        # responses served from the Qt network cache
+        self.network_cache_hits = 0
+        # conditional requests confirmed as unchanged by the server
+        self.not_modified = 0
+        self.bytes_received = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.status_codes: Dict[int, int] = defaultdict(int)
+
+    def mean_latency_ms(self) -> Optional[float]:
+        """
+        Returns the mean latency of completed requests, in milliseconds
+        """
+        if not self.completed:
+            return None
+
+        return self.total_latency_ms / self.completed
+
+    def as_dict(self) -> dict:
+        """
+        Returns the metrics as a JSON compatible dictionary
+        """
+        return {
+            'endpoint': self.endpoint,
+            'requests': self.requests,
+            'completed': self.completed,
+            'errors': self.errors,
+            'cancelled': self.cancelled,
+            'cache_hits': self.cache_hits,
+            'network_cache_hits': self.network_cache_hits,
+            'not_modified': self.not_modified,
+            'bytes_received': self.bytes_received,
+            'mean_latency_ms': self.mean_latency_ms(),
+            'max_latency_ms': self.max_latency_ms,
+            'status_codes': {str(k): v for k, v in sorted(self.status_codes.items())}
+        }
+
+
+class NetworkMetrics(QObject):
+    """
+    Records per-endpoint metrics for Soar network traffic.
+
+    Requests are tracked if they have been tagged with an endpoint via
+    tag_request(), or if they are made to a host which has been registered
+    via register_host() (e.g. tile servers used by Soar layers).
+    """
+
+    # request attribute used to store the endpoint name for tagged requests
+    ENDPOINT_ATTRIBUTE = QNetworkRequest.Attribute(QNetworkRequest.Attribute.User + 1)
+
+    # message log levels
+    LOG_NONE = 0
+    LOG_ERRORS = 1
+    LOG_ALL = 2
+
+    LOG_TAG = 'Soar'
+
+    NUMERIC_PATH_RE = re.compile(r'/\d+(?=/|$)')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._metrics: Dict[str, EndpointMetrics] = {}
+        # endpoint and start time for active requests, by request id
+        self._active: Dict[int, Tuple[str, float]] = {}
+        self._bytes: Dict[int, int] = {}
+        self._hosts: Dict[str, str] = {}
+        self._connected = False
+
+    @staticmethod
+    def log_level() -> int:
+        """
+        Returns the level at which network metrics are written to the message log
+        """
+        return QgsSettings().value('soar/network_log_level', NetworkMetrics.LOG_NONE, int)
+
+    @staticmethod
+    def dump_path() -> Optional[str]:
+        """
+        Returns the path which metrics should be dumped to when the plugin
+        is unloaded, if set
+        """
+        return QgsSettings().value('soar/network_metrics_path', '', str) or None
+
+    @staticmethod
+    def normalize_endpoint(endpoint: str) -> str:
+        """
+        Normalizes an endpoint name, replacing numeric identifiers so that
+        requests for different objects are grouped together
+        """
+        return NetworkMetrics.NUMERIC_PATH_RE.sub('/{id}', endpoint)
+
+    def _ensure_connected(self):
+        """
+        Connects to the network access manager, if not already connected
+        """
+        if self._connected:
+            return
+
+        nam = QgsNetworkAccessManager.instance()
+        nam.requestAboutToBeCreated[QgsNetworkRequestParameters].connect(
+            self._request_about_to_be_created)
+        nam.downloadProgress.connect(self._download_progress)
+        nam.finished[QgsNetworkReplyContent].connect(self._request_finished)
+        self._connected = True
+
+    def stop(self):
+        """
+        Stops tracking network requests
+        """
+        if not self._connected:
+            return
+
+        nam = QgsNetworkAccessManager.instance()
+        nam.requestAboutToBeCreated[QgsNetworkRequestParameters].disconnect(
+            self._request_about_to_be_created)
+        nam.downloadProgress.disconnect(self._download_progress)
+        nam.finished[QgsNetworkReplyContent].disconnect(self._request_finished)
+        self._connected = False
+        self._active = {}
+        self._bytes = {}
+
+    def tag_request(self, request: QNetworkRequest, endpoint: str):
+        """
+        Tags a network request with an endpoint name, so that the request
+        will be tracked
+        """
+        self._ensure_connected()
+        request.setAttribute(self.ENDPOINT_ATTRIBUTE, self.normalize_endpoint(endpoint))
+
+    def register_host(self, host: str, endpoint: str):
+        """
+        Registers a host, so that all requests made to the host will be tracked
+        under the specified endpoint name
+        """
+        if not host:
+            return
+
+        self._ensure_connected()
+        self._hosts[host.lower()] = endpoint
+
+    def register_layer(self, layer: QgsMapLayer):
+        """
+        Registers the tile server host for a Soar layer, so that tile requests
+        for the layer will be tracked
+        """
+        parts = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source())
+        url = parts.get('url')
+        if url:
+            self.register_host(QUrl(url).host(), 'tiles')
+
+    def record_cache_hit(self, endpoint: str):
+        """
+        Records that a response was served from a local cache, without
+        making a network request
+        """
+        self._endpoint_metrics(self.normalize_endpoint(endpoint)).cache_hits += 1
+
+    def metrics(self) -> Dict[str, EndpointMetrics]:
+        """
+        Returns the recorded metrics, by endpoint
+        """
+        return self._metrics
+
+    def endpoint_metrics(self, endpoint: str) -> Optional[EndpointMetrics]:
+        """
+        Returns the recorded metrics for an endpoint, if any
+        """
+        return self._metrics.get(self.normalize_endpoint(endpoint))
+
+    def reset(self):
+        """
+        Clears all recorded metrics
+        """
+        self._metrics = {}
+
+    def to_json(self) -> dict:
+        """
+        Returns all recorded metrics as a JSON compatible dictionary
+        """
+        return {
+            'endpoints': [self._metrics[endpoint].as_dict()
+                          for endpoint in sorted(self._metrics.keys())]
+        }
+
+    def dump_json(self, path: str):
+        """
+        Writes all recorded metrics to a JSON file
+        """
+        Path(path).write_text(json.dumps(self.to_json(), indent=2), encoding='utf-8')
+
+    def log_summary(self):
+        """
+        Writes a summary of all recorded metrics to the message log
+        """
+        for endpoint in sorted(self._metrics.keys()):
+            metrics = self._metrics[endpoint]
+            mean_latency = metrics.mean_latency_ms()
+            QgsMessageLog.logMessage(
+                self.tr('{}: {} requests, {} errors, {} cancelled, {} cache hits, '
+                        '{} not modified, {} KB received, mean latency {}').format(
+                    endpoint, metrics.requests, metrics.errors, metrics.cancelled,
+                    metrics.cache_hits, metrics.not_modified,
+                    round(metrics.bytes_received / 1024, 1),
+                    f'{mean_latency:.0f} ms' if mean_latency is not None else '-'),
+                self.LOG_TAG, Qgis.Info)
+
+    def _endpoint_metrics(self, endpoint: str) -> EndpointMetrics:
+        """
+        Returns the metrics for an endpoint, creating them if required
+        """
+        if endpoint not in self._metrics:
+            self._metrics[endpoint] = EndpointMetrics(endpoint)
+        return self._metrics[endpoint]
+
+    def _endpoint_for_request(self, request: QNetworkRequest) -> Optional[str]:
+        """
+        Returns the tracked endpoint for a request, or None if the request
+        should not be tracked
+        """
+        endpoint = request.attribute(self.ENDPOINT_ATTRIBUTE)
+        if endpoint:
+            return endpoint
+
+        if self._hosts:
+            return self._hosts.get(request.url().host().lower())
+
+        return None
+
+    def _request_about_to_be_created(self, parameters: QgsNetworkRequestParameters):
+        """
+        Called when any network request is about to be made
+        """
+        endpoint = self._endpoint_for_request(parameters.request())
+        if endpoint is None:
+            return
+
+        self._active[parameters.requestId()] = (endpoint, time.monotonic())
+        self._endpoint_metrics(endpoint).requests += 1
+
+    def _download_progress(self, request_id: int, bytes_received: int, _: int):
+        """
+        Called when data is received for a network request
+        """
+        if request_id in self._active:
+            self._bytes[request_id] = bytes_received
+
+    def _request_finished(self, reply: QgsNetworkReplyContent):
+        """
+        Called when any network request is finished
+        """
+        active = self._active.pop(reply.requestId(), None)
+        bytes_received = self._bytes.pop(reply.requestId(), 0)
+        if active is None:
+            return
+
+        endpoint, started_at = active
+        latency_ms = (time.monotonic() - started_at) * 1000
+
+        metrics = self._endpoint_metrics(endpoint)
+        metrics.bytes_received += bytes_received
+
+        status = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if status is not None:
+            metrics.status_codes[int(status)] += 1
+
+        log_level = self.log_level()
+        url = reply.request().url().toString(QUrl.UrlFormattingOption.RemoveQuery)
+
+        if reply.error() == QNetworkReply.NetworkError.OperationCanceledError:
+            metrics.cancelled += 1
+            if log_level >= self.LOG_ALL:
+                QgsMessageLog.logMessage(self.tr('{}: cancelled after {:.0f} ms').format(
+                    url, latency_ms), self.LOG_TAG, Qgis.Info)
+            return
+
+        metrics.completed += 1
+        metrics.total_latency_ms += latency_ms
+        metrics.max_latency_ms = max(metrics.max_latency_ms, latency_ms)
+
+        if reply.attribute(QNetworkRequest.Attribute.SourceIsFromCacheAttribute):
+            metrics.network_cache_hits += 1
+        if status == 304:
+            metrics.not_modified += 1
+
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            metrics.errors += 1
+            if log_level >= self.LOG_ERRORS:
+                QgsMessageLog.logMessage(self.tr('{}: {} after {:.0f} ms').format(
+                    url, reply.errorString(), latency_ms), self.LOG_TAG, Qgis.Warning)
+        elif log_level >= self.LOG_ALL:
+            QgsMessageLog.logMessage(self.tr('{}: {} ({} bytes) in {:.0f} ms').format(
+                url, status, bytes_received, latency_ms), self.LOG_TAG, Qgis.Info)
+
+
+NETWORK_METRICS = NetworkMetrics()
@@ -13,9 +13,9 @@ __copyright__ = 'Copyright 2022, North Road'
 # This will get replaced with a git SHA1 when you do a git archive
 __revision__ = '$Format:%H$'
 
-from functools import partial
 from typing import List, Optional
 
+from qgis.PyQt import sip
 from qgis.PyQt.QtCore import (
     Qt,
     QTimer,
@@ -23,15 +23,14 @@ from qgis.PyQt.QtCore import (
     QObject,
     QSize
 )
-from qgis.PyQt.QtNetwork import QNetworkReply
 from qgis.core import (
     QgsProject,
-    QgsNetworkAccessManager,
     QgsMapLayer,
     QgsRectangle
 )
 
-from .client import API_CLIENT
+from .layer_refresh import LayerRefreshScheduler
+from .network_metrics import NETWORK_METRICS
 
 
 class ProjectManager(QObject):
@@ -43,29 +42,60 @@ class ProjectManager(QObject):
         super().__init__(parent)
         self.project = project
 
+        self.refresh_scheduler = LayerRefreshScheduler(self.project, self)
+
+        # layers are checked in bulk after a short delay, as we don't want this logic
+        # happening right on project load!
+        self._pending_layers: List[QgsMapLayer] = []
+        self._check_layers_timer = QTimer(self)
+        self._check_layers_timer.setSingleShot(True)
+        self._check_layers_timer.setInterval(1000)
+        self._check_layers_timer.timeout.connect(self._check_pending_layers)
+
         self.project.layerWasAdded.connect(self._on_layer_added)
+        self.project.cleared.connect(self._project_cleared)
 
     def _on_layer_added(self, layer: QgsMapLayer):
         """
         Called whenever a new layer is added to the project (or for each layer when the user
         opens an existing project)
         """
+        if layer.customProperty('_soar_layer_id'):
+            NETWORK_METRICS.register_layer(layer)
+
+        self._pending_layers.append(layer)
+        self._check_layers_timer.start()
 
-        # we defer this by a second, as we don't want this logic happening right on project load!
-        _update_timeout = QTimer(self)
-        _update_timeout.setSingleShot(True)
-        _update_timeout.timeout.connect(partial(self._check_layer_uri, layer))
-        _update_timeout.timeout.connect(_update_timeout.deleteLater)
-        _update_timeout.setInterval(1000)
-        _update_timeout.start()
+    def _project_cleared(self):
+        """
+        Called when the project is cleared
+        """
+        self._pending_layers = []
+        self._check_layers_timer.stop()
+        self.refresh_scheduler.cancel()
 
-    def _check_layer_uri(self, layer: QgsMapLayer):
+    def _check_pending_layers(self):
         """
-        Checks whether we need to refresh a layer's URI
+        Checks all recently added layers, refreshing the URIs of any which are
+        about to expire
+        """
+        layers = self._pending_layers
+        self._pending_layers = []
+
+        expiring_layers = [layer for layer in layers
+                           if not sip.isdeleted(layer) and self._check_layer_uri(layer)]
+        if expiring_layers:
+            self.refresh_scheduler.add_layers(expiring_layers)
+
+    def _check_layer_uri(self, layer: QgsMapLayer) -> bool:
+        """
+        Checks whether we need to refresh a layer's URI.
+
+        Returns True if the layer's URI needs refreshing.
         """
         soar_layer_id = layer.customProperty('_soar_layer_id')
         if not soar_layer_id:
-            return  # don't care about this layer
+            return False  # don't care about this layer
 
         # restore real layer extent
         x_min = layer.customProperty('_real_extent_x_min')
@@ -79,38 +109,8 @@ class ProjectManager(QObject):
                                                  Qt.DateFormat.ISODate)
         remaining_days = QDateTime.currentDateTime().daysTo(soar_layer_expiry)
 
-        if remaining_days > 2:
-            # still some time remaining, leave layer url unchanged
-            return
-
-        self._refresh_layer_uri(layer)
-
-    def _refresh_layer_uri(self, layer):
-        """
-        Triggers a refresh of a layer's URI
-        """
-        soar_layer_id = layer.customProperty('_soar_layer_id')
-
-        request = API_CLIENT.request_listing(soar_layer_id)
-        reply = QgsNetworkAccessManager.instance().get(request)
-        reply.finished.connect(partial(self._listing_fetched, reply, layer))
-
-    def _listing_fetched(self, reply: QNetworkReply, layer: QgsMapLayer):
-        """
-        Called when a listing has been fetched and we are ready to update a layer's URI
-        """
-        full_listing = API_CLIENT.parse_listing_reply(reply)
-
-        new_uri = full_listing.to_qgis_layer_source_string()
-        # we've overridden the layer's extent from its default
-        # This will be reset on the call to setDataSource, so we need to restore
-        # the existing extent
-        old_extent = layer.extent()
-        layer.setDataSource(new_uri, layer.name(), 'wms')
-        layer.setExtent(old_extent)
-
-        layer.setCustomProperty('_soar_layer_expiry',
-                                full_listing.tile_url_expiry_at.toString(Qt.DateFormat.ISODate))
+        # if there's still some time remaining, leave layer url unchanged
+        return remaining_days <= 2
 
     def soar_map_title(self) -> str:
         """
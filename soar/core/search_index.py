@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Local full text index of listings
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import bisect
+import re
+from collections import defaultdict
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+
+from .client import Listing
+
+
+class ListingSearchIndex:
+    """
+    An in-memory inverted index over the text of listings, for instant
+    ranked keyword searches of previously fetched listings
+    """
+
+    # relative weights of matches in the different listing fields
+    TITLE_WEIGHT = 4.0
+    TAG_WEIGHT = 3.0
+    CATEGORY_WEIGHT = 2.0
+    DESCRIPTION_WEIGHT = 1.0
+
+    # weight factor applied to partial (prefix) matches of the final search term
+    PREFIX_FACTOR = 0.5
+
+    TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+    def __init__(self):
+        self._listings: Dict[int, Listing] = {}
+        # insertion order of listings, used to break ties in ranking
+        self._order: Dict[int, int] = {}
+        # term -> listing id -> weight
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._listing_terms: Dict[int, List[str]] = {}
+        self._sorted_terms: Optional[List[str]] = None
+
+    def __len__(self):
+        return len(self._listings)
+
+    @staticmethod
+    def tokenize(text: Optional[str]) -> List[str]:
+        """
+        Splits text into normalized search terms
+        """
+        if not text:
+            return []
+
+        return ListingSearchIndex.TOKEN_RE.findall(text.casefold())
+
+    def add_listings(self, listings: List[Listing]):
+        """
+        Adds listings to the index. Listings which are already present
+        will be updated.
+        """
+        for listing in listings:
+            if listing.id is None:
+                continue
+
+            if listing.id in self._listings:
+                self._remove(listing.id)
+            else:
+                self._order[listing.id] = len(self._order)
+
+            self._listings[listing.id] = listing
+
+            weights: Dict[str, float] = defaultdict(float)
+            for term in self.tokenize(listing.title):
+                weights[term] += self.TITLE_WEIGHT
+            for tag in listing.tags or []:
+                for term in self.tokenize(tag):
+                    weights[term] += self.TAG_WEIGHT
+            for category in listing.categories or []:
+                for term in self.tokenize(category):
+                    weights[term] += self.CATEGORY_WEIGHT
+            for term in self.tokenize(listing.description):
+                weights[term] += self.DESCRIPTION_WEIGHT
+
+            for term, weight in weights.items():
+                if term not in self._postings:
+                    self._sorted_terms = None
+                self._postings[term][listing.id] = weight
+            self._listing_terms[listing.id] = list(weights.keys())
+
+    def _remove(self, listing_id: int):
+        """
+        Removes the postings for a listing
+        """
+        for term in self._listing_terms.pop(listing_id, []):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+
+            postings.pop(listing_id, None)
+            if not postings:
+                del self._postings[term]
+                self._sorted_terms = None
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        """
+        Returns all indexed terms starting with a prefix
+        """
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings.keys())
+
+        res = []
+        idx = bisect.bisect_left(self._sorted_terms, prefix)
+        while idx < len(self._sorted_terms) and self._sorted_terms[idx].startswith(prefix):
+            res.append(self._sorted_terms[idx])
+            idx += 1
+        return res
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[Listing]:
+        """
+        Returns the indexed listings matching all terms from a search string,
+        ranked by relevance.
+
+        The final term in the search string is treated as a prefix, so that
+        partially typed words will match.
+        """
+        terms = self.tokenize(text)
+        if not terms:
+            return []
+
+        # the final term may still be being typed
+        prefix_complete = not text[-1:].isalnum()
+
+        scores: Optional[Dict[int, float]] = None
+        for idx, term in enumerate(terms):
+            term_scores: Dict[int, float] = dict(self._postings.get(term, {}))
+            if idx == len(terms) - 1 and not prefix_complete:
+                for prefix_term in self._prefix_terms(term):
+                    if prefix_term == term:
+                        continue
+                    for listing_id, weight in self._postings[prefix_term].items():
+                        term_scores[listing_id] = max(term_scores.get(listing_id, 0),
+                                                      weight * self.PREFIX_FACTOR)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {listing_id: score + term_scores[listing_id]
+                          for listing_id, score in scores.items()
+                          if listing_id in term_scores}
+
+            if not scores:
+                return []
+
+        ranked = sorted(scores.keys(), key=lambda listing_id: (-scores[listing_id],
+                                                                self._order[listing_id]))
+        if limit is not None:
+            ranked = ranked[:limit]
+
+        return [self._listings[listing_id] for listing_id in ranked]
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""Thumbnail caches
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import (
+    Hashable,
+    Optional,
+    Dict
+)
+
+from qgis.PyQt.QtGui import QImage
+from qgis.core import (
+    QgsApplication,
+    QgsSettings
+)
+
+
+class ThumbnailMemoryCache:
+    """
+    An in-memory least recently used cache of decoded thumbnail images,
+    limited by the total size of the images in bytes
+    """
+
+    DEFAULT_MAX_SIZE_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, max_size: Optional[int] = None):
+        self._max_size: Optional[int] = max_size
+        self._images: 'OrderedDict[Hashable, QImage]' = OrderedDict()
+        self._size = 0
+
+    @staticmethod
+    def image_size(image: QImage) -> int:
+        """
+        Returns the size of an image in bytes
+        """
+        try:
+            return image.sizeInBytes()
+        except AttributeError:
+            # Qt < 5.10
+            return image.byteCount()
+
+    def max_size(self) -> int:
+        """
+        Returns the maximum total size (in bytes) of all cached images
+        """
+        if self._max_size is not None:
+            return self._max_size
+        return QgsSettings().value('soar/thumbnail_cache/memory_size',
+                                   self.DEFAULT_MAX_SIZE_BYTES, int)
+
+    def set_max_size(self, max_size: int):
+        """
+        Sets the maximum total size (in bytes) of all cached images.
+
+        Existing images will be evicted if the new size is exceeded.
+        """
+        self._max_size = max_size
+        self._evict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._images
+
+    def __len__(self):
+        return len(self._images)
+
+    def size(self) -> int:
+        """
+        Returns the total size (in bytes) of all cached images
+        """
+        return self._size
+
+    def get(self, key: Hashable) -> Optional[QImage]:
+        """
+        Returns the cached image for a key, and marks it as recently used
+        """
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+        return image
+
+    def insert(self, key: Hashable, image: QImage):
+        """
+        Inserts an image into the cache
+        """
+        self.remove(key)
+
+        size = self.image_size(image)
+        if size > self.max_size():
+            return
+
+        self._images[key] = image
+        self._size += size
+        self._evict()
+
+    def remove(self, key: Hashable):
+        """
+        Removes an image from the cache
+        """
+        image = self._images.pop(key, None)
+        if image is not None:
+            self._size -= self.image_size(image)
+
+    def clear(self):
+        """
+        Removes all images from the cache
+        """
+        self._images = OrderedDict()
+        self._size = 0
+
+    def _evict(self):
+        """
+        Evicts least recently used images until the cache fits
+        within the byte budget
+        """
+        max_size = self.max_size()
+        while self._size > max_size and self._images:
+            _, image = self._images.popitem(last=False)
+            self._size -= self.image_size(image)
+
+
+class ThumbnailDiskCache:
+    """
+    A persistent on-disk cache of raw (encoded) thumbnail data, keyed by url.
+
+    The modification time of each cached file is used as its last access
+    time. Entries which have not been used within the maximum age are
+    discarded, and the least recently used entries are evicted when the
+    total size of the cache exceeds its byte budget.
+
+    The total cache size is tracked in memory after an initial scan of the
+    cache directory, so that storing entries doesn't require a scan.
+    """
+
+    DEFAULT_MAX_SIZE_BYTES = 200 * 1024 * 1024
+    DEFAULT_MAX_AGE_DAYS = 30
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 max_size: Optional[int] = None,
+                 max_age_days: Optional[int] = None):
+        self._path: Optional[Path] = Path(path) if path else None
+        self._max_size: Optional[int] = max_size
+        self._max_age_days: Optional[int] = max_age_days
+        # file sizes, by key. Loaded lazily from disk
+        self._sizes: Optional[Dict[str, int]] = None
+        self._size = 0
+
+    @staticmethod
+    def cache_key(url: str) -> str:
+        """
+        Returns the cache key for a url
+        """
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    def path(self) -> Path:
+        """
+        Returns the directory used to store cached thumbnails
+        """
+        if self._path is None:
+            self._path = Path(QgsApplication.qgisSettingsDirPath()) / 'cache' / 'soar' / 'thumbnails'
+        return self._path
+
+    def max_size(self) -> int:
+        """
+        Returns the maximum size (in bytes) of all cached thumbnails
+        """
+        if self._max_size is not None:
+            return self._max_size
+        return QgsSettings().value('soar/thumbnail_cache/disk_size',
+                                   self.DEFAULT_MAX_SIZE_BYTES, int)
+
+    def set_max_size(self, max_size: int):
+        """
+        Sets the maximum size (in bytes) of all cached thumbnails.
+
+        Existing entries will be evicted if the new size is exceeded.
+        """
+        self._max_size = max_size
+        self._evict()
+
+    def max_age_days(self) -> int:
+        """
+        Returns the maximum number of days for which unused thumbnails are retained
+        """
+        if self._max_age_days is not None:
+            return self._max_age_days
+        return QgsSettings().value('soar/thumbnail_cache/max_age_days',
+                                   self.DEFAULT_MAX_AGE_DAYS, int)
+
+    def set_max_age_days(self, days: int):
+        """
+        Sets the maximum number of days for which unused thumbnails are retained
+        """
+        self._max_age_days = days
+
+    def is_enabled(self) -> bool:
+        """
+        Returns True if the cache is enabled
+        """
+        return self.max_size() > 0
+
+    def data(self, url: str) -> Optional[bytes]:
+        """
+        Returns the cached data for a url, and marks the entry as recently used
+        """
+        if not self.is_enabled():
+            return None
+
+        key = self.cache_key(url)
+        if key not in self._index():
+            return None
+
+        file_path = self._file_path(key)
+        try:
+            if time.time() - file_path.stat().st_mtime > self.max_age_days() * 86400:
+                self._remove(key)
+                return None
+
+            data = file_path.read_bytes()
+            os.utime(file_path)
+        except OSError:
+            self._forget(key)
+            return None
+
+        return data
+
+    def store(self, url: str, data: bytes):
+        """
+        Stores the data for a url in the cache
+        """
+        if not self.is_enabled() or not data or len(data) > self.max_size():
+            return
+
+        key = self.cache_key(url)
+        index = self._index()
+        try:
+            self.path().mkdir(parents=True, exist_ok=True)
+            self._file_path(key).write_bytes(data)
+        except OSError:
+            return
+
+        self._size -= index.get(key, 0)
+        index[key] = len(data)
+        self._size += len(data)
+
+        self._evict()
+
+    def size(self) -> int:
+        """
+        Returns the total size (in bytes) of all cached thumbnails
+        """
+        self._index()
+        return self._size
+
+    def clear(self):
+        """
+        Removes all entries from the cache
+        """
+        for key in list(self._index().keys()):
+            self._remove(key)
+
+    def _file_path(self, key: str) -> Path:
+        """
+        Returns the file path for a cached thumbnail
+        """
+        return self.path() / key
+
+    def _index(self) -> Dict[str, int]:
+        """
+        Returns the sizes of all cached files, scanning the cache directory
+        if required. Expired entries are discarded during the scan.
+        """
+        if self._sizes is None:
+            self._sizes = {}
+            self._size = 0
+            max_age = self.max_age_days() * 86400
+            now = time.time()
+            try:
+                for entry in os.scandir(self.path()):
+                    if not entry.is_file():
+                        continue
+
+                    stat = entry.stat()
+                    if now - stat.st_mtime > max_age:
+                        try:
+                            os.unlink(entry.path)
+                        except OSError:
+                            pass
+                        continue
+
+                    self._sizes[entry.name] = stat.st_size
+                    self._size += stat.st_size
+            except OSError:
+                pass
+
+            self._evict()
+
+        return self._sizes
+
+    def _forget(self, key: str):
+        """
+        Removes an entry from the index, without deleting its file
+        """
+        self._size -= self._index().pop(key, 0)
+
+    def _remove(self, key: str):
+        """
+        Removes an entry from the cache
+        """
+        self._forget(key)
+        try:
+            self._file_path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict(self):
+        """
+        Evicts the least recently used entries until the cache fits
+        within the byte budget
+        """
+        if self._sizes is None:
+            return
+
+        max_size = self.max_size()
+        if self._size <= max_size:
+            return
+
+        access_times = {}
+        for key in list(self._sizes.keys()):
+            try:
+                access_times[key] = self._file_path(key).stat().st_mtime
+            except OSError:
+                self._forget(key)
+
+        for key in sorted(access_times.keys(), key=lambda k: access_times[k]):
+            if self._size <= max_size:
+                break
+            self._remove(key)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Web mercator tile grid utilities
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import math
+from typing import (
+    Optional,
+    Tuple
+)
+
+from qgis.core import QgsRectangle
+
+MAX_LATITUDE = 85.0511287798066
+MAX_ZOOM = 18
+
+# extents are snapped to tiles at this many zoom levels above the zoom level
+# at which a single tile covers the extent, i.e. tiles are between a quarter
+# and a half of the extent's size
+ZOOM_OFFSET = 2
+
+
+def _to_tile_fraction(lon: float, lat: float) -> Tuple[float, float]:
+    """
+    Converts a EPSG:4326 point to a fraction of the tile grid extent, with
+    y increasing southwards
+    """
+    lon = min(max(lon, -180), 180)
+    lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+    x = (lon + 180) / 360
+    y = (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2
+    return x, y
+
+
+def _from_tile_fraction(x: float, y: float) -> Tuple[float, float]:
+    """
+    Converts a fraction of the tile grid extent to a EPSG:4326 point
+    """
+    lon = x * 360 - 180
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lon, lat
+
+
+def _tile_range(minimum: float, maximum: float, tile_count: int) -> Tuple[int, int]:
+    """
+    Returns the range of tiles covering a range of tile grid fractions
+    """
+    tile_min = min(max(math.floor(minimum * tile_count), 0), tile_count - 1)
+    tile_max = max(min(math.ceil(maximum * tile_count), tile_count), tile_min + 1)
+    return tile_min, tile_max
+
+
+def tile_zoom_for_extent(extent: QgsRectangle) -> int:
+    """
+    Returns the tile zoom level to use when snapping an extent (in EPSG:4326)
+    to the tile grid
+    """
+    x_min, y_max = _to_tile_fraction(extent.xMinimum(), extent.yMinimum())
+    x_max, y_min = _to_tile_fraction(extent.xMaximum(), extent.yMaximum())
+
+    size = max(x_max - x_min, y_max - y_min)
+    if size <= 0:
+        return MAX_ZOOM
+
+    zoom = math.floor(math.log2(1 / size)) + ZOOM_OFFSET
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+def snap_extent_to_tile_grid(extent: QgsRectangle,
+                             zoom: Optional[int] = None) -> QgsRectangle:
+    """
+    Expands an extent (in EPSG:4326) to the boundaries of the web mercator
+    tiles it intersects, so that nearby extents snap to an identical extent.
+
+    If zoom is not specified, an appropriate zoom level for the extent size
+    is used.
+
+    Extents which reach beyond the limits of the web mercator grid (e.g. polar
+    extents) are returned unchanged, as snapping would clip them to the grid.
+    """
+    if extent.xMinimum() < -180 or extent.xMaximum() > 180 or \
+            extent.yMinimum() < -MAX_LATITUDE or extent.yMaximum() > MAX_LATITUDE:
+        return QgsRectangle(extent)
+
+    if zoom is None:
+        zoom = tile_zoom_for_extent(extent)
+
+    tile_count = 2 ** zoom
+
+    x_min, y_max = _to_tile_fraction(extent.xMinimum(), extent.yMinimum())
+    x_max, y_min = _to_tile_fraction(extent.xMaximum(), extent.yMaximum())
+
+    tile_x_min, tile_x_max = _tile_range(x_min, x_max, tile_count)
+    tile_y_min, tile_y_max = _tile_range(y_min, y_max, tile_count)
+
+    lon_min, lat_max = _from_tile_fraction(tile_x_min / tile_count, tile_y_min / tile_count)
+    lon_max, lat_min = _from_tile_fraction(tile_x_max / tile_count, tile_y_max / tile_count)
+
+    return QgsRectangle(lon_min, lat_min, lon_max, lat_max)
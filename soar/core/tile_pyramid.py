@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+"""XYZ tile pyramid generation
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait
+)
+from pathlib import Path
+from typing import (
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple
+)
+
+from osgeo import (
+    gdal,
+    osr
+)
+
+TILE_SIZE = 256
+# half the width of the web mercator tile grid, in meters
+WEB_MERCATOR_HALF_EXTENT = 20037508.342789244
+# tiles are cut in batches of this many tiles per worker task
+TILE_BATCH_SIZE = 32
+
+# tile coordinates, as (zoom, x, y) with y increasing southwards
+Tile = Tuple[int, int, int]
+
+# source datasets opened by the current worker, by file name. These are per
+# thread, as datasets can't be shared between threads
+_SOURCE_DATASETS = threading.local()
+
+
+def tile_bounds(tile: Tile) -> Tuple[float, float, float, float]:
+    """
+    Returns the bounds of a tile in EPSG:3857, as (x_min, y_min, x_max, y_max)
+    """
+    zoom, x, y = tile
+    tile_extent = 2 * WEB_MERCATOR_HALF_EXTENT / 2 ** zoom
+    x_min = -WEB_MERCATOR_HALF_EXTENT + x * tile_extent
+    y_max = WEB_MERCATOR_HALF_EXTENT - y * tile_extent
+    return x_min, y_max - tile_extent, x_min + tile_extent, y_max
+
+
+def tiles_for_bounds(bounds: Tuple[float, float, float, float],
+                     zoom: int) -> Iterator[Tile]:
+    """
+    Yields the tiles at a zoom level which intersect bounds in EPSG:3857
+    """
+    tile_count = 2 ** zoom
+    tile_extent = 2 * WEB_MERCATOR_HALF_EXTENT / tile_count
+    x_min, y_min, x_max, y_max = bounds
+
+    def tile_index(value: float) -> int:
+        return min(max(int(math.floor(value / tile_extent)), 0), tile_count - 1)
+
+    # tiny epsilon avoids including tiles which are only touched by the bounds
+    epsilon = tile_extent * 1e-9
+    first_x = tile_index(x_min + WEB_MERCATOR_HALF_EXTENT + epsilon)
+    last_x = tile_index(x_max + WEB_MERCATOR_HALF_EXTENT - epsilon)
+    first_y = tile_index(WEB_MERCATOR_HALF_EXTENT - y_max + epsilon)
+    last_y = tile_index(WEB_MERCATOR_HALF_EXTENT - y_min - epsilon)
+
+    for y in range(first_y, last_y + 1):
+        for x in range(first_x, last_x + 1):
+            yield zoom, x, y
+
+
+def zoom_range_for_source(pixel_size: float, width: int, height: int) -> Tuple[int, int]:
+    """
+    Returns the range of zoom levels to generate for a source raster with the
+    specified pixel size (in EPSG:3857 meters) and size in pixels.
+
+    The maximum zoom level is the first level with tiles at least as detailed as
+    the source, and the minimum zoom level is the first level at which the
+    whole source fits within a single tile.
+    """
+    max_zoom = max(0, math.ceil(
+        math.log2(2 * WEB_MERCATOR_HALF_EXTENT / (TILE_SIZE * pixel_size))))
+    levels = max(0, math.ceil(math.log2(max(width, height) / TILE_SIZE)))
+    return max(0, max_zoom - levels), max_zoom
+
+
+def _source_dataset(file_name: str) -> gdal.Dataset:
+    """
+    Returns the source dataset for the current worker
+    """
+    if not hasattr(_SOURCE_DATASETS, 'datasets'):
+        _SOURCE_DATASETS.datasets = {}
+
+    dataset = _SOURCE_DATASETS.datasets.get(file_name)
+    if dataset is None:
+        dataset = gdal.Open(file_name)
+        _SOURCE_DATASETS.datasets[file_name] = dataset
+    return dataset
+
+
+def cut_tiles(file_name: str, tiles: List[Tile]) -> List[Tuple[Tile, Optional[bytes]]]:
+    """
+    Cuts a batch of tiles from a source raster in EPSG:3857, returning
+    the encoded PNG data for each tile.
+
+    Tiles which are completely transparent are returned with None data.
+
+    This is run in worker processes (or threads).
+    """
+    source = _source_dataset(file_name)
+    results = []
+    for tile in tiles:
+        warped = gdal.Warp('', source,
+                           format='MEM',
+                           outputBounds=tile_bounds(tile),
+                           width=TILE_SIZE,
+                           height=TILE_SIZE,
+                           resampleAlg='average',
+                           # the source alpha band (or mask, for JPEG compressed
+                           # sources) is warped to an alpha band
+                           dstAlpha=True)
+
+        alpha = warped.GetRasterBand(warped.RasterCount)
+        if alpha.ComputeRasterMinMax(False)[1] == 0:
+            results.append((tile, None))
+            continue
+
+        png_file_name = f'/vsimem/soar_tile_{uuid.uuid4().hex}.png'
+        gdal.GetDriverByName('PNG').CreateCopy(png_file_name, warped)
+        del warped
+
+        handle = gdal.VSIFOpenL(png_file_name, 'rb')
+        gdal.VSIFSeekL(handle, 0, 2)
+        size = gdal.VSIFTellL(handle)
+        gdal.VSIFSeekL(handle, 0, 0)
+        data = gdal.VSIFReadL(1, size, handle)
+        gdal.VSIFCloseL(handle)
+        gdal.Unlink(png_file_name)
+
+        results.append((tile, data))
+
+    return results
+
+
+class TilePyramidWriter:
+    """
+    Base class for writing a tile pyramid to a SQLite based tile container.
+
+    Tiles are committed in batches, so that an interrupted generation can be
+    resumed by skipping the tiles which already exist. Completely transparent
+    tiles aren't stored, but are recorded so that they are also skipped.
+    """
+
+    EMPTY_TILES_TABLE_NAME = 'soar_empty_tiles'
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        is_new = not Path(file_name).exists()
+        self.connection = sqlite3.connect(file_name)
+        if is_new:
+            self._create()
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.EMPTY_TILES_TABLE_NAME} '
+            '(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, '
+            'PRIMARY KEY (zoom_level, tile_column, tile_row))')
+        self.connection.commit()
+
+    @staticmethod
+    def for_file(file_name: str) -> 'TilePyramidWriter':
+        """
+        Returns a suitable writer for a file, based on its extension
+        """
+        if Path(file_name).suffix.lower() == '.gpkg':
+            return GeoPackageTilesWriter(file_name)
+        return MBTilesWriter(file_name)
+
+    def close(self):
+        """
+        Commits any pending tiles and closes the file
+        """
+        self.connection.commit()
+        self.connection.close()
+
+    def commit(self):
+        """
+        Commits the written tiles
+        """
+        self.connection.commit()
+
+    def metadata(self, name: str) -> Optional[str]:
+        """
+        Returns a metadata value
+        """
+        row = self.connection.execute(
+            f'SELECT value FROM {self._metadata_table()} WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_metadata(self, name: str, value: str):
+        """
+        Sets a metadata value
+        """
+        self.connection.execute(
+            f'INSERT OR REPLACE INTO {self._metadata_table()} (name, value) VALUES (?, ?)',
+            (name, value))
+
+    def existing_tiles(self) -> Set[Tile]:
+        """
+        Returns the tiles which have already been written, including
+        transparent tiles
+        """
+        return self._stored_tiles() | set(self.connection.execute(
+            f'SELECT zoom_level, tile_column, tile_row FROM {self.EMPTY_TILES_TABLE_NAME}'))
+
+    def write_tile(self, tile: Tile, data: bytes):
+        """
+        Writes the encoded data for a tile
+        """
+        raise NotImplementedError
+
+    def write_empty_tile(self, tile: Tile):
+        """
+        Records a completely transparent tile, which is not stored
+        """
+        self.connection.execute(
+            f'INSERT OR REPLACE INTO {self.EMPTY_TILES_TABLE_NAME} '
+            '(zoom_level, tile_column, tile_row) VALUES (?, ?, ?)', tile)
+
+    def clear_tiles(self):
+        """
+        Removes all written tiles
+        """
+        self._clear_stored_tiles()
+        self.connection.execute(f'DELETE FROM {self.EMPTY_TILES_TABLE_NAME}')
+
+    def _stored_tiles(self) -> Set[Tile]:
+        """
+        Returns the tiles which are stored in the file
+        """
+        raise NotImplementedError
+
+    def _clear_stored_tiles(self):
+        """
+        Removes all tiles stored in the file
+        """
+        raise NotImplementedError
+
+    def set_bounds(self,
+                   bounds: Tuple[float, float, float, float],
+                   min_zoom: int,
+                   max_zoom: int):
+        """
+        Sets the bounds (in EPSG:3857) and zoom range of the pyramid
+        """
+        raise NotImplementedError
+
+    def _create(self):
+        """
+        Creates the tables for a new file
+        """
+        raise NotImplementedError
+
+    def _metadata_table(self) -> str:
+        """
+        Returns the name of the metadata table
+        """
+        raise NotImplementedError
+
+
+class MBTilesWriter(TilePyramidWriter):
+    """
+    Writes a tile pyramid to an MBTiles file
+    """
+
+    def _create(self):
+        self.connection.executescript("""
+            CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER,
+                                tile_row INTEGER, tile_data BLOB);
+            CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+        """)
+        for name, value in (('name', Path(self.file_name).stem),
+                            ('format', 'png'),
+                            ('type', 'baselayer'),
+                            ('version', '1.1')):
+            self.set_metadata(name, value)
+
+    def _metadata_table(self) -> str:
+        return 'metadata'
+
+    def _stored_tiles(self) -> Set[Tile]:
+        # MBTiles rows are numbered from the south
+        return {(zoom, x, 2 ** zoom - 1 - row) for zoom, x, row in self.connection.execute(
+            'SELECT zoom_level, tile_column, tile_row FROM tiles')}
+
+    def write_tile(self, tile: Tile, data: bytes):
+        zoom, x, y = tile
+        self.connection.execute(
+            'INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) '
+            'VALUES (?, ?, ?, ?)', (zoom, x, 2 ** zoom - 1 - y, sqlite3.Binary(data)))
+
+    def _clear_stored_tiles(self):
+        self.connection.execute('DELETE FROM tiles')
+
+    def set_bounds(self,
+                   bounds: Tuple[float, float, float, float],
+                   min_zoom: int,
+                   max_zoom: int):
+        transform = osr.CoordinateTransformation(_srs(3857), _srs(4326))
+        x_min, y_min, x_max, y_max = bounds
+        lon_min, lat_min = transform.TransformPoint(x_min, y_min)[:2]
+        lon_max, lat_max = transform.TransformPoint(x_max, y_max)[:2]
+
+        self.set_metadata('bounds', f'{lon_min},{lat_min},{lon_max},{lat_max}')
+        self.set_metadata('minzoom', str(min_zoom))
+        self.set_metadata('maxzoom', str(max_zoom))
+
+
+class GeoPackageTilesWriter(TilePyramidWriter):
+    """
+    Writes a tile pyramid to a GeoPackage tiles table, using the
+    GoogleMapsCompatible tile matrix set
+    """
+
+    TABLE_NAME = 'tiles'
+    METADATA_TABLE_NAME = 'soar_pyramid_metadata'
+
+    def _create(self):
+        self.connection.executescript(f"""
+            PRAGMA application_id = 1196444487;
+            PRAGMA user_version = 10200;
+            CREATE TABLE gpkg_spatial_ref_sys (
+                srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,
+                organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL,
+                definition TEXT NOT NULL, description TEXT);
+            CREATE TABLE gpkg_contents (
+                table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,
+                identifier TEXT UNIQUE, description TEXT DEFAULT '',
+                last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+                min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+                srs_id INTEGER);
+            CREATE TABLE gpkg_tile_matrix_set (
+                table_name TEXT NOT NULL PRIMARY KEY, srs_id INTEGER NOT NULL,
+                min_x DOUBLE NOT NULL, min_y DOUBLE NOT NULL,
+                max_x DOUBLE NOT NULL, max_y DOUBLE NOT NULL);
+            CREATE TABLE gpkg_tile_matrix (
+                table_name TEXT NOT NULL, zoom_level INTEGER NOT NULL,
+                matrix_width INTEGER NOT NULL, matrix_height INTEGER NOT NULL,
+                tile_width INTEGER NOT NULL, tile_height INTEGER NOT NULL,
+                pixel_x_size DOUBLE NOT NULL, pixel_y_size DOUBLE NOT NULL,
+                CONSTRAINT pk_ttm PRIMARY KEY (table_name, zoom_level));
+            CREATE TABLE {self.TABLE_NAME} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL, tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL, UNIQUE (zoom_level, tile_column, tile_row));
+            CREATE TABLE {self.METADATA_TABLE_NAME} (name TEXT PRIMARY KEY, value TEXT);
+        """)
+
+        self.connection.executemany(
+            'INSERT INTO gpkg_spatial_ref_sys (srs_name, srs_id, organization, '
+            'organization_coordsys_id, definition, description) VALUES (?, ?, ?, ?, ?, ?)',
+            [('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+             ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+             ('WGS 84 geodetic', 4326, 'EPSG', 4326, _srs(4326).ExportToWkt(), None),
+             ('WGS 84 / Pseudo-Mercator', 3857, 'EPSG', 3857, _srs(3857).ExportToWkt(), None)])
+
+        self.connection.execute(
+            'INSERT INTO gpkg_tile_matrix_set (table_name, srs_id, min_x, min_y, max_x, max_y) '
+            'VALUES (?, 3857, ?, ?, ?, ?)',
+            (self.TABLE_NAME, -WEB_MERCATOR_HALF_EXTENT, -WEB_MERCATOR_HALF_EXTENT,
+             WEB_MERCATOR_HALF_EXTENT, WEB_MERCATOR_HALF_EXTENT))
+
+    def _metadata_table(self) -> str:
+        return self.METADATA_TABLE_NAME
+
+    def _stored_tiles(self) -> Set[Tile]:
+        return set(self.connection.execute(
+            f'SELECT zoom_level, tile_column, tile_row FROM {self.TABLE_NAME}'))
+
+    def write_tile(self, tile: Tile, data: bytes):
+        zoom, x, y = tile
+        self.connection.execute(
+            f'INSERT OR REPLACE INTO {self.TABLE_NAME} '
+            '(zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)',
+            (zoom, x, y, sqlite3.Binary(data)))
+
+    def _clear_stored_tiles(self):
+        self.connection.execute(f'DELETE FROM {self.TABLE_NAME}')
+
+    def set_bounds(self,
+                   bounds: Tuple[float, float, float, float],
+                   min_zoom: int,
+                   max_zoom: int):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO gpkg_contents '
+            '(table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id) '
+            "VALUES (?, 'tiles', ?, ?, ?, ?, ?, 3857)",
+            (self.TABLE_NAME, Path(self.file_name).stem, *bounds))
+
+        self.connection.execute('DELETE FROM gpkg_tile_matrix WHERE table_name = ?',
+                                (self.TABLE_NAME,))
+        for zoom in range(min_zoom, max_zoom + 1):
+            pixel_size = 2 * WEB_MERCATOR_HALF_EXTENT / (TILE_SIZE * 2 ** zoom)
+            self.connection.execute(
+                'INSERT INTO gpkg_tile_matrix (table_name, zoom_level, matrix_width, '
+                'matrix_height, tile_width, tile_height, pixel_x_size, pixel_y_size) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.TABLE_NAME, zoom, 2 ** zoom, 2 ** zoom, TILE_SIZE, TILE_SIZE,
+                 pixel_size, pixel_size))
+
+
+def _srs(epsg: int) -> osr.SpatialReference:
+    """
+    Returns a spatial reference for an EPSG code, using traditional
+    (x = longitude) axis order
+    """
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    try:
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    except AttributeError:
+        # GDAL < 3
+        pass
+    return srs
+
+
+class TilePyramidGenerator:
+    """
+    Generates a web mercator XYZ tile pyramid from a raster in EPSG:3857,
+    writing the tiles into an MBTiles or GeoPackage file.
+
+    Tiles are cut in batches across a pool of worker processes, sized to the
+    number of CPUs by default. Worker processes are always started using the
+    "spawn" method with the Python interpreter (never by forking the QGIS
+    process). If the interpreter can't be found, tiles are cut in a pool of
+    threads instead.
+
+    Generation can be resumed: tiles which already exist in the destination
+    are skipped, unless the destination was created for a different source
+    extent or size.
+    """
+
+    def __init__(self,
+                 source_file_name: str,
+                 destination_file_name: str,
+                 processes: Optional[int] = None):
+        self.source_file_name = source_file_name
+        self.destination_file_name = destination_file_name
+        self.processes = max(1, processes or os.cpu_count() or 1)
+
+        source = gdal.Open(source_file_name)
+        self.source_geotransform = source.GetGeoTransform()
+        self.source_width = source.RasterXSize
+        self.source_height = source.RasterYSize
+        del source
+
+        origin_x, pixel_width, _, origin_y, _, pixel_height = self.source_geotransform
+        self.bounds = (origin_x,
+                       origin_y + pixel_height * self.source_height,
+                       origin_x + pixel_width * self.source_width,
+                       origin_y)
+        self.min_zoom, self.max_zoom = zoom_range_for_source(
+            abs(pixel_width), self.source_width, self.source_height)
+
+    def tiles(self) -> List[Tile]:
+        """
+        Returns all tiles in the pyramid, from the lowest zoom level
+        """
+        tiles = []
+        for zoom in range(self.min_zoom, self.max_zoom + 1):
+            tiles.extend(tiles_for_bounds(self.bounds, zoom))
+        return tiles
+
+    def source_fingerprint(self) -> str:
+        """
+        Returns a string identifying the source extent and size, used to
+        determine whether an existing pyramid can be resumed
+        """
+        return json.dumps([list(self.source_geotransform),
+                           self.source_width, self.source_height])
+
+    def generate(self, feedback=None) -> bool:
+        """
+        Generates the pyramid, blocking until complete.
+
+        The optional feedback object (e.g. a QgsFeedback) is used to report
+        progress and check for cancelation.
+
+        Returns False if generation was canceled.
+        """
+        writer = TilePyramidWriter.for_file(self.destination_file_name)
+        if writer.metadata('soar_source') != self.source_fingerprint():
+            # pyramid for a different export, start afresh
+            writer.clear_tiles()
+            writer.set_metadata('soar_source', self.source_fingerprint())
+        writer.set_bounds(self.bounds, self.min_zoom, self.max_zoom)
+        writer.commit()
+
+        tiles = self.tiles()
+        existing = writer.existing_tiles()
+        remaining = [tile for tile in tiles if tile not in existing]
+        batches = [remaining[i:i + TILE_BATCH_SIZE]
+                   for i in range(0, len(remaining), TILE_BATCH_SIZE)]
+
+        completed = len(tiles) - len(remaining)
+        canceled = False
+
+        with self._executor() as executor:
+            pending: Set[Future] = set()
+            while batches or pending:
+                # limit the number of queued batches, so that results don't pile up in memory
+                while batches and len(pending) < 2 * self.processes:
+                    pending.add(executor.submit(cut_tiles, self.source_file_name,
+                                                batches.pop(0)))
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for tile, data in future.result():
+                        if data is not None:
+                            writer.write_tile(tile, data)
+                        else:
+                            writer.write_empty_tile(tile)
+                        completed += 1
+                    writer.commit()
+
+                if feedback is not None:
+                    feedback.setProgress(100 * completed / len(tiles) if tiles else 100)
+                    if feedback.isCanceled():
+                        canceled = True
+                        for future in pending:
+                            future.cancel()
+                        break
+
+        writer.close()
+        return not canceled
+
+    def _executor(self) -> Executor:
+        """
+        Returns the executor for cutting tiles
+        """
+        context = self._process_context()
+        if context is None:
+            return ThreadPoolExecutor(max_workers=self.processes)
+
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+
+    @staticmethod
+    def _process_context():
+        """
+        Returns the multiprocessing context for the worker processes, or None
+        if the Python interpreter can't be found.
+
+        Forking the QGIS process isn't safe, as it is multithreaded (and this
+        is run from a task thread), so the "spawn" method is always used. The
+        spawn and forkserver methods start sys.executable, which within QGIS
+        is the QGIS executable, so the Python interpreter must be set explicitly.
+        """
+        python = python_executable()
+        if python is None:
+            return None
+
+        context = multiprocessing.get_context('spawn')
+        context.set_executable(python)
+        return context
+
+
+def python_executable() -> Optional[str]:
+    """
+    Returns the path to the Python interpreter, or None if it can't be found
+    """
+    executable = Path(sys.executable)
+    if executable.name.lower().startswith('python'):
+        return str(executable)
+
+    if sys.platform == 'win32':
+        candidates = [Path(sys.exec_prefix) / 'pythonw.exe',
+                      Path(sys.exec_prefix) / 'python.exe']
+    else:
+        version = f'{sys.version_info.major}.{sys.version_info.minor}'
+        candidates = [Path(sys.exec_prefix) / 'bin' / f'python{version}',
+                      Path(sys.exec_prefix) / 'bin' / f'python{sys.version_info.major}']
+
+    for candidate in candidates:
+        if candidate.exists():
+            return str(candidate)
+
+    return None
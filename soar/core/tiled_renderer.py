@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""Tiled map rendering
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import queue
+from collections import deque
+from functools import partial
+from typing import (
+    Deque,
+    List,
+    Optional,
+    Tuple
+)
+
+from osgeo import gdal
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QObject,
+    QRect,
+    QThread,
+    pyqtSignal
+)
+from qgis.PyQt.QtGui import (
+    QImage,
+    QPainter,
+    QPicture
+)
+from qgis.core import (
+    QgsFeedback,
+    QgsMapDecoration,
+    QgsMapRendererParallelJob,
+    QgsMapSettings,
+    QgsRectangle,
+    QgsRenderContext
+)
+
+
+class TiledMapRenderer(QObject):
+    """
+    Renders a map in tiles, writing each tile into a raster dataset as soon
+    as it has been rendered.
+
+    Tiles are rendered concurrently using a bounded number of parallel render
+    jobs, so peak memory use depends on the tile size and number of jobs
+    instead of the size of the map.
+
+    Each tile is rendered with a margin of overlap with its neighbouring tiles,
+    which is cropped away before the tile is written. This allows labels which
+    cross the tile edges to be rendered completely on both sides of the edge.
+
+    Map decorations are recorded once for the whole map, and the part of the
+    recording covering each tile is drawn over the tile.
+
+    The renderer must be created on the main thread, as the render jobs must
+    be prepared there. render() may be called from a background thread (e.g.
+    a QgsTask), in which case only the writing of rendered tiles takes place
+    in that thread.
+    """
+
+    # margin in pixels rendered around each tile
+    LABEL_MARGIN = 256
+
+    # interval in seconds for checking whether rendering has been canceled
+    CANCEL_CHECK_INTERVAL = 0.1
+    # interval in seconds for processing events, when rendering on the main thread
+    MAIN_THREAD_POLL_INTERVAL = 0.01
+
+    # emitted from the rendering thread, to manage the jobs on the main thread
+    _render_requested = pyqtSignal(list)
+    _tile_written = pyqtSignal()
+    _cancel_requested = pyqtSignal()
+
+    def __init__(self,
+                 map_settings: QgsMapSettings,
+                 tile_size: int,
+                 max_parallel_jobs: int,
+                 decorations: Optional[List[QgsMapDecoration]] = None):
+        super().__init__()
+        self.map_settings = map_settings
+        self.tile_size = tile_size
+        self.max_parallel_jobs = max(1, max_parallel_jobs)
+        self.decorations = decorations or []
+
+        # only accessed from the main thread
+        self._pending_tiles: Deque[QRect] = deque()
+        self._active_jobs: List[QgsMapRendererParallelJob] = []
+        # number of tiles which have been started but not yet written
+        self._unwritten_count = 0
+        self._canceled = False
+
+        # rendered tiles, waiting to be written
+        self._rendered_tiles: 'queue.Queue[Tuple[QImage, QRect]]' = queue.Queue()
+
+        self._render_requested.connect(self._start_rendering)
+        self._tile_written.connect(self._tile_was_written)
+        self._cancel_requested.connect(self._cancel_jobs)
+
+    def tiles(self) -> List[QRect]:
+        """
+        Returns the tiles covering the map, in pixels.
+
+        If the tile size is not set, the map is rendered as a single tile.
+        """
+        size = self.map_settings.outputSize()
+        tile_width = self.tile_size if self.tile_size > 0 else size.width()
+        tile_height = self.tile_size if self.tile_size > 0 else size.height()
+
+        tiles = []
+        for y in range(0, size.height(), tile_height):
+            for x in range(0, size.width(), tile_width):
+                tiles.append(QRect(x, y,
+                                   min(tile_width, size.width() - x),
+                                   min(tile_height, size.height() - y)))
+        return tiles
+
+    def render_rect(self, tile: QRect) -> QRect:
+        """
+        Returns the area to render for a tile, including the margin of
+        overlap with neighbouring tiles
+        """
+        size = self.map_settings.outputSize()
+        return tile.adjusted(-self.LABEL_MARGIN, -self.LABEL_MARGIN,
+                             self.LABEL_MARGIN, self.LABEL_MARGIN).intersected(
+            QRect(0, 0, size.width(), size.height()))
+
+    def tile_map_settings(self, render_rect: QRect) -> QgsMapSettings:
+        """
+        Returns the map settings for rendering an area of the map, in pixels
+        """
+        center = self.map_settings.mapToPixel().toMapCoordinates(
+            render_rect.x() + render_rect.width() / 2,
+            render_rect.y() + render_rect.height() / 2)
+        map_units_per_pixel = self.map_settings.mapUnitsPerPixel()
+        half_width = render_rect.width() * map_units_per_pixel / 2
+        half_height = render_rect.height() * map_units_per_pixel / 2
+
+        tile_settings = QgsMapSettings(self.map_settings)
+        tile_settings.setOutputSize(render_rect.size())
+        tile_settings.setExtent(QgsRectangle(center.x() - half_width,
+                                             center.y() - half_height,
+                                             center.x() + half_width,
+                                             center.y() + half_height))
+        return tile_settings
+
+    def render(self,
+               dataset: gdal.Dataset,
+               feedback: Optional[QgsFeedback] = None) -> bool:
+        """
+        Renders the map into a 4 band (RGBA) dataset with the same size as the
+        map, or a 3 band (RGB) dataset with a mask band, blocking until all
+        tiles are written.
+
+        Returns False if rendering was canceled.
+        """
+        tiles = self.tiles()
+        decorations = self._record_decorations() if self.decorations else None
+        on_main_thread = QThread.currentThread() == QCoreApplication.instance().thread()
+
+        self._rendered_tiles = queue.Queue()
+        # when called from a background thread, this is a queued connection
+        # and the jobs are started on the main thread
+        self._render_requested.emit(tiles)
+
+        completed_count = 0
+        while completed_count < len(tiles):
+            if feedback is not None and feedback.isCanceled():
+                self._cancel_requested.emit()
+                return False
+
+            timeout = self.CANCEL_CHECK_INTERVAL
+            if on_main_thread:
+                # finished jobs are delivered via the main thread's event loop
+                QCoreApplication.processEvents()
+                timeout = self.MAIN_THREAD_POLL_INTERVAL
+
+            try:
+                image, tile = self._rendered_tiles.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            if decorations is not None:
+                self._draw_decorations(image, tile, decorations)
+            self._write_tile(dataset, image, tile)
+            del image
+
+            completed_count += 1
+            if feedback is not None:
+                feedback.setProgress(100 * completed_count / len(tiles))
+
+            # the next job is only started once a tile has been written, so that
+            # rendered tiles can't pile up in memory when writing is slow
+            self._tile_written.emit()
+
+        return True
+
+    def _start_rendering(self, tiles: List[QRect]):
+        """
+        Starts rendering a list of tiles.
+
+        Called on the main thread.
+        """
+        self._pending_tiles = deque(tiles)
+        self._unwritten_count = 0
+        self._canceled = False
+        self._start_jobs()
+
+    def _tile_was_written(self):
+        """
+        Called on the main thread after a rendered tile has been written
+        """
+        self._unwritten_count -= 1
+        self._start_jobs()
+
+    def _start_jobs(self):
+        """
+        Starts render jobs for pending tiles, up to the maximum number of parallel jobs.
+
+        Called on the main thread.
+        """
+        while self._pending_tiles and not self._canceled and \
+                self._unwritten_count < self.max_parallel_jobs:
+            tile = self._pending_tiles.popleft()
+            render_rect = self.render_rect(tile)
+
+            job = QgsMapRendererParallelJob(self.tile_map_settings(render_rect))
+            job.finished.connect(partial(self._job_finished, job, tile, render_rect))
+            self._active_jobs.append(job)
+            self._unwritten_count += 1
+            job.start()
+
+    def _cancel_jobs(self):
+        """
+        Cancels all active render jobs.
+
+        Called on the main thread.
+        """
+        self._canceled = True
+        self._pending_tiles.clear()
+        for job in self._active_jobs:
+            job.cancelWithoutBlocking()
+
+    def _job_finished(self,
+                      job: QgsMapRendererParallelJob,
+                      tile: QRect,
+                      render_rect: QRect):
+        """
+        Called on the main thread when the render job for a tile is finished
+        """
+        self._active_jobs.remove(job)
+        job.deleteLater()
+
+        if self._canceled:
+            return
+
+        self._rendered_tiles.put(
+            (job.renderedImage().copy(tile.translated(-render_rect.topLeft())), tile))
+
+    def _record_decorations(self) -> QPicture:
+        """
+        Records the map decorations for the whole map.
+
+        Decorations are positioned using the size of the painter's device, so
+        they are recorded into a picture with the size of the whole map rather
+        than drawn onto each tile.
+        """
+        size = self.map_settings.outputSize()
+        picture = QPicture()
+        picture.setBoundingRect(QRect(0, 0, size.width(), size.height()))
+
+        painter = QPainter(picture)
+        context = QgsRenderContext.fromMapSettings(self.map_settings)
+        context.setPainter(painter)
+        for decoration in self.decorations:
+            decoration.render(self.map_settings, context)
+        painter.end()
+
+        return picture
+
+    @staticmethod
+    def _draw_decorations(image: QImage, tile: QRect, decorations: QPicture):
+        """
+        Draws the part of the recorded map decorations covering a tile over
+        the rendered tile
+        """
+        painter = QPainter(image)
+        painter.translate(-tile.x(), -tile.y())
+        painter.drawPicture(0, 0, decorations)
+        painter.end()
+
+    @staticmethod
+    def _write_tile(dataset: gdal.Dataset, image: QImage, tile: QRect):
+        """
+        Writes a rendered tile into the dataset.
+
+        For 3 band datasets, the tile's alpha channel is written to the
+        dataset's mask band.
+        """
+        image = image.convertToFormat(QImage.Format.Format_RGBA8888)
+        data, line_space = TiledMapRenderer.image_data(image)
+        band_count = min(dataset.RasterCount, 4)
+        dataset.WriteRaster(tile.x(), tile.y(), tile.width(), tile.height(), data,
+                            buf_type=gdal.GDT_Byte,
+                            band_list=list(range(1, band_count + 1)),
+                            buf_pixel_space=4,
+                            buf_line_space=line_space,
+                            buf_band_space=1)
+
+        if band_count == 3:
+            dataset.GetRasterBand(1).GetMaskBand().WriteRaster(
+                tile.x(), tile.y(), tile.width(), tile.height(), data[3:],
+                buf_type=gdal.GDT_Byte,
+                buf_pixel_space=4,
+                buf_line_space=line_space)
+
+    @staticmethod
+    def image_data(image: QImage) -> Tuple[bytes, int]:
+        """
+        Returns the raw data for an image, and the number of bytes per line
+        """
+        return image.constBits().asstring(image.sizeInBytes()), image.bytesPerLine()
@@ -14,13 +14,15 @@ __copyright__ = 'Copyright 2022, North Road'
 __revision__ = '$Format:%H$'
 
 from functools import partial
-from typing import Optional
+from typing import (
+    Dict,
+    Optional
+)
 
 from qgis.PyQt import sip
 from qgis.PyQt.QtCore import (
     QTimer
 )
-from qgis.PyQt.QtNetwork import QNetworkReply
 from qgis.PyQt.QtWidgets import (
     QWidget,
     QVBoxLayout,
@@ -29,8 +31,8 @@ from qgis.PyQt.QtWidgets import (
     QComboBox
 )
 from qgis.core import (
-    QgsNetworkAccessManager,
     QgsProject,
+    QgsSettings,
     QgsCoordinateReferenceSystem,
     QgsCoordinateTransform,
     QgsGeometry,
@@ -52,6 +54,7 @@ from ..core.client import (
     ListingType,
     ListingQuery
 )
+from ..core.tile_grid import snap_extent_to_tile_grid
 
 
 class BrowseWidget(QWidget):
@@ -66,7 +69,7 @@ class BrowseWidget(QWidget):
         self.search_edit.setShowSearchIcon(True)
         self.search_edit.setShowClearButton(True)
         self.search_edit.setPlaceholderText(self.tr('Search'))
-        self.search_edit.textChanged.connect(self._filter_widget_changed)
+        self.search_edit.textChanged.connect(self._search_text_changed)
 
         vl = QVBoxLayout()
         vl.addWidget(self.search_edit)
@@ -96,6 +99,11 @@ class BrowseWidget(QWidget):
         self.restrict_to_map_extent.toggled.connect(self._filter_widget_changed)
         hl.addWidget(self.restrict_to_map_extent)
 
+        self.show_all_footprints = QCheckBox(self.tr('Show all footprints'))
+        self.show_all_footprints.setToolTip(
+            self.tr('Shows the footprints of all listings in the results on the map'))
+        hl.addWidget(self.show_all_footprints)
+
         vl.addLayout(hl)
 
         self.panel_stack = QgsPanelWidgetStack()
@@ -103,6 +111,11 @@ class BrowseWidget(QWidget):
         self.browser = ListingsBrowserWidget()
         self.browser.listing_clicked.connect(self._on_listing_clicked)
 
+        self.show_all_footprints.setChecked(
+            QgsSettings().value('soar/show_all_footprints', False, bool))
+        self.browser.set_show_all_footprints(self.show_all_footprints.isChecked())
+        self.show_all_footprints.toggled.connect(self._show_all_footprints_toggled)
+
         self.panel_stack.setMainPanel(self.browser)
 
         self.listing_details_pane: Optional[ListingDetailsWidget] = None
@@ -119,7 +132,45 @@ class BrowseWidget(QWidget):
 
         iface.mapCanvas().extentsChanged.connect(self._map_extent_changed)
 
-        self._current_listing_reply: Optional[QNetworkReply] = None
+        # id of the listing we are waiting on full details for, before it can be added to the map
+        self._pending_listing_id: Optional[int] = None
+
+        # world extent geometries, by CRS WKT
+        self._world_extents: Dict[str, Optional[QgsGeometry]] = {}
+
+    @staticmethod
+    def snap_aoi_to_tiles() -> bool:
+        """
+        Returns True if map extent filters should be snapped to the web mercator
+        tile grid, so that nearby map views result in identical queries
+        """
+        return QgsSettings().value('soar/snap_aoi_to_tiles', True, bool)
+
+    def _world_extent(self, crs: QgsCoordinateReferenceSystem) -> Optional[QgsGeometry]:
+        """
+        Returns the world extent in the specified CRS, or None if it cannot
+        be calculated.
+
+        Results are cached, as this is an expensive calculation.
+        """
+        key = crs.toWkt()
+        if key in self._world_extents:
+            return self._world_extents[key]
+
+        world_extent = QgsGeometry.fromRect(
+            QgsRectangle(-180, -90, 180, 90)
+        ).densifyByCount(50)
+
+        try:
+            world_extent.transform(
+                QgsCoordinateTransform(QgsCoordinateReferenceSystem('EPSG:4326'),
+                                       crs,
+                                       QgsProject.instance().transformContext()))
+        except QgsCsException:
+            world_extent = None
+
+        self._world_extents[key] = world_extent
+        return world_extent
 
     def _filter_widget_changed(self):
         """
@@ -129,6 +180,24 @@ class BrowseWidget(QWidget):
         # starting lots of queries while a user is mid-operation (such as dragging a slider)
         self._update_query_timeout.start(500)
 
+    def _show_all_footprints_toggled(self, checked: bool):
+        """
+        Triggered when the show all footprints option is toggled
+        """
+        QgsSettings().setValue('soar/show_all_footprints', checked)
+        self.browser.set_show_all_footprints(checked)
+
+    def _search_text_changed(self):
+        """
+        Triggered whenever the search text is changed
+        """
+        # show matches from the listings we've already seen straight away, while
+        # waiting on the server results
+        if self.search_edit.text().strip():
+            self.browser.show_local_matches(self._build_query())
+
+        self._filter_widget_changed()
+
     def _map_extent_changed(self):
         """
         Triggered whenever the map canvas extent is changed
@@ -136,11 +205,24 @@ class BrowseWidget(QWidget):
         if not self.restrict_to_map_extent.isChecked():
             return
 
+        # if the new extent is covered by the listings we've already fetched,
+        # we can filter them immediately without waiting on a new request. The
+        # exact visible area is used, as the snapped area of interest is
+        # identical for views within the same tiles
+        if not self._update_query_timeout.isActive():
+            query = self._build_query(snap_aoi=False)
+            if self.browser.can_filter_locally(query):
+                self.browser.filter_to_aoi(query.aoi)
+                return
+
         self._filter_widget_changed()
 
-    def _update_query(self):
+    def _build_query(self, snap_aoi: bool = True) -> ListingQuery:
         """
-        Updates the listings
+        Builds the listing query corresponding to the current filter settings.
+
+        If snap_aoi is False then the area of interest is the exact visible map
+        area, rather than the area snapped to the tile grid for server queries.
         """
         query = ListingQuery(keywords=self.search_edit.text())
 
@@ -149,9 +231,9 @@ class BrowseWidget(QWidget):
             query.category = category
 
         if self.restrict_to_map_extent.isChecked():
-            target_crs = QgsCoordinateReferenceSystem('EPSG:4326')
-            transform = QgsCoordinateTransform(iface.mapCanvas().mapSettings().destinationCrs(),
-                                               target_crs,
+            destination_crs = iface.mapCanvas().mapSettings().destinationCrs()
+            transform = QgsCoordinateTransform(destination_crs,
+                                               QgsCoordinateReferenceSystem('EPSG:4326'),
                                                QgsProject.instance().transformContext())
 
             visible_polygon = iface.mapCanvas().mapSettings().visiblePolygon()
@@ -160,28 +242,30 @@ class BrowseWidget(QWidget):
             polygon_map = QgsGeometry.fromQPolygonF(visible_polygon)
 
             # we need to intersect the polygon with world extent
-            world_extent_wgs84 = QgsGeometry.fromRect(
-                QgsRectangle(-180, -90, 180, 90)
-            )
-            world_extent_wgs84 = world_extent_wgs84.densifyByCount(50)
-
-            try:
-                wgs84_transform = QgsCoordinateTransform(QgsCoordinateReferenceSystem('EPSG:4326'),
-                                                   iface.mapCanvas().mapSettings().destinationCrs(),
-                                                   QgsProject.instance().transformContext())
-                transformed_world = world_extent_wgs84
-                transformed_world.transform(wgs84_transform)
-                polygon_map = polygon_map.intersection(transformed_world)
-            except QgsCsException:
-                pass
+            world_extent = self._world_extent(destination_crs)
+            if world_extent is not None:
+                polygon_map = polygon_map.intersection(world_extent)
 
             try:
                 polygon_map.transform(transform)
-                query.aoi = polygon_map
             except QgsCsException:
-                pass
+                return query
+
+            if snap_aoi and self.snap_aoi_to_tiles() and not polygon_map.isEmpty():
+                # nearby views share an identical area of interest, so that their
+                # results can be reused from the cache
+                query.aoi = QgsGeometry.fromRect(
+                    snap_extent_to_tile_grid(polygon_map.boundingBox()))
+            else:
+                query.aoi = polygon_map
 
-        self.browser.populate(query)
+        return query
+
+    def _update_query(self):
+        """
+        Updates the listings
+        """
+        self.browser.populate(self._build_query())
 
     def cancel_active_requests(self):
         """
@@ -207,43 +291,41 @@ class BrowseWidget(QWidget):
             if (listing.listing_type == ListingType.TileLayer and not listing.tile_url) or \
                 (listing.listing_type == ListingType.Wms and not listing.server_url):
                 # listing does not have tile/server url, so we need to request it now
-                if self._current_listing_reply is not None and not sip.isdeleted(
-                        self._current_listing_reply):
-                    self._current_listing_reply.abort()
-                    self._current_listing_reply = None
-
-                request = API_CLIENT.request_listing(listing.id)
-                self._current_listing_reply = QgsNetworkAccessManager.instance().get(request)
-                self._current_listing_reply.finished.connect(
-                    partial(self._listing_reply_finished, self._current_listing_reply))
+                if self._pending_listing_id == listing.id:
+                    # already waiting on this listing
+                    return
+
+                self._pending_listing_id = listing.id
+                API_CLIENT.fetch_listing(listing.id,
+                                         partial(self._listing_fetched, listing.id))
                 return
 
-            layer = listing.to_qgis_layer()
-            if layer:
-                QgsProject.instance().addMapLayer(layer)
-                iface.mapCanvas().setReferencedExtent(
-                    QgsReferencedRectangle(layer.extent(), layer.crs())
-                )
+            self._add_layer_for_listing(listing)
 
-    def _listing_reply_finished(self, reply: QNetworkReply):
+    def _add_layer_for_listing(self, listing: Listing):
         """
-        Called on receiving a reply from the listing api
+        Adds a map layer for a fully-populated listing
         """
-        if sip.isdeleted(self):
-            return
+        layer = listing.to_qgis_layer()
+        if layer:
+            QgsProject.instance().addMapLayer(layer)
+            iface.mapCanvas().setReferencedExtent(
+                QgsReferencedRectangle(layer.extent(), layer.crs())
+            )
 
-        if reply != self._current_listing_reply:
-            # an old reply we don't care about anymore
+    def _listing_fetched(self, listing_id: int, listing: Optional[Listing]):
+        """
+        Called when full details for a listing have been fetched
+        """
+        if sip.isdeleted(self):
             return
 
-        self._current_listing_reply = None
-
-        if reply.error() == QNetworkReply.NetworkError.OperationCanceledError:
+        if listing_id != self._pending_listing_id:
+            # an old listing we don't care about anymore
             return
 
-        if reply.error() != QNetworkReply.NetworkError.NoError:
-            print('error occurred :(')
+        self._pending_listing_id = None
+        if listing is None:
             return
 
-        listing = API_CLIENT.parse_listing_reply(reply)
-        self._add_listing_to_map(listing)
+        self._add_layer_for_listing(listing)
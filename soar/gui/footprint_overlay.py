@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Soar plugin
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+from collections import OrderedDict
+from typing import Optional
+
+from qgis.PyQt.QtCore import QObject
+from qgis.PyQt.QtGui import QColor
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsGeometry,
+    QgsProject,
+    QgsWkbTypes
+)
+from qgis.gui import (
+    QgsMapCanvas,
+    QgsRubberBand
+)
+
+from ..core.client import Listing
+
+
+class FootprintOverlay(QObject):
+    """
+    A shared map canvas overlay for highlighting listing footprints.
+
+    A single rubber band is moved between footprints. Footprints are cached
+    after being transformed to the canvas CRS, and the cache is discarded
+    whenever the canvas CRS changes.
+    """
+
+    # maximum number of transformed footprints to cache
+    MAX_CACHED_FOOTPRINTS = 1000
+
+    def __init__(self, canvas: QgsMapCanvas, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.canvas = canvas
+
+        # created on demand, when a footprint is first shown
+        self.rubber_band: Optional[QgsRubberBand] = None
+        self.highlighted_listing: Optional[Listing] = None
+
+        self._transform: Optional[QgsCoordinateTransform] = None
+        # transformed footprints, by listing id
+        self._footprints: 'OrderedDict[int, QgsGeometry]' = OrderedDict()
+
+        self.canvas.destinationCrsChanged.connect(self._destination_crs_changed)
+
+    def __del__(self):
+        if self.rubber_band is not None:
+            self.rubber_band.scene().removeItem(self.rubber_band)
+            del self.rubber_band
+            self.rubber_band = None
+
+    def footprint(self, listing: Listing) -> Optional[QgsGeometry]:
+        """
+        Returns the footprint for a listing in the canvas CRS, or None
+        if the listing has no footprint
+        """
+        footprint = self._footprints.get(listing.id)
+        if footprint is not None:
+            self._footprints.move_to_end(listing.id)
+            return footprint
+
+        if not listing.has_geometry():
+            return None
+
+        if self._transform is None:
+            self._transform = QgsCoordinateTransform(
+                QgsCoordinateReferenceSystem('EPSG:4326'),
+                self.canvas.mapSettings().destinationCrs(),
+                QgsProject.instance()
+            )
+
+        footprint = QgsGeometry(listing.geometry)
+        try:
+            footprint.transform(self._transform)
+        except QgsCsException:
+            return None
+
+        self._footprints[listing.id] = footprint
+        while len(self._footprints) > self.MAX_CACHED_FOOTPRINTS:
+            self._footprints.popitem(last=False)
+
+        return footprint
+
+    def highlight(self, listing: Listing):
+        """
+        Highlights the footprint for a listing, replacing any existing highlight
+        """
+        footprint = self.footprint(listing)
+        if footprint is None:
+            self.clear_highlight()
+            return
+
+        if self.rubber_band is None:
+            self.rubber_band = QgsRubberBand(self.canvas, QgsWkbTypes.GeometryType.PolygonGeometry)
+            self.rubber_band.setWidth(2)
+            self.rubber_band.setColor(QColor(255, 0, 0, 200))
+            self.rubber_band.setFillColor(QColor(255, 0, 0, 40))
+
+        self.rubber_band.setToGeometry(footprint)
+        self.highlighted_listing = listing
+
+    def clear_highlight(self, listing: Optional[Listing] = None):
+        """
+        Clears the highlighted footprint.
+
+        If a listing is specified, the highlight is only cleared if it is
+        showing that listing's footprint.
+        """
+        if listing is not None and (self.highlighted_listing is None or
+                                    self.highlighted_listing.id != listing.id):
+            return
+
+        self.highlighted_listing = None
+        if self.rubber_band is not None:
+            self.rubber_band.reset(QgsWkbTypes.GeometryType.PolygonGeometry)
+
+    def _destination_crs_changed(self):
+        """
+        Called when the canvas CRS changes
+        """
+        self._transform = None
+        self._footprints = OrderedDict()
+
+        if self.highlighted_listing is not None:
+            self.highlight(self.highlighted_listing)
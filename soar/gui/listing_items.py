@@ -18,17 +18,12 @@ from typing import Optional
 from qgis.PyQt.QtCore import (
     Qt,
     QSize,
-    QRect,
     pyqtSignal
 )
 from qgis.PyQt.QtGui import (
     QCursor,
-    QColor,
     QImage,
-    QPixmap,
-    QPainter,
-    QBrush,
-    QPainterPath
+    QPixmap
 )
 from qgis.PyQt.QtWidgets import (
     QFrame,
@@ -37,19 +32,10 @@ from qgis.PyQt.QtWidgets import (
     QHBoxLayout,
     QSizePolicy
 )
-from qgis.core import (
-    QgsProject,
-    QgsGeometry,
-    QgsCoordinateTransform,
-    QgsCoordinateReferenceSystem,
-    QgsWkbTypes
+from .thumbnail_manager import (
+    THUMBNAIL_MANAGER_INSTANCE,
+    download_card_thumbnail
 )
-from qgis.gui import (
-    QgsRubberBand
-)
-from qgis.utils import iface
-
-from .thumbnail_manager import download_thumbnail
 from ..core.client import Listing
 
 
@@ -110,16 +96,22 @@ class ThumbnailWidget(QLabel):
 
 class ListingItemWidget(ListingItemWidgetBase):
     """
-    Shows details for a listing
+    Shows details for a listing.
+
+    Widgets can be rebound to a different listing via set_listing(), so that
+    a small number of widgets can be reused to show many listings.
     """
 
     clicked = pyqtSignal(Listing)
+    # emitted when the mouse enters or leaves the card for a listing
+    entered = pyqtSignal(Listing)
+    left = pyqtSignal(Listing)
 
-    def __init__(self, listing: Listing, parent=None):
+    def __init__(self, listing: Optional[Listing] = None, parent=None):
         super().__init__(parent)
 
         self.setMouseTracking(True)
-        self.listing = listing
+        self.listing: Optional[Listing] = None
 
         hl = QHBoxLayout()
         hl.setContentsMargins(0, 0, 0, 0)
@@ -133,179 +125,140 @@ class ListingItemWidget(ListingItemWidgetBase):
         self.title_label.setWordWrap(True)
         self.title_label.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
 
-        if listing.preview_url:
-            download_thumbnail(listing.preview_url, self)
+        # thumbnails are only requested once the card is close to being visible,
+        # see request_thumbnail()
+        self._thumbnail_requested = False
+        self._has_thumbnail = False
 
         hl.addWidget(self.title_label, 1)
         self.layout().addLayout(hl)
 
-        self.title_label.setText(self.listing.title)
-
         base_style = self.styleSheet()
         base_style += """
             ListingItemWidget:hover {
                 border: 1px solid rgb(180, 180, 180);
                 background: #fcfcfc;
             }
+            ListingItemWidget[selected="true"] {
+                border: 1px solid rgb(255, 160, 0);
+            }
         """
         self.setStyleSheet(base_style)
 
-        if self.listing.geometry:
-            self.footprint = QgsRubberBand(iface.mapCanvas(), QgsWkbTypes.GeometryType.PolygonGeometry)
-            self.footprint.setWidth(2)
-            self.footprint.setColor(QColor(255, 0, 0, 200))
-            self.footprint.setFillColor(QColor(255, 0, 0, 40))
-        else:
-            self.footprint = None
+        self._hovered = False
+        self._selected = False
 
         self.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
 
-    def __del__(self):
-        if self.footprint is not None:
-            self.footprint.scene().removeItem(self.footprint)
-            del self.footprint
-            self.footprint = None
+        self.set_listing(listing)
 
     # QWidget interface
     # pylint: disable=missing-function-docstring,unused-argument
     def mousePressEvent(self, event):
-        if event.button() == Qt.MouseButton.LeftButton:
+        if event.button() == Qt.MouseButton.LeftButton and self.listing is not None:
             self.clicked.emit(self.listing)
         else:
             super().mousePressEvent(event)
 
     def enterEvent(self, event):
-        if self.footprint is not None:
-            self._show_footprint()
+        self._hovered = True
+        if self.listing is not None:
+            self.entered.emit(self.listing)
 
     def leaveEvent(self, event):
-        if self.footprint is not None:
-            self._hide_footprint()
+        self._hovered = False
+        if self.listing is not None:
+            self.left.emit(self.listing)
 
     # pylint: enable=missing-function-docstring,unused-argument
 
-    def set_thumbnail(self, img: Optional[QImage]):
+    def set_listing(self, listing: Optional[Listing]):
         """
-        Sets the item thumbnail
+        Binds the widget to a listing, replacing any previously shown listing.
+
+        Any pending thumbnail for the previous listing is discarded, unless the
+        new listing is a refreshed copy of the same listing with the same preview.
         """
-        thumbnail = self.process_thumbnail(img)
+        if listing is not None and self.listing is not None and \
+                listing.id == self.listing.id and listing.preview_url == self.listing.preview_url:
+            self.listing = listing
+            self.title_label.setText(listing.title)
+            return
 
-        try:
-            dpi_ratio = self.screen().devicePixelRatio()
-        except AttributeError:
-            # requires Qt 5.14+
-            dpi_ratio = 1
-        width = int(thumbnail.width() / dpi_ratio)
-        height = int(thumbnail.height() / dpi_ratio)
+        if self._thumbnail_requested and not self._has_thumbnail:
+            THUMBNAIL_MANAGER_INSTANCE.release_widget(self)
+        if self._hovered and self.listing is not None:
+            self.left.emit(self.listing)
 
-        self.thumbnail_widget.setFixedSize(QSize(width, height))
-        self.thumbnail_widget.setPixmap(QPixmap.fromImage(thumbnail))
+        self.listing = listing
+        self._thumbnail_requested = False
+        self._has_thumbnail = False
+
+        self.thumbnail_widget.clear()
+        self.thumbnail_widget.setFixedSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE)
+        self.title_label.setText(listing.title if listing is not None else '')
+
+        if self._hovered and listing is not None:
+            self.entered.emit(listing)
 
-    def process_thumbnail(self, img: Optional[QImage]) -> QImage:
+    def set_selected(self, selected: bool):
         """
-        Processes a listing's thumbnail for pretty display
+        Sets whether the card is shown as selected
         """
-        # sizes here account for borders, hence height is + 2
-        size = QSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE + 2)
+        if selected == self._selected:
+            return
+
+        self._selected = selected
+        self.setProperty('selected', selected)
+        # refresh the style, so that the selected state is applied
+        self.style().unpolish(self)
+        self.style().polish(self)
 
-        image_size = size
+    def device_pixel_ratio(self) -> float:
+        """
+        Returns the device pixel ratio for the widget's screen
+        """
         try:
-            scale_factor = self.screen().devicePixelRatio()
+            return self.screen().devicePixelRatio()
         except AttributeError:
-            # Requires qt 5.14+
-            scale_factor = 1
-
-        if scale_factor > 1:
-            image_size *= scale_factor
-
-        target = QImage(image_size, QImage.Format.Format_ARGB32)
-        target.fill(Qt.GlobalColor.transparent)
-
-        painter = QPainter(target)
-
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
-        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
-
-        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
-
-        painter.setPen(Qt.PenStyle.NoPen)
-        painter.setBrush(QBrush(QColor(255, 0, 0)))
-
-        path = QPainterPath()
-        path.moveTo(self.THUMBNAIL_CORNER_RADIUS, 0)
-        path.lineTo(size.width(), 0)
-        path.lineTo(size.width(), size.height())
-        path.lineTo(self.THUMBNAIL_CORNER_RADIUS, size.height())
-        path.arcTo(0,
-                   size.height() - self.THUMBNAIL_CORNER_RADIUS * 2,
-                   self.THUMBNAIL_CORNER_RADIUS * 2,
-                   self.THUMBNAIL_CORNER_RADIUS * 2,
-                   270, -90
-                   )
-        path.lineTo(0, self.THUMBNAIL_CORNER_RADIUS)
-        path.arcTo(0,
-                   0,
-                   self.THUMBNAIL_CORNER_RADIUS * 2,
-                   self.THUMBNAIL_CORNER_RADIUS * 2,
-                   180, -90
-                   )
-
-        painter.drawPath(path)
-        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceIn)
-
-        if img is not None:
-            resized = img.scaled(image_size.width(),
-                                 image_size.height(),
-                                 Qt.AspectRatioMode.KeepAspectRatioByExpanding,
-                                 Qt.TransformationMode.SmoothTransformation)
-            if resized.width() > image_size.width():
-                left = int((resized.width() - image_size.width()) / 2)
-            else:
-                left = 0
-            if resized.height() > image_size.height():
-                top = int((resized.height() - image_size.height()) / 2)
-            else:
-                top = 0
-
-            cropped = resized.copy(QRect(left, top, image_size.width(), image_size.height()))
-            painter.drawImage(0, 0, cropped)
-        else:
-            painter.setBrush(QBrush(QColor('#cccccc')))
-            painter.setPen(Qt.PenStyle.NoPen)
-            painter.drawRect(0, 0, 600, 600)
-        painter.end()
-
-        target.setDevicePixelRatio(scale_factor)
-        target.setDotsPerMeterX(
-            int(target.dotsPerMeterX() * scale_factor))
-        target.setDotsPerMeterY(int(
-            target.dotsPerMeterY() * scale_factor))
-        base = target
-
-        return base
+            # requires Qt 5.14+
+            return 1
 
-    def extent_in_map_crs(self) -> QgsGeometry:
+    def thumbnail_requested(self) -> bool:
         """
-        Gets the listing's extent in the map canvas CRS
+        Returns True if the card's thumbnail has been requested
         """
-        geom = QgsGeometry(self.listing.geometry)
-        transform = QgsCoordinateTransform(
-            QgsCoordinateReferenceSystem("EPSG:4326"),
-            iface.mapCanvas().mapSettings().destinationCrs(),
-            QgsProject.instance(),
-        )
-        geom.transform(transform)
-        return geom
+        return self._thumbnail_requested
 
-    def _show_footprint(self):
+    def request_thumbnail(self, priority: float):
         """
-        Shows the listing's footprint
+        Requests the card's thumbnail, or updates the priority of an existing
+        request. Lower priority values are downloaded first.
         """
-        self.footprint.setToGeometry(self.extent_in_map_crs())
+        if self.listing is None or not self.listing.preview_url or self._has_thumbnail:
+            return
 
-    def _hide_footprint(self):
+        if self._thumbnail_requested:
+            THUMBNAIL_MANAGER_INSTANCE.set_priority(self.listing.preview_url, priority)
+            return
+
+        self._thumbnail_requested = True
+        # sizes here account for borders, hence height is + 2
+        download_card_thumbnail(self.listing.preview_url, self,
+                                QSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE + 2),
+                                self.THUMBNAIL_CORNER_RADIUS,
+                                self.device_pixel_ratio(),
+                                priority)
+
+    def set_thumbnail(self, thumbnail: QImage):
         """
-        Hides the listing's footprint
+        Sets the item thumbnail, which must already be rendered as a
+        card thumbnail
         """
-        self.footprint.reset(QgsWkbTypes.GeometryType.PolygonGeometry)
+        dpi_ratio = thumbnail.devicePixelRatio()
+        width = int(thumbnail.width() / dpi_ratio)
+        height = int(thumbnail.height() / dpi_ratio)
+
+        self.thumbnail_widget.setFixedSize(QSize(width, height))
+        self.thumbnail_widget.setPixmap(QPixmap.fromImage(thumbnail))
+        self._has_thumbnail = True
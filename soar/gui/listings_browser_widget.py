@@ -13,13 +13,21 @@ __copyright__ = 'Copyright 2022, North Road'
 # This will get replaced with a git SHA1 when you do a git archive
 __revision__ = '$Format:%H$'
 
-import math
+import copy
+import json
+from collections import OrderedDict
 from functools import partial
-from typing import Optional
+from typing import (
+    Optional,
+    List,
+    Dict
+)
 
 from qgis.PyQt import sip
 from qgis.PyQt.QtCore import (
     Qt,
+    QElapsedTimer,
+    QTimer,
     pyqtSignal
 )
 from qgis.PyQt.QtGui import (
@@ -34,22 +42,45 @@ from qgis.PyQt.QtWidgets import (
     QVBoxLayout,
     QSizePolicy
 )
-from qgis.core import QgsNetworkAccessManager
+from qgis.core import (
+    QgsGeometry,
+    QgsNetworkAccessManager,
+    QgsSettings
+)
 from qgis.gui import (
     QgsScrollArea,
     QgsPanelWidget
 )
+from qgis.utils import iface
 
 
+from .footprint_overlay import FootprintOverlay
 from .responsive_table_layout import ResponsiveTableWidget
+from .result_footprints_layer import ResultFootprintsLayer
 
 from ..core.client import (
     API_CLIENT,
     Listing,
     ListingQuery
 )
+from ..core.footprint_index import ListingFootprintIndex
+from ..core.search_index import ListingSearchIndex
 
 PAGE_SIZE = 20
+DEFAULT_PREFETCH_DEPTH = 1
+
+# page sizes used for automatically loaded pages are adapted between these limits
+MIN_PAGE_SIZE = PAGE_SIZE
+MAX_PAGE_SIZE = 100
+# automatically loaded pages are sized so that they take around this long to load and show
+TARGET_PAGE_LOAD_MS = 500
+# the next page is automatically loaded when scrolled within this many viewport heights of the end
+INFINITE_SCROLL_THRESHOLD_VIEWPORTS = 1
+DEFAULT_INFINITE_SCROLL_MAX_LISTINGS = 500
+# thumbnails are requested for cards within this many viewport heights of the visible area
+THUMBNAIL_PREFETCH_VIEWPORTS = 1
+# number of recent result pages kept for showing while similar queries are refreshed
+MAX_RECENT_RESULTS = 20
 
 
 class ListingsBrowserWidget(QgsPanelWidget):
@@ -75,6 +106,17 @@ class ListingsBrowserWidget(QgsPanelWidget):
 
         self.table_widget = ResponsiveTableWidget()
         self.table_widget.listing_clicked.connect(self.listing_clicked)
+
+        # footprints of hovered cards are shown on the map using a single shared overlay
+        self.footprint_overlay = FootprintOverlay(iface.mapCanvas(), self)
+        self.table_widget.listing_entered.connect(self.footprint_overlay.highlight)
+        self.table_widget.listing_left.connect(self.footprint_overlay.clear_highlight)
+
+        # optional map layer showing the footprints of all listings in the results,
+        # with selection synced between the map and the cards
+        self.footprints_layer = ResultFootprintsLayer(iface.mapCanvas(), self)
+        self.footprints_layer.selection_changed.connect(self._footprint_selection_changed)
+        self.table_widget.listing_clicked.connect(self.footprints_layer.select_listing)
         self.scroll_area.setWidget(self.table_widget)
 
         layout.addWidget(self.scroll_area)
@@ -89,8 +131,144 @@ class ListingsBrowserWidget(QgsPanelWidget):
         self._load_more_widget = None
         self._no_records_widget = None
         self._listings = []
+        self._current_offset = 0
+        self._current_limit = PAGE_SIZE
+        self._page_listing_count = 0
+        self._has_more_pages = False
+
+        # page size for automatically loaded pages, adapted to how quickly pages are shown
+        self._auto_page_size = PAGE_SIZE
+        # number of listings fetched when automatic loading was last (re)started
+        self._auto_load_start_count = 0
+        self._page_timer = QElapsedTimer()
+        self._page_from_network = False
+
+        # footprints of all fetched listings, for local filtering by area of interest
+        self._footprint_index = ListingFootprintIndex()
+        # area of interest used to locally filter fetched listings, if set
+        self._local_aoi: Optional[QgsGeometry] = None
+        self._visible_listing_count = 0
+
+        # text index of all listings seen this session, for instant local searches
+        self.search_index = ListingSearchIndex()
+        # provisional results (local search matches or the results of a previous
+        # identical or similar query) which are shown while waiting on the server
+        # results, or None if the table is showing the current results
+        self._provisional_listings: Optional[List[Listing]] = None
+        # server results received while provisional results are shown
+        self._pending_listings: List[Listing] = []
+        # first page of results for recent queries, by non-spatial query parameters
+        self._recent_results: 'OrderedDict[str, List[Listing]]' = OrderedDict()
+
+        # speculatively fetched pages of results, by offset
+        self._prefetch_replies: Dict[int, QNetworkReply] = {}
+        self._prefetched_pages: Dict[int, List[Listing]] = {}
+        self._waiting_for_prefetch_offset: Optional[int] = None
+
+        # thumbnail priorities are updated after a short delay, so that
+        # they aren't recalculated continuously while scrolling
+        self._thumbnail_priority_timer = QTimer(self)
+        self._thumbnail_priority_timer.setSingleShot(True)
+        self._thumbnail_priority_timer.setInterval(50)
+        self._thumbnail_priority_timer.timeout.connect(self._update_thumbnail_priorities)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(
+            self._thumbnail_priority_timer.start)
+        self.scroll_area.verticalScrollBar().rangeChanged.connect(
+            self._thumbnail_priority_timer.start)
+        # cards are rebound to different listings as the table is scrolled
+        self.table_widget.visible_widgets_changed.connect(
+            self._thumbnail_priority_timer.start)
+
+        # the scroll position is checked after a short delay, so that the
+        # table has been laid out after new results are added
+        self._infinite_scroll_timer = QTimer(self)
+        self._infinite_scroll_timer.setSingleShot(True)
+        self._infinite_scroll_timer.setInterval(50)
+        self._infinite_scroll_timer.timeout.connect(self._check_infinite_scroll)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(
+            self._infinite_scroll_timer.start)
+        self.scroll_area.verticalScrollBar().rangeChanged.connect(
+            self._infinite_scroll_timer.start)
+
         self.setMinimumWidth(370)
 
+    @staticmethod
+    def prefetch_depth() -> int:
+        """
+        Returns the number of pages of results to fetch in advance.
+
+        A depth of 0 disables prefetching.
+        """
+        return QgsSettings().value('soar/prefetch_depth', DEFAULT_PREFETCH_DEPTH, int)
+
+    @staticmethod
+    def infinite_scroll_enabled() -> bool:
+        """
+        Returns True if more results should be automatically loaded when
+        scrolling to the end of the results.
+
+        This is disabled by default. When enabled, pages are not prefetched,
+        so that there is at most one request for results in progress.
+        """
+        return QgsSettings().value('soar/infinite_scroll', False, bool)
+
+    @staticmethod
+    def infinite_scroll_max_listings() -> int:
+        """
+        Returns the maximum number of listings to automatically load before
+        the user must explicitly request more results
+        """
+        return QgsSettings().value('soar/infinite_scroll_max_listings',
+                                   DEFAULT_INFINITE_SCROLL_MAX_LISTINGS, int)
+
+    def set_show_all_footprints(self, show: bool):
+        """
+        Sets whether the footprints of all listings in the results should be
+        shown in a map canvas layer
+        """
+        self.footprints_layer.set_enabled(show)
+
+    def _footprint_selection_changed(self, listing_ids: List[int]):
+        """
+        Called when listing footprints are selected on the map
+        """
+        self.table_widget.set_selected_listings(listing_ids)
+        if not listing_ids:
+            return
+
+        rect = self.table_widget.listing_rect(listing_ids[0])
+        if rect is not None:
+            self.scroll_area.ensureVisible(rect.center().x(), rect.center().y(),
+                                           0, int(rect.height() / 2))
+
+    def _update_thumbnail_priorities(self):
+        """
+        Requests thumbnails for cards which are visible or close to the visible
+        area, prioritized by their distance from the visible area
+        """
+        viewport_height = self.scroll_area.viewport().height()
+        if viewport_height <= 0:
+            return
+
+        visible_top = self.scroll_area.verticalScrollBar().value()
+        visible_bottom = visible_top + viewport_height
+        max_distance = viewport_height * THUMBNAIL_PREFETCH_VIEWPORTS
+
+        for widget in self.table_widget.listing_widgets():
+            geometry = widget.geometry()
+            if geometry.bottom() < visible_top:
+                distance = visible_top - geometry.bottom()
+            elif geometry.top() > visible_bottom:
+                distance = geometry.top() - visible_bottom
+            else:
+                distance = 0
+
+            if distance > max_distance and not widget.thumbnail_requested():
+                continue
+
+            # cards further from the visible area are given lower priority
+            widget.request_thumbnail(distance / viewport_height)
+
     def cancel_active_requests(self):
         """
         Cancels any active request
@@ -100,34 +278,154 @@ class ListingsBrowserWidget(QgsPanelWidget):
             self._current_reply.abort()
 
         self._current_reply = None
+        self.cancel_prefetch()
+
+    def cancel_prefetch(self):
+        """
+        Cancels any in-progress prefetch requests and discards prefetched pages
+        """
+        replies = list(self._prefetch_replies.values())
+        self._prefetch_replies = {}
+        self._prefetched_pages = {}
+        self._waiting_for_prefetch_offset = None
+
+        for reply in replies:
+            if not sip.isdeleted(reply):
+                reply.abort()
 
-    def _create_temporary_items_for_page(self):
+    def _create_temporary_items_for_page(self, count: int = PAGE_SIZE):
         """
         Adds temporary items ready for the next page of results
         """
-        for _ in range(PAGE_SIZE):
+        for _ in range(count):
             self.table_widget.push_empty_widget()
 
+    def show_local_matches(self, query: ListingQuery):
+        """
+        Immediately shows the ranked matches for a query from the listings which
+        have already been seen this session.
+
+        The local matches are shown until the results for the query are received
+        from the server via populate(), at which point the server results
+        are merged in.
+        """
+        matches = self.search_index.search(query.keywords or '')
+
+        if query.category:
+            matches = [listing for listing in matches
+                       if query.category in (listing.categories or [])]
+
+        if query.aoi is not None and not query.aoi.isEmpty():
+            matches = ListingFootprintIndex.filter_listings(matches, query.aoi)
+
+        matches = matches[:PAGE_SIZE]
+        if not matches:
+            return
+
+        # results from any earlier query are no longer wanted
+        self.cancel_active_requests()
+
+        self.table_widget.setUpdatesEnabled(False)
+        self._remove_trailing_widgets()
+        self._show_provisional_listings(matches)
+        self.table_widget.setUpdatesEnabled(True)
+        self.scroll_area.verticalScrollBar().setValue(0)
+
+        self.visible_count_changed.emit(len(matches))
+
+    def _previous_results(self, query: ListingQuery) -> Optional[List[Listing]]:
+        """
+        Returns the last known results for an identical or similar query, if
+        available.
+
+        Cached results for an identical query are used even if they have expired.
+        Otherwise, the recent results for a query with the same non-spatial
+        parameters are filtered to the query's area of interest.
+        """
+        page_query = copy.copy(query)
+        page_query.limit = PAGE_SIZE
+        page_query.offset = 0
+        listings = API_CLIENT.cached_listings(page_query, allow_stale=True)
+        if listings:
+            return listings
+
+        listings = self._recent_results.get(self._recent_results_key(query))
+        if listings and query.aoi is not None and not query.aoi.isEmpty():
+            listings = ListingFootprintIndex.filter_listings(listings, query.aoi)
+
+        return listings or None
+
+    @staticmethod
+    def _recent_results_key(query: ListingQuery) -> str:
+        """
+        Returns the key for storing the recent results for a query
+        """
+        return json.dumps(ListingsBrowserWidget._non_spatial_parameters(query),
+                          sort_keys=True)
+
+    def _show_provisional_listings(self, listings: List[Listing]):
+        """
+        Shows provisional listings in the table, until the server results are received
+        """
+        self.table_widget.set_listings(listings)
+        self.footprints_layer.clear()
+        self.footprints_layer.add_listings(listings)
+        self._provisional_listings = listings
+        self._pending_listings = []
+        self._thumbnail_priority_timer.start()
+
+    def _remove_trailing_widgets(self):
+        """
+        Removes the load more and no records widgets from the table
+        """
+        if self._load_more_widget:
+            self.table_widget.remove_widget(self._load_more_widget)
+        if self._no_records_widget:
+            self.table_widget.remove_widget(self._no_records_widget)
+        self._load_more_widget = None
+        self._no_records_widget = None
+
     def populate(self, query: ListingQuery):
         """
         Populates the widget using a query
         """
         self.table_widget.setUpdatesEnabled(False)
-        self.table_widget.clear()
+        previous_results = None
+        if self._provisional_listings is None:
+            previous_results = self._previous_results(query)
+
+        if self._provisional_listings is not None or previous_results:
+            # keep showing provisional results, the differences from the server
+            # results will be applied once they are received
+            self._remove_trailing_widgets()
+            if previous_results:
+                self._show_provisional_listings(previous_results)
+            self._pending_listings = []
+        else:
+            self.table_widget.clear()
+            self.footprints_layer.clear()
 
         self._listings = []
-        self._create_temporary_items_for_page()
+        self._footprint_index = ListingFootprintIndex(query.aoi)
+        self._local_aoi = None
+        self._visible_listing_count = 0
+        self._has_more_pages = False
+        self._auto_load_start_count = 0
+        if self._provisional_listings is None:
+            self._create_temporary_items_for_page()
         self.table_widget.setUpdatesEnabled(True)
 
         self._load_more_widget = None
         self._no_records_widget = None
 
         self.visible_count_changed.emit(-1)
+        self.cancel_prefetch()
         self._fetch_records(query)
 
     def _fetch_records(self,
                        query: Optional[ListingQuery] = None,
-                       page: int = 1):
+                       offset: int = 0,
+                       limit: int = PAGE_SIZE):
         """
         Fetches a page of records
         """
@@ -135,22 +433,66 @@ class ListingsBrowserWidget(QgsPanelWidget):
             self._current_reply.abort()
             self._current_reply = None
 
-        if page == 1:
+        if offset == 0:
             # scroll to top on new search
             self.scroll_area.verticalScrollBar().setValue(0)
 
         if query is None:
             query = self._current_query
 
-        query.limit = PAGE_SIZE
-        query.offset = PAGE_SIZE * (page - 1)
+        query.limit = limit
+        query.offset = offset
         self._current_query = query
 
+        self._current_offset = offset
+        self._current_limit = limit
+        self._page_listing_count = 0
+        self._waiting_for_prefetch_offset = None
+        self._page_from_network = False
+        self._page_timer.start()
+
+        if offset in self._prefetched_pages:
+            self._push_listings(self._prefetched_pages.pop(offset))
+            self._page_finished()
+            return
+
+        if offset in self._prefetch_replies:
+            # page is already being fetched in the background, just wait for it
+            self._waiting_for_prefetch_offset = offset
+            self.setCursor(Qt.CursorShape.WaitCursor)
+            return
+
+        cached_listings = API_CLIENT.cached_listings(query)
+        if cached_listings is not None:
+            self._push_listings(cached_listings)
+            self._page_finished()
+            return
+
+        self._page_from_network = True
+
         request = API_CLIENT.request_listings(query)
         self._current_reply = QgsNetworkAccessManager.instance().get(request)
-        self._current_reply.finished.connect(partial(self._reply_finished, self._current_reply))
+
+        # listings are parsed incrementally, so that cards can be filled
+        # progressively as the reply arrives
+        stream = API_CLIENT.stream_listings_reply(self._current_reply)
+        stream.listing_received.connect(partial(self._listing_received, self._current_reply))
+        stream.finished.connect(partial(self._reply_finished, self._current_reply))
         self.setCursor(Qt.CursorShape.WaitCursor)
 
+    def _listing_received(self, reply: QNetworkReply, listing: Listing):
+        """
+        Called when a single listing has been received from the listings api
+        """
+        if sip.isdeleted(self):
+            return
+
+        if reply != self._current_reply:
+            # an old reply we don't care about anymore
+            return
+
+        self._push_listings([listing])
+
     def _reply_finished(self, reply: QNetworkReply):
         """
         Called on receiving a reply from the listings api
@@ -171,49 +513,320 @@ class ListingsBrowserWidget(QgsPanelWidget):
             print('error occurred :(')
             return
 
-        listings = API_CLIENT.parse_listings_reply(reply)
+        self._page_finished()
+
+    def _push_listings(self, listings: List[Listing]):
+        """
+        Pushes fetched listings to the table, filling placeholder cards
+        """
+        start = len(self._footprint_index)
+        self._footprint_index.add_listings(listings)
+        self.search_index.add_listings(listings)
+        self._listings.extend(listings)
+        self._page_listing_count += len(listings)
+
+        if self._provisional_listings is not None:
+            # applied to the table when the page is finished
+            self._pending_listings.extend(listings)
+            return
+
+        if self._local_aoi is not None:
+            listings = self._footprint_index.intersecting(self._local_aoi, start)
 
         self.table_widget.setUpdatesEnabled(False)
 
         for listing in listings:
             self.table_widget.push_listing(listing)
 
-        self._listings.extend(listings)
-        self.visible_count_changed.emit(len(self._listings))
+        self.footprints_layer.add_listings(listings)
+        self._visible_listing_count += len(listings)
+        self.visible_count_changed.emit(self._visible_listing_count)
+        self._thumbnail_priority_timer.start()
+
+        self.table_widget.setUpdatesEnabled(True)
+
+    @staticmethod
+    def _non_spatial_parameters(query: ListingQuery) -> dict:
+        """
+        Returns the query parameters for a query, excluding the area of interest
+        and paging parameters
+        """
+        params = query.to_query_parameters()
+        for param in ('aoi', 'limit', 'offset'):
+            params.pop(param, None)
+        return params
+
+    def can_filter_locally(self, query: ListingQuery) -> bool:
+        """
+        Returns True if the results for a query can be determined by filtering
+        the already fetched listings by the query's area of interest, without
+        requesting new results from the server
+        """
+        if self._current_query is None:
+            return False
+
+        if self._non_spatial_parameters(query) != \
+                self._non_spatial_parameters(self._current_query):
+            return False
+
+        return self._footprint_index.covers(query.aoi)
+
+    def filter_to_aoi(self, aoi: Optional[QgsGeometry]):
+        """
+        Filters the fetched listings to those intersecting an area of interest
+        (in EPSG:4326), without requesting new results from the server.
+
+        The area of interest must be covered by the current query, see can_filter_locally().
+        """
+        self._local_aoi = aoi if aoi is not None and not aoi.isEmpty() else None
+
+        listings = self._footprint_index.intersecting(self._local_aoi)
+
+        # only the differences from the currently shown results are applied,
+        # so that cards and footprints of listings which remain visible are kept
+        self.table_widget.setUpdatesEnabled(False)
+        self._remove_trailing_widgets()
+        self._provisional_listings = None
+        self._pending_listings = []
+
+        self.table_widget.set_listings(listings)
+        self.footprints_layer.set_listings(listings)
+
+        self._visible_listing_count = len(listings)
+        self.visible_count_changed.emit(self._visible_listing_count)
+        self._thumbnail_priority_timer.start()
+
+        if self._current_reply is not None or self._waiting_for_prefetch_offset is not None:
+            # still waiting on a page of results
+            self._create_temporary_items_for_page(self._current_limit)
+        else:
+            self._update_trailing_widgets()
+            if self._has_more_pages:
+                # load more results if the filtered results don't fill the view
+                self._infinite_scroll_timer.start()
+
+        self.table_widget.setUpdatesEnabled(True)
+
+    def _page_finished(self):
+        """
+        Called when a page of listings has been completely fetched, either from the
+        listings api or the local cache
+        """
+        self.table_widget.setUpdatesEnabled(False)
 
         self.setCursor(Qt.CursorShape.ArrowCursor)
-        self.table_widget.remove_empty_widgets()
 
-        finished = len(listings) < PAGE_SIZE
-        if not finished and not self._load_more_widget:
+        if self._provisional_listings is not None:
+            self._apply_pending_listings()
+        else:
+            self.table_widget.remove_empty_widgets()
+
+        if self._current_offset == 0:
+            self._store_recent_results(self._current_query, self._listings)
+
+        self._has_more_pages = self._page_listing_count >= self._current_limit
+        self._update_trailing_widgets()
+
+        self.table_widget.setUpdatesEnabled(True)
+
+        if self._page_from_network and self._page_listing_count:
+            self._adapt_page_size(self._page_timer.elapsed())
+
+        if not self._has_more_pages:
+            return
+
+        if self.infinite_scroll_enabled():
+            self._infinite_scroll_timer.start()
+        else:
+            self._prefetch_pages()
+
+    def _apply_pending_listings(self):
+        """
+        Replaces the provisional listings with the received server results,
+        updating only the cards which differ
+        """
+        listings = self._pending_listings
+        listing_ids = {listing.id for listing in listings}
+        for listing in self._provisional_listings:
+            if listing.id not in listing_ids:
+                self.footprints_layer.remove_listing(listing)
+
+        self._provisional_listings = None
+        self._pending_listings = []
+
+        self.table_widget.set_listings(listings)
+        self.footprints_layer.add_listings(listings)
+
+        self._visible_listing_count = len(listings)
+        self.visible_count_changed.emit(self._visible_listing_count)
+        self._thumbnail_priority_timer.start()
+
+    def _store_recent_results(self, query: ListingQuery, listings: List[Listing]):
+        """
+        Stores the first page of results for a query, for showing while
+        similar queries are refreshed
+        """
+        key = self._recent_results_key(query)
+        self._recent_results[key] = list(listings)
+        self._recent_results.move_to_end(key)
+        while len(self._recent_results) > MAX_RECENT_RESULTS:
+            self._recent_results.popitem(last=False)
+
+    def _adapt_page_size(self, elapsed_ms: int):
+        """
+        Adapts the size of automatically loaded pages to the time taken to
+        load and show the last page, so that each page is shown promptly
+        """
+        ms_per_listing = max(1, elapsed_ms) / self._page_listing_count
+        target_size = int(TARGET_PAGE_LOAD_MS / ms_per_listing)
+        # move halfway towards the target size, to avoid oscillating between sizes
+        page_size = int((self._auto_page_size + target_size) / 2)
+        self._auto_page_size = max(MIN_PAGE_SIZE, min(MAX_PAGE_SIZE, page_size))
+
+    def _auto_loading_capped(self) -> bool:
+        """
+        Returns True if the maximum number of automatically loaded listings
+        has been reached
+        """
+        return len(self._listings) - self._auto_load_start_count >= \
+            self.infinite_scroll_max_listings()
+
+    def _check_infinite_scroll(self):
+        """
+        Automatically loads the next page of results if the scroll position
+        is close to the end of the results
+        """
+        if not self._has_more_pages or not self.infinite_scroll_enabled():
+            return
+
+        if self._current_reply is not None or self._waiting_for_prefetch_offset is not None:
+            # only one request for results may be in progress at a time
+            return
+
+        if self._auto_loading_capped():
+            return
+
+        scroll_bar = self.scroll_area.verticalScrollBar()
+        threshold = self.scroll_area.viewport().height() * INFINITE_SCROLL_THRESHOLD_VIEWPORTS
+        if scroll_bar.maximum() - scroll_bar.value() > threshold:
+            return
+
+        self._load_next_page(self._auto_page_size)
+
+    def _update_trailing_widgets(self):
+        """
+        Updates the "load more" and "no records" items shown after the listings
+        """
+        show_load_more = self._has_more_pages and (
+            not self.infinite_scroll_enabled() or self._auto_loading_capped())
+
+        if show_load_more and not self._load_more_widget:
             self._load_more_widget = LoadMoreItemWidget()
             self._load_more_widget.load_more.connect(self.load_more)
 
             self.table_widget.push_widget(self._load_more_widget)
 
-        elif finished and self._load_more_widget:
+        elif not show_load_more and self._load_more_widget:
             self.table_widget.remove_widget(self._load_more_widget)
             self._load_more_widget = None
 
-        if not self._listings and not self._no_records_widget:
+        # when more pages can be loaded, listings which match may still be
+        # found on those pages (e.g. after filtering the loaded results locally)
+        show_no_records = not self._visible_listing_count and not self._has_more_pages
+
+        if show_no_records and not self._no_records_widget:
             self._no_records_widget = NoRecordsItemWidget()
             self.table_widget.push_widget(self._no_records_widget)
-        elif self._listings and self._no_records_widget:
+        elif not show_no_records and self._no_records_widget:
             self.table_widget.remove_widget(self._no_records_widget)
             self._no_records_widget = None
 
-        self.table_widget.setUpdatesEnabled(True)
+    def _prefetch_pages(self):
+        """
+        Starts background requests for the pages of PAGE_SIZE results following
+        the current page, up to the prefetch depth
+        """
+        next_offset = self._current_offset + self._current_limit
+        for offset in range(next_offset,
+                            next_offset + self.prefetch_depth() * PAGE_SIZE,
+                            PAGE_SIZE):
+            if offset in self._prefetch_replies:
+                continue
+
+            prefetched = self._prefetched_pages.get(offset)
+            if prefetched is not None:
+                if len(prefetched) < PAGE_SIZE:
+                    # no more results after this page
+                    break
+                continue
+
+            query = copy.copy(self._current_query)
+            query.limit = PAGE_SIZE
+            query.offset = offset
+
+            cached_listings = API_CLIENT.cached_listings(query)
+            if cached_listings is not None:
+                self._prefetched_pages[offset] = cached_listings
+                if len(cached_listings) < PAGE_SIZE:
+                    break
+                continue
+
+            request = API_CLIENT.request_listings(query)
+            reply = QgsNetworkAccessManager.instance().get(request)
+            self._prefetch_replies[offset] = reply
+            reply.finished.connect(partial(self._prefetch_finished, offset, reply))
+
+    def _prefetch_finished(self, offset: int, reply: QNetworkReply):
+        """
+        Called when a prefetch request has finished
+        """
+        if sip.isdeleted(self):
+            return
+
+        if self._prefetch_replies.get(offset) != reply:
+            # a cancelled prefetch we don't care about anymore
+            return
+
+        del self._prefetch_replies[offset]
+
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            if self._waiting_for_prefetch_offset == offset:
+                # fallback to a regular fetch
+                self._fetch_records(offset=offset)
+            return
+
+        self._prefetched_pages[offset] = API_CLIENT.parse_listings_reply(reply)
+
+        if self._waiting_for_prefetch_offset == offset:
+            self._waiting_for_prefetch_offset = None
+            self._push_listings(self._prefetched_pages.pop(offset))
+            self._page_finished()
 
     def load_more(self):
         """
-        Loads the next page of results
+        Loads the next page of results, and restarts automatic loading of
+        results if it was stopped after reaching the maximum number of listings
         """
-        next_page = math.ceil(len(self._listings) / PAGE_SIZE) + 1
+        self._auto_load_start_count = len(self._listings)
+        self._load_next_page(self._auto_page_size if self.infinite_scroll_enabled()
+                             else PAGE_SIZE)
 
-        self.table_widget.remove_widget(self._load_more_widget)
-        self._load_more_widget = None
-        self._create_temporary_items_for_page()
-        self._fetch_records(page=next_page)
+    def _load_next_page(self, limit: int):
+        """
+        Loads the page of results following the current page
+        """
+        next_offset = self._current_offset + self._current_limit
+
+        if self._load_more_widget:
+            self.table_widget.remove_widget(self._load_more_widget)
+            self._load_more_widget = None
+
+        if next_offset in self._prefetched_pages or next_offset in self._prefetch_replies:
+            # prefetched pages are always PAGE_SIZE results
+            limit = PAGE_SIZE
+        if next_offset not in self._prefetched_pages:
+            self._create_temporary_items_for_page(limit)
+        self._fetch_records(offset=next_offset, limit=limit)
 
 
 class LoadMoreItemWidget(QFrame):
@@ -13,19 +13,26 @@ __copyright__ = 'Copyright 2022, North Road'
 # This will get replaced with a git SHA1 when you do a git archive
 __revision__ = '$Format:%H$'
 
-from typing import Tuple
+from typing import (
+    Optional,
+    Tuple
+)
 import re
 
 from qgis.PyQt import uic
 from qgis.PyQt.QtCore import (
-    QSize
+    QSize,
+    QTimer
 )
 from qgis.core import (
-    QgsScaleCalculator
+    QgsFileUtils,
+    QgsScaleCalculator,
+    QgsSettings
 )
 from qgis.gui import (
     QgsMapCanvas,
     QgsExtentGroupBox,
+    QgsFileWidget,
     QgsScaleWidget,
     QgsSpinBox,
     QgsRatioLockButton
@@ -34,8 +41,11 @@ from qgis.utils import iface
 
 from .gui_utils import GuiUtils
 from ..core import (
+    ExportEstimate,
+    ExportEstimator,
     ProjectManager,
-    MapExportSettings
+    MapExportSettings,
+    OutputCompression
 )
 
 ui, base = uic.loadUiType(GuiUtils.get_ui_file_path('map_export_dialog.ui'))
@@ -136,6 +146,16 @@ class MapExportDialog(base, ui):
         self.mScaleWidget.setMapCanvas(self.map_canvas)
         self.mScaleWidget.setShowCurrentScaleButton(True)
 
+        # layer render costs are sampled after a short delay, so that trial
+        # renders aren't repeated while the extent is being changed
+        self._estimator = ExportEstimator(map_settings, self)
+        self._estimator.sampling_finished.connect(self.update_estimated_size)
+        self._estimate: Optional[ExportEstimate] = None
+        self._sample_timer = QTimer(self)
+        self._sample_timer.setSingleShot(True)
+        self._sample_timer.setInterval(750)
+        self._sample_timer.timeout.connect(self._sample_render_costs)
+
         self.mOutputWidthSpinBox.editingFinished.connect(self.update_output_width)
         self.mOutputHeightSpinBox.editingFinished.connect(self.update_output_height)
         self.mExtentGroupBox.extentChanged.connect(self.update_extent)
@@ -144,7 +164,44 @@ class MapExportDialog(base, ui):
 
         self.mLockAspectRatio.setLocked(True)
 
+        self.export_warning_label.setVisible(False)
+
+        for compression, label in (
+                (OutputCompression.NoCompression, self.tr('None')),
+                (OutputCompression.Deflate, self.tr('Deflate (lossless)')),
+                (OutputCompression.Zstd, self.tr('ZSTD (lossless)')),
+                (OutputCompression.Jpeg, self.tr('JPEG (lossy)')),
+                (OutputCompression.Webp, self.tr('WEBP (lossy)'))):
+            if compression.is_available():
+                self.compression_combo.addItem(label, compression.value)
+
+        default_settings = MapExportSettings()
+        compression_index = self.compression_combo.findData(default_settings.compression.value)
+        if compression_index < 0:
+            compression_index = self.compression_combo.findData(OutputCompression.Deflate.value)
+        self.compression_combo.setCurrentIndex(compression_index)
+        self.quality_spin.setValue(default_settings.quality)
+        self.cloud_optimized_check.setChecked(default_settings.cloud_optimized)
+
+        self.compression_combo.currentIndexChanged.connect(self._compression_changed)
+        self.quality_spin.valueChanged.connect(self.update_estimated_size)
+        self.cloud_optimized_check.toggled.connect(self.update_estimated_size)
+        self.mOutputWidthSpinBox.valueChanged.connect(self.update_estimated_size)
+        self.mOutputHeightSpinBox.valueChanged.connect(self.update_estimated_size)
+
+        self.tile_pyramid_file_widget.setStorageMode(QgsFileWidget.StorageMode.SaveFile)
+        self.tile_pyramid_file_widget.setFilter(
+            self.tr('MBTiles (*.mbtiles);;GeoPackage (*.gpkg)'))
+        self.tile_pyramid_file_widget.setFilePath(
+            QgsSettings().value('soar/export_tile_pyramid_file', '', str))
+        self.tile_pyramid_check.setChecked(
+            QgsSettings().value('soar/export_tile_pyramid', False, bool))
+        self.tile_pyramid_file_widget.setEnabled(self.tile_pyramid_check.isChecked())
+        self.tile_pyramid_check.toggled.connect(self.tile_pyramid_file_widget.setEnabled)
+
         self.update_output_size()
+        self._compression_changed()
+        self._sample_timer.start()
 
     def _category_combo_changed(self):
         """
@@ -170,6 +227,53 @@ class MapExportDialog(base, ui):
         self.category_combo_2.setVisible(category_1_exists)
         self.category_combo_3.setVisible(category_2_exists)
 
+    def _compression_changed(self):
+        """
+        Called when the output compression is changed
+        """
+        compression = OutputCompression.from_string(self.compression_combo.currentData())
+        self.quality_spin.setEnabled(compression is not None and compression.is_lossy())
+        self.update_estimated_size()
+
+    def _sample_render_costs(self):
+        """
+        Starts sampling the render costs of the map layers via background trial renders
+        """
+        self._estimator.map_settings = self.export_settings(False).map_settings(self.map_canvas)
+        self._estimator.sample()
+        self.update_estimated_size()
+
+    def update_estimated_size(self):
+        """
+        Updates the estimated output file size and export costs shown in the dialog
+        """
+        export_settings = self.export_settings(False)
+        uncompressed_settings = self.export_settings(False)
+        uncompressed_settings.compression = OutputCompression.NoCompression
+        uncompressed_settings.cloud_optimized = False
+
+        self.estimated_size_label.setText(
+            self.tr('~{} (uncompressed {})').format(
+                QgsFileUtils.representFileSize(export_settings.estimated_file_size()),
+                QgsFileUtils.representFileSize(uncompressed_settings.estimated_file_size())
+            )
+        )
+
+        self._estimate = self._estimator.estimate(export_settings)
+
+        cost = self.tr('Render {}, memory ~{}, upload {}').format(
+            ExportEstimator.format_duration(
+                self._estimate.render_time if self._estimator.is_sampled() else None),
+            QgsFileUtils.representFileSize(self._estimate.peak_memory),
+            ExportEstimator.format_duration(self._estimate.upload_time))
+        if self._estimate.tile_size_reduced:
+            cost += '\n' + self.tr('Rendered in {} px tiles to limit memory use').format(
+                self._estimate.tile_size)
+        self.export_cost_label.setText(cost)
+
+        self.export_warning_label.setText('\n'.join(self._estimate.warnings))
+        self.export_warning_label.setVisible(bool(self._estimate.warnings))
+
     def update_output_width(self):
         """
         Updates the dialog state when output width changes
@@ -238,6 +342,10 @@ class MapExportDialog(base, ui):
         """
         Updates the extent calculation
         """
+        # the render costs depend on the map content within the extent
+        self._estimator.reset()
+        self._sample_timer.start()
+
         if self.mExtentGroupBox.extentState() != QgsExtentGroupBox.ExtentState.UserExtent:
             current_dpi = self.dpi
 
@@ -313,6 +421,8 @@ class MapExportDialog(base, ui):
         self.mOutputHeightSpinBox.setValue(self.size.height())
         self.mOutputHeightSpinBox.blockSignals(False)
 
+        self.update_estimated_size()
+
     def validate(self) -> Tuple[bool, str]:
         """
         Validates the dialog settings
@@ -333,11 +443,17 @@ class MapExportDialog(base, ui):
         if not category:
             return False, self.tr('A category must be selected')
 
+        if self.tile_pyramid_check.isChecked() and not self.tile_pyramid_file_widget.filePath():
+            return False, self.tr('A file must be selected for the local tile pyramid')
+
         return True, ''
 
-    def export_settings(self) -> MapExportSettings:
+    def export_settings(self, apply_estimate: bool = True) -> MapExportSettings:
         """
-        Returns the export settings defined in the dialog
+        Returns the export settings defined in the dialog.
+
+        If apply_estimate is True, the tile size is adjusted to keep the
+        estimated memory use of the export within the configured limit.
         """
         export_settings = MapExportSettings()
 
@@ -354,6 +470,14 @@ class MapExportDialog(base, ui):
         export_settings.extent = self.mExtentGroupBox.outputExtent()
         export_settings.include_decorations = (
             self.draw_decorations_check.isChecked())
+        export_settings.compression = OutputCompression.from_string(
+            self.compression_combo.currentData()) or OutputCompression.Deflate
+        export_settings.quality = self.quality_spin.value()
+        export_settings.cloud_optimized = self.cloud_optimized_check.isChecked()
+        if self.tile_pyramid_check.isChecked():
+            export_settings.tile_pyramid_file_name = self.tile_pyramid_file_widget.filePath() or None
+        if apply_estimate and self._estimate is not None:
+            export_settings.tile_size = self._estimate.tile_size
 
         return export_settings
 
@@ -373,6 +497,13 @@ class MapExportDialog(base, ui):
         self.project_manager.set_export_scale(export_settings.scale)
         self.project_manager.set_export_extent(export_settings.extent)
 
+        QgsSettings().setValue('soar/export_compression', export_settings.compression.value)
+        QgsSettings().setValue('soar/export_quality', export_settings.quality)
+        QgsSettings().setValue('soar/export_cloud_optimized', export_settings.cloud_optimized)
+        QgsSettings().setValue('soar/export_tile_pyramid', self.tile_pyramid_check.isChecked())
+        QgsSettings().setValue('soar/export_tile_pyramid_file',
+                               self.tile_pyramid_file_widget.filePath())
+
     def accept(self):  # pylint: disable=missing-function-docstring
         self.message_bar.clearWidgets()
 
@@ -384,3 +515,8 @@ class MapExportDialog(base, ui):
         self.save_settings()
 
         super().accept()
+
+    def done(self, result):  # pylint: disable=missing-function-docstring
+        self._sample_timer.stop()
+        self._estimator.cancel()
+        super().done(result)
@@ -13,7 +13,14 @@ __copyright__ = 'Copyright 2022, North Road'
 # This will get replaced with a git SHA1 when you do a git archive
 __revision__ = '$Format:%H$'
 
-from typing import Optional
+from bisect import bisect_left
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple
+)
 
 from qgis.PyQt.QtCore import (
     Qt,
@@ -23,7 +30,9 @@ from qgis.PyQt.QtCore import (
 )
 from qgis.PyQt.QtWidgets import (
     QLayout,
+    QLayoutItem,
     QSizePolicy,
+    QSpacerItem,
     QStyle,
     QWidget,
     QWidgetItem
@@ -31,16 +40,109 @@ from qgis.PyQt.QtWidgets import (
 
 from .listing_items import (
     EmptyDatasetItemWidget,
-    ListingItemWidget
+    ListingItemWidget,
+    ListingItemWidgetBase
 )
 from ..core.client import Listing
 
 
+class LayoutFlow:
+    """
+    The flow of a layout's visible items into rows, for a column count.
+
+    Items fill rows of exactly column_count items in order, so the flow can
+    be extended as items are appended to the layout, or truncated when items
+    are removed, without re-flowing the preceding items.
+    """
+
+    __slots__ = ('column_count', 'items', 'sources', 'row_tops', 'row_heights',
+                 'source_count', 'positioned', 'positioned_geometry')
+
+    def __init__(self, column_count: int):
+        self.column_count = column_count
+        # visible items, and their indices in the layout
+        self.items: List[QLayoutItem] = []
+        self.sources: List[int] = []
+        # row positions, relative to the top of the layout contents
+        self.row_tops: List[int] = []
+        self.row_heights: List[int] = []
+        # number of layout items (including hidden items) which have been flowed
+        self.source_count = 0
+        # number of items which have been positioned, and the column width
+        # and origin they were positioned with
+        self.positioned = 0
+        self.positioned_geometry: Optional[Tuple[int, int, int]] = None
+
+    def extend(self, items: List[QLayoutItem], spacing: int):
+        """
+        Flows items appended to the layout
+        """
+        for item in items:
+            source = self.source_count
+            self.source_count += 1
+
+            widget = item.widget()
+            if widget is not None and widget.isHidden():
+                continue
+
+            height = item.sizeHint().height()
+            if len(self.items) % self.column_count == 0:
+                top = self.row_tops[-1] + self.row_heights[-1] + spacing if self.row_tops else 0
+                self.row_tops.append(top)
+                self.row_heights.append(height)
+            else:
+                self.row_heights[-1] = max(self.row_heights[-1], height)
+
+            self.items.append(item)
+            self.sources.append(source)
+
+    def truncate(self, source_count: int):
+        """
+        Discards the flow for all layout items from the specified index onwards
+        """
+        if source_count >= self.source_count:
+            return
+
+        count = bisect_left(self.sources, source_count)
+        del self.items[count:]
+        del self.sources[count:]
+
+        row_count = -(-count // self.column_count)
+        del self.row_tops[row_count:]
+        del self.row_heights[row_count:]
+        if count % self.column_count:
+            # the last row is now partially filled
+            self.row_heights[-1] = max(item.sizeHint().height()
+                                       for item in self.items[(row_count - 1) * self.column_count:])
+
+        self.source_count = source_count
+        self.positioned = min(self.positioned, count)
+
+    def height(self) -> int:
+        """
+        Returns the height of the flowed items
+        """
+        if not self.row_tops:
+            return 0
+        return self.row_tops[-1] + self.row_heights[-1]
+
+
 class ResponsiveTableLayout(QLayout):
     """
-    A responsive table layout which dynamically flows to multiple columns
+    A responsive table layout which dynamically flows to multiple columns.
+
+    The layout is calculated incrementally: the flow of items into rows is
+    cached for each column count and only extended when items are appended,
+    and only items which haven't already been positioned are placed when the
+    layout geometry is set. Flows are only recalculated from the first affected
+    item when items are removed or an item's visibility or height changes.
     """
 
+    MINIMUM_COLUMN_WIDTH = 400
+
+    # emitted after the layout has positioned its items
+    geometry_updated = pyqtSignal()
+
     def __init__(self, parent, hspacing, vspacing):
         super().__init__(parent)
 
@@ -51,6 +153,17 @@ class ResponsiveTableLayout(QLayout):
 
         self.itemList = []
 
+        # items with widgets, as (index, item, (hidden, height)). These are the
+        # only items whose visibility or size can change after they are added.
+        self._widget_items: List[Tuple[int, QLayoutItem, Tuple[bool, int]]] = []
+        # item flows, by column count
+        self._flows: Dict[int, LayoutFlow] = {}
+        # the flow used to position the items
+        self._positioned_flow: Optional[LayoutFlow] = None
+        # layout heights, by width
+        self._height_for_width: Dict[int, int] = {}
+        self._minimum_size: Optional[QSize] = None
+
     def __del__(self):
         item = self.takeAt(0)
         while item:
@@ -60,6 +173,12 @@ class ResponsiveTableLayout(QLayout):
     # pylint: disable=missing-function-docstring
     def addItem(self, item):
         self.itemList.append(item)
+        if item.widget() is not None:
+            self._widget_items.append((len(self.itemList) - 1, item, self._item_state(item)))
+        self._height_for_width = {}
+        if self._minimum_size is not None:
+            self._minimum_size = self._minimum_size.expandedTo(item.minimumSize())
+        self.invalidate()
 
     def horizontalSpacing(self):
         if self.hspacing >= 0:
@@ -82,6 +201,10 @@ class ResponsiveTableLayout(QLayout):
 
     def takeAt(self, index):
         if 0 <= index < len(self.itemList):
+            self._invalidate_from(index)
+            self._minimum_size = None
+            self._widget_items = [(i - 1 if i > index else i, item, state)
+                                  for i, item, state in self._widget_items if i != index]
             return self.itemList.pop(index)
 
         return None
@@ -93,26 +216,60 @@ class ResponsiveTableLayout(QLayout):
         return True
 
     def heightForWidth(self, width):
-        height = self._do_layout(QRect(0, 0, width, 0), True)
+        self._check_widget_items()
+        height = self._height_for_width.get(width)
+        if height is None:
+            height = self._layout_height(self._flow(self._column_count_for_width(width)))
+            self._height_for_width[width] = height
         return height
 
     def setGeometry(self, rect):
         super().setGeometry(rect)
-        self._do_layout(rect, False)
+        self._check_widget_items()
+
+        margins = self.contentsMargins()
+        effective_rect = rect.adjusted(margins.left(), margins.top(),
+                                       -margins.right(), -margins.bottom())
+
+        col_count = self._column_count_for_width(rect.width())
+        flow = self._flow(col_count)
+
+        space_x = self.horizontalSpacing()
+        width_without_spacing = effective_rect.width() - (col_count - 1) * space_x
+        col_width = int(width_without_spacing / col_count)
+
+        geometry = (col_width, effective_rect.x(), effective_rect.y())
+        if flow is not self._positioned_flow or geometry != flow.positioned_geometry:
+            self._positioned_flow = flow
+            flow.positioned_geometry = geometry
+            flow.positioned = 0
+
+        # only place items which haven't already been positioned
+        for idx in range(flow.positioned, len(flow.items)):
+            item = flow.items[idx]
+            row, col = divmod(idx, col_count)
+            item.setGeometry(
+                QRect(effective_rect.x() + col * (col_width + space_x),
+                      effective_rect.y() + flow.row_tops[row],
+                      col_width, item.sizeHint().height())
+            )
+        flow.positioned = len(flow.items)
+
+        self._column_count = col_count
+        self.geometry_updated.emit()
 
     def sizeHint(self):
         return self.minimumSize()
 
     def minimumSize(self):
-        size = QSize()
-
-        for item in self.itemList:
-            size = size.expandedTo(item.minimumSize())
+        if self._minimum_size is None:
+            self._minimum_size = QSize()
+            for item in self.itemList:
+                self._minimum_size = self._minimum_size.expandedTo(item.minimumSize())
 
         margins = self.contentsMargins()
-        size += QSize(margins.left() + margins.right(),
-                      margins.top() + margins.bottom())
-        return size
+        return self._minimum_size + QSize(margins.left() + margins.right(),
+                                          margins.top() + margins.bottom())
 
     # pylint: enable=missing-function-docstring
 
@@ -122,86 +279,90 @@ class ResponsiveTableLayout(QLayout):
         """
         self.addChildWidget(widget)
         item = QWidgetItem(widget)
+        self._invalidate_from(idx)
+        self._widget_items = [(i + 1 if i >= idx else i, other, state)
+                              for i, other, state in self._widget_items]
+        self._widget_items.append((idx, item, self._item_state(item)))
+        self._widget_items.sort(key=lambda widget_item: widget_item[0])
         self.itemList.insert(idx, item)
         self.invalidate()
 
+    def set_items(self, items: List[QLayoutItem]):
+        """
+        Replaces all items in the layout
+        """
+        self.itemList = items
+        self._widget_items = [(idx, item, self._item_state(item))
+                              for idx, item in enumerate(items) if item.widget() is not None]
+        self._flows = {}
+        self._positioned_flow = None
+        self._height_for_width = {}
+        self._minimum_size = None
+        self.invalidate()
+
     def column_count(self) -> int:
         """
         Returns the current column count
         """
         return self._column_count
 
-    def _do_layout(self, rect, test_only):  # pylint: disable=too-many-locals
+    def _column_count_for_width(self, width: int) -> int:
         """
-        Calculates the layout
+        Returns the column count to use for a layout width
         """
         margins = self.contentsMargins()
-        left = margins.left()
-        top = margins.top()
-        right = margins.right()
-        bottom = margins.bottom()
-
-        effective_rect = rect.adjusted(left, top, -right, -bottom)
-
-        col_count = int(effective_rect.width() / 400)
-
-        col_count = max(1, col_count)
-
-        space_x = self.horizontalSpacing()
-        space_y = self.verticalSpacing()
+        return max(1, int((width - margins.left() - margins.right()) / self.MINIMUM_COLUMN_WIDTH))
 
-        width_without_spacing = effective_rect.width() - (col_count - 1) * space_x
-        col_width = int(width_without_spacing / col_count)
-
-        x = effective_rect.x()
-        y = effective_rect.y()
-        line_height = 0
-
-        y_offsets = [y]
+    def _flow(self, column_count: int) -> LayoutFlow:
+        """
+        Returns the flow of all items for a column count, extending it with
+        any newly appended items
+        """
+        flow = self._flows.get(column_count)
+        if flow is None:
+            flow = LayoutFlow(column_count)
+            self._flows[column_count] = flow
 
-        assigned_lines = []
-        current_line_items = []
+        if flow.source_count < len(self.itemList):
+            flow.extend(self.itemList[flow.source_count:], self.verticalSpacing())
 
-        visible_items = [i for i in self.itemList if not i.widget().isHidden()]
+        return flow
 
-        if not visible_items:
+    def _layout_height(self, flow: LayoutFlow) -> int:
+        """
+        Returns the total layout height for a flow, including margins
+        """
+        if not flow.items:
             return 0
 
-        for item in visible_items:
-            next_x = x + col_width + space_x
-
-            current_line_items.append(item)
-            line_height = max(line_height, item.sizeHint().height())
-            if len(current_line_items) == col_count:
-                assigned_lines.append(current_line_items[:])
-                current_line_items = []
-
-                x = effective_rect.x()
-                y = y + line_height + space_y
-                y_offsets.append(y)
-
-                next_x = x + item.minimumSize().width() + space_x
-                line_height = 0
-
-            x = next_x
-
-        if current_line_items:
-            assigned_lines.append(current_line_items[:])
-
-        if not test_only:
-            self._column_count = col_count
-            for idx, line in enumerate(assigned_lines):
-                y_offset = y_offsets[idx]
+        margins = self.contentsMargins()
+        return margins.top() + flow.height() + margins.bottom()
 
-                x = effective_rect.left()
-                for item in line:
-                    item.setGeometry(
-                        QRect(x, y_offset, col_width, item.sizeHint().height())
-                    )
+    @staticmethod
+    def _item_state(item: QLayoutItem) -> Tuple[bool, int]:
+        """
+        Returns the visibility and height of a widget item
+        """
+        return item.widget().isHidden(), item.sizeHint().height()
 
-                    x += col_width + space_x
+    def _check_widget_items(self):
+        """
+        Invalidates the flows after any widget items which have been shown,
+        hidden or resized since they were flowed
+        """
+        for idx, (source, item, state) in enumerate(self._widget_items):
+            current_state = self._item_state(item)
+            if current_state != state:
+                self._widget_items[idx] = (source, item, current_state)
+                self._invalidate_from(source)
 
-        return y + line_height - rect.y() + bottom
+    def _invalidate_from(self, index: int):
+        """
+        Invalidates the calculated layout for all items from the specified index onwards
+        """
+        for flow in self._flows.values():
+            flow.truncate(index)
+        self._height_for_width = {}
 
     def smart_spacing(self, pm) -> int:
         """
@@ -217,14 +378,51 @@ class ResponsiveTableLayout(QLayout):
         return parent.spacing()
 
 
+class TableEntry:
+    """
+    An entry in a ResponsiveTableWidget.
+
+    Entries are either card slots, which show a listing (or an empty placeholder
+    if no listing is set) using a recycled card widget while the slot is close to
+    the visible area, or regular widgets which are always present.
+    """
+
+    __slots__ = ('listing', 'item', 'widget', 'is_slot')
+
+    def __init__(self,
+                 item: QLayoutItem,
+                 listing: Optional[Listing] = None,
+                 widget: Optional[QWidget] = None,
+                 is_slot: bool = True):
+        self.item = item
+        self.listing = listing
+        # for slots, the card widget currently bound to the slot (if any)
+        self.widget = widget
+        self.is_slot = is_slot
+
+
 class ResponsiveTableWidget(QWidget):
     """
-    A responsive table widget for showing listing results
+    A responsive table widget for showing listing results.
+
+    The table is virtualized: listings are laid out as lightweight slots, and
+    card widgets are only created for slots within BUFFER_VIEWPORTS viewport
+    heights of the visible area. As the table is scrolled, cards which move
+    out of this area are recycled and rebound to the listings coming into view,
+    so the number of card widgets is independent of the number of listings.
     """
     VERTICAL_SPACING = 10
     HORIZONTAL_SPACING = 10
 
+    # number of viewport heights above and below the visible area to create cards for
+    BUFFER_VIEWPORTS = 1
+
     listing_clicked = pyqtSignal(Listing)
+    # emitted when the mouse enters or leaves the card for a listing
+    listing_entered = pyqtSignal(Listing)
+    listing_left = pyqtSignal(Listing)
+    # emitted when card widgets are bound to different listings
+    visible_widgets_changed = pyqtSignal()
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -233,17 +431,60 @@ class ResponsiveTableWidget(QWidget):
                                              hspacing=self.HORIZONTAL_SPACING))
 
         self.layout().setContentsMargins(0, 0, 16, 16)
+        self.layout().geometry_updated.connect(self._layout_updated)
+
+        self._entries: List[TableEntry] = []
+        # index of the first entry which may be an empty slot
+        self._next_empty_hint = 0
+
+        # slot entries, in order, and the number of these which have been
+        # positioned by the layout
+        self._slots: List[TableEntry] = []
+        self._positioned_slot_count = 0
+
+        # slots which currently have a card widget bound
+        self._realized: List[TableEntry] = []
+        # unbound card widgets, ready for reuse
+        self._listing_widget_pool: List[ListingItemWidget] = []
+        self._empty_widget_pool: List[EmptyDatasetItemWidget] = []
 
-        self._widgets = []
+        # ids of listings whose cards are shown as selected
+        self._selected_listing_ids: Set[int] = set()
+
+    # QWidget interface
+    # pylint: disable=missing-function-docstring
+    def moveEvent(self, event):
+        super().moveEvent(event)
+        # the table is moved within the scroll area viewport when scrolled
+        self._update_realized_widgets()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_realized_widgets()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._update_realized_widgets()
+
+    # pylint: enable=missing-function-docstring
 
     def clear(self):
         """
         Clears all listings from the table
         """
-        for w in self._widgets:
-            w.deleteLater()
-            self.layout().takeAt(0)
-        self._widgets = []
+        for entry in self._realized:
+            self._release_widget(entry)
+        self._realized = []
+
+        for entry in self._entries:
+            if not entry.is_slot:
+                entry.widget.deleteLater()
+
+        self._entries = []
+        self._next_empty_hint = 0
+        self._slots = []
+        self._positioned_slot_count = 0
+        self.layout().set_items([])
 
     def column_count(self):
         """
@@ -251,78 +492,280 @@ class ResponsiveTableWidget(QWidget):
         """
         return self.layout().column_count()
 
-    def push_empty_widget(self):
+    def listing_widgets(self) -> List[ListingItemWidget]:
         """
-        Pushes an empty entry into the table
+        Returns the listing widgets which are currently bound to listings.
+
+        Only listings close to the visible area have widgets.
         """
-        empty_widget = EmptyDatasetItemWidget()
-        self.push_widget(empty_widget)
+        return [entry.widget for entry in self._realized
+                if isinstance(entry.widget, ListingItemWidget)]
 
-    def find_next_empty_widget(self) -> Optional[QWidget]:
+    def set_selected_listings(self, listing_ids: List[int]):
         """
-        Finds the next available empty space
+        Sets the listings whose cards should be shown as selected
         """
+        self._selected_listing_ids = set(listing_ids)
+        for widget in self.listing_widgets():
+            widget.set_selected(widget.listing.id in self._selected_listing_ids)
 
-        for w in self._widgets:
-            if isinstance(w, EmptyDatasetItemWidget):
-                return w
-
+    def listing_rect(self, listing_id: int) -> Optional[QRect]:
+        """
+        Returns the area of the table occupied by the card for a listing,
+        or None if the listing is not in the table
+        """
+        for entry in self._slots[:self._positioned_slot_count]:
+            if entry.listing is not None and entry.listing.id == listing_id:
+                return entry.item.geometry()
         return None
 
-    def replace_widget(self, old_widget, new_widget):
+    def push_empty_widget(self):
         """
-        Replaces a widget in the table
+        Pushes an empty entry into the table
         """
-        idx = self._widgets.index(old_widget)
-        self._widgets[idx].setParent(None)
-        self._widgets[idx].deleteLater()
-
-        self._widgets[idx] = new_widget
-        self._widgets[idx].setParent(self)
-
-        self.layout().insert_widget(idx, new_widget)
-
-        self.layout().takeAt(idx + 1)
+        self._push_entry(TableEntry(self._create_slot_item()))
 
     def push_listing(self, listing: Listing):
         """
-        Pushes a listing to the table
+        Pushes a listing to the table, filling the next empty entry if available
         """
-        listing_widget = ListingItemWidget(listing, self)
-        listing_widget.clicked.connect(self.listing_clicked)
-
-        next_empty_widget = self.find_next_empty_widget()
-        if next_empty_widget is not None:
-            self.replace_widget(next_empty_widget, listing_widget)
-        else:
-            self.push_widget(listing_widget)
+        for idx in range(self._next_empty_hint, len(self._entries)):
+            entry = self._entries[idx]
+            if entry.is_slot and entry.listing is None:
+                self._next_empty_hint = idx + 1
+                entry.listing = listing
+                if entry.widget is not None:
+                    # rebind the visible placeholder to a listing card
+                    self._release_widget(entry)
+                    self._bind_widget(entry)
+                    self.visible_widgets_changed.emit()
+                return
+
+        self._next_empty_hint = len(self._entries) + 1
+        self._push_entry(TableEntry(self._create_slot_item(), listing=listing))
 
     def push_widget(self, widget):
         """
         Pushes a widget to the table
         """
-        self._widgets.append(widget)
-        self.layout().addWidget(widget)
+        self._entries.append(TableEntry(QWidgetItem(widget), widget=widget, is_slot=False))
+        self.layout().addChildWidget(widget)
+        self.layout().addItem(self._entries[-1].item)
 
     def remove_empty_widgets(self):
         """
-        Removes all empty widgets from the table
+        Removes all empty entries from the table
         """
-        self.setUpdatesEnabled(False)
-        for idx in range(len(self._widgets) - 1, -1, -1):
-            if isinstance(self._widgets[idx], EmptyDatasetItemWidget):
-                self._widgets[idx].setParent(None)
-                self._widgets[idx].deleteLater()
-                self.layout().takeAt(idx)
-                del self._widgets[idx]
-        self.setUpdatesEnabled(True)
+        remaining = []
+        for entry in self._entries:
+            if entry.is_slot and entry.listing is None:
+                if entry.widget is not None:
+                    self._release_widget(entry)
+                    self._realized.remove(entry)
+            else:
+                remaining.append(entry)
+
+        if len(remaining) == len(self._entries):
+            return
+
+        self._set_entries(remaining)
 
     def remove_widget(self, widget):
         """
         Removes a widget from the table
         """
-        idx = self._widgets.index(widget)
-        self._widgets[idx].setParent(None)
-        self._widgets[idx].deleteLater()
+        idx = next(idx for idx, entry in enumerate(self._entries)
+                   if not entry.is_slot and entry.widget == widget)
+        del self._entries[idx]
         self.layout().takeAt(idx)
-        del self._widgets[idx]
+        self.layout().invalidate()
+        widget.setParent(None)
+        widget.deleteLater()
+
+    def remove_listing(self, listing: Listing):
+        """
+        Removes a listing from the table
+        """
+        remaining = []
+        for entry in self._entries:
+            if entry.listing is listing:
+                if entry.widget is not None:
+                    self._release_widget(entry)
+                    self._realized.remove(entry)
+            else:
+                remaining.append(entry)
+
+        self._set_entries(remaining)
+
+    def set_listings(self, listings: List[Listing]):
+        """
+        Replaces the listings shown in the table, applying only the differences
+        from the currently shown listings.
+
+        Entries for listings which are still present are reused (keeping their
+        cards and thumbnails), entries are created for new listings, and the
+        entries for any listings which are no longer present are removed along
+        with all empty entries. Other widgets are kept at the end of the table.
+        """
+        existing: Dict[int, TableEntry] = {}
+        for entry in self._slots:
+            if entry.listing is not None:
+                existing.setdefault(entry.listing.id, entry)
+
+        entries = []
+        for listing in listings:
+            entry = existing.pop(listing.id, None)
+            if entry is None:
+                entry = TableEntry(self._create_slot_item(), listing=listing)
+            else:
+                entry.listing = listing
+                if entry.widget is not None:
+                    entry.widget.set_listing(listing)
+            entries.append(entry)
+
+        kept_ids = {id(entry) for entry in entries}
+        realized = []
+        for entry in self._realized:
+            if id(entry) in kept_ids:
+                realized.append(entry)
+            else:
+                self._release_widget(entry)
+        self._realized = realized
+
+        entries.extend(entry for entry in self._entries if not entry.is_slot)
+        self._set_entries(entries)
+        self._next_empty_hint = len(entries)
+
+    @staticmethod
+    def _create_slot_item() -> QSpacerItem:
+        """
+        Creates a layout item reserving the space for a card
+        """
+        return QSpacerItem(ListingItemWidgetBase.CARD_HEIGHT * 3,
+                           ListingItemWidgetBase.CARD_HEIGHT,
+                           QSizePolicy.Policy.Minimum,
+                           QSizePolicy.Policy.Fixed)
+
+    def _push_entry(self, entry: TableEntry):
+        """
+        Appends an entry to the table
+        """
+        self._entries.append(entry)
+        self._slots.append(entry)
+        self.layout().addItem(entry.item)
+
+    def _set_entries(self, entries: List[TableEntry]):
+        """
+        Replaces all entries in the table
+        """
+        self._entries = entries
+        self._next_empty_hint = 0
+        self._slots = [entry for entry in entries if entry.is_slot]
+        # cards are not rebound until the layout has positioned the remaining slots
+        self._positioned_slot_count = 0
+        self.layout().set_items([entry.item for entry in entries])
+
+    def _layout_updated(self):
+        """
+        Called when the layout has positioned its items
+        """
+        self._positioned_slot_count = len(self._slots)
+        self._update_realized_widgets()
+
+    def _first_slot_below(self, y: int) -> int:
+        """
+        Returns the index of the first positioned slot with a top below y
+        """
+        # slots are positioned in order, so can be bisected by their top
+        low = 0
+        high = self._positioned_slot_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._slots[mid].item.geometry().top() < y:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _visible_rect(self) -> QRect:
+        """
+        Returns the visible area of the table, in table coordinates
+        """
+        viewport = self.parentWidget()
+        if viewport is None:
+            return self.rect()
+
+        return QRect(-self.x(), -self.y(), viewport.width(), viewport.height())
+
+    def _update_realized_widgets(self):
+        """
+        Binds card widgets to the slots close to the visible area, and recycles
+        the widgets from slots which have moved out of this area
+        """
+        if not self._positioned_slot_count:
+            return
+
+        visible_rect = self._visible_rect()
+        buffer = visible_rect.height() * self.BUFFER_VIEWPORTS
+        top = visible_rect.top() - buffer
+        bottom = visible_rect.bottom() + buffer
+
+        first = self._first_slot_below(top - ListingItemWidgetBase.CARD_HEIGHT)
+        in_range = []
+        for idx in range(first, self._positioned_slot_count):
+            if self._slots[idx].item.geometry().top() > bottom:
+                break
+            in_range.append(self._slots[idx])
+
+        in_range_ids = {id(entry) for entry in in_range}
+        changed = False
+        for entry in self._realized:
+            if id(entry) not in in_range_ids:
+                self._release_widget(entry)
+                changed = True
+
+        for entry in in_range:
+            if entry.widget is None:
+                self._bind_widget(entry)
+                changed = True
+            entry.widget.setGeometry(entry.item.geometry())
+
+        self._realized = in_range
+        if changed:
+            self.visible_widgets_changed.emit()
+
+    def _bind_widget(self, entry: TableEntry):
+        """
+        Binds a card widget to a slot, reusing a pooled widget if possible
+        """
+        if entry.listing is not None:
+            if self._listing_widget_pool:
+                widget = self._listing_widget_pool.pop()
+                widget.set_listing(entry.listing)
+            else:
+                widget = ListingItemWidget(entry.listing, self)
+                widget.clicked.connect(self.listing_clicked)
+                widget.entered.connect(self.listing_entered)
+                widget.left.connect(self.listing_left)
+            widget.set_selected(entry.listing.id in self._selected_listing_ids)
+        elif self._empty_widget_pool:
+            widget = self._empty_widget_pool.pop()
+        else:
+            widget = EmptyDatasetItemWidget(self)
+
+        entry.widget = widget
+        widget.setGeometry(entry.item.geometry())
+        widget.show()
+
+    def _release_widget(self, entry: TableEntry):
+        """
+        Unbinds the card widget from a slot, returning it to the pool
+        """
+        widget = entry.widget
+        entry.widget = None
+        widget.hide()
+        if isinstance(widget, ListingItemWidget):
+            widget.set_listing(None)
+            self._listing_widget_pool.append(widget)
+        else:
+            self._empty_widget_pool.append(widget)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""Soar plugin
+
+.. note:: This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '22/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+
+from qgis.PyQt import sip
+from qgis.PyQt.QtCore import (
+    QEvent,
+    QObject,
+    QPoint,
+    Qt,
+    pyqtSignal
+)
+from qgis.PyQt.QtWidgets import QApplication
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsFillSymbol,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProject,
+    QgsRectangle,
+    QgsSingleSymbolRenderer,
+    QgsVectorLayer
+)
+from qgis.gui import (
+    QgsMapCanvas,
+    QgsMapToolPan
+)
+
+from ..core.client import Listing
+
+
+class ResultFootprintsLayer(QObject):
+    """
+    Manages a temporary memory layer showing the footprints of all listings
+    in the current results.
+
+    The layer is only shown in the map canvas, and is never added to the
+    project (so it isn't shown in the layer tree or saved with the project).
+
+    The layer has a spatial index, so that large numbers of footprints can be
+    rendered and selected efficiently. Footprints clicked on the map with the
+    pan tool are selected and reported via selection_changed, and listings
+    can be selected from the cards via select_listing().
+    """
+
+    LAYER_NAME = 'Soar Results'
+
+    # tolerance in pixels for clicking on footprints
+    CLICK_TOLERANCE = 3
+
+    # emitted with the ids of the listings selected on the map
+    selection_changed = pyqtSignal(list)
+
+    def __init__(self, canvas: QgsMapCanvas, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.canvas = canvas
+
+        self._layer: Optional[QgsVectorLayer] = None
+        # listings in the current results, by id
+        self._listings: Dict[int, Listing] = {}
+        # feature ids by listing id, and listing ids by feature id
+        self._feature_ids: Dict[int, int] = {}
+        self._listing_ids: Dict[int, int] = {}
+        self._updating_selection = False
+        self._press_pos: Optional[QPoint] = None
+
+        # the canvas layers are reset whenever the project layers change,
+        # so the footprints layer must be added back
+        self.canvas.layersChanged.connect(self._canvas_layers_changed)
+        self.canvas.viewport().installEventFilter(self)
+
+    def __del__(self):
+        if self._layer is not None and not sip.isdeleted(self.canvas):
+            self._remove_from_canvas(self._layer)
+            self._layer = None
+
+    def layer(self) -> Optional[QgsVectorLayer]:
+        """
+        Returns the footprints layer, if enabled
+        """
+        return self._layer
+
+    def is_enabled(self) -> bool:
+        """
+        Returns True if the footprints layer is shown
+        """
+        return self._layer is not None
+
+    def set_enabled(self, enabled: bool):
+        """
+        Sets whether the footprints layer should be shown
+        """
+        if enabled == self.is_enabled():
+            return
+
+        if enabled:
+            self._layer = self._create_layer()
+            self._layer.selectionChanged.connect(self._layer_selection_changed)
+            self._add_features(list(self._listings.values()))
+            self._canvas_layers_changed()
+        else:
+            layer = self._layer
+            self._layer = None
+            self._feature_ids = {}
+            self._listing_ids = {}
+            self._remove_from_canvas(layer)
+
+    def add_listings(self, listings: List[Listing]):
+        """
+        Adds listings to the results
+        """
+        listings = [listing for listing in listings if listing.id not in self._listings]
+        for listing in listings:
+            self._listings[listing.id] = listing
+
+        if self._layer is not None:
+            self._add_features(listings)
+
+    def remove_listing(self, listing: Listing):
+        """
+        Removes a listing from the results
+        """
+        self._remove_listing_ids([listing.id])
+
+    def set_listings(self, listings: List[Listing]):
+        """
+        Replaces the listings in the results, only adding and removing the
+        features for listings which differ from the current results
+        """
+        listing_ids = {listing.id for listing in listings}
+        self._remove_listing_ids([listing_id for listing_id in self._listings
+                                  if listing_id not in listing_ids])
+        self.add_listings(listings)
+
+    def _remove_listing_ids(self, listing_ids: List[int]):
+        """
+        Removes listings from the results, by listing id
+        """
+        feature_ids = []
+        for listing_id in listing_ids:
+            if self._listings.pop(listing_id, None) is None:
+                continue
+
+            feature_id = self._feature_ids.pop(listing_id, None)
+            if feature_id is not None:
+                del self._listing_ids[feature_id]
+                feature_ids.append(feature_id)
+
+        if feature_ids:
+            self._layer.dataProvider().deleteFeatures(feature_ids)
+            self._layer.triggerRepaint()
+
+    def clear(self):
+        """
+        Removes all listings from the results
+        """
+        self._listings = {}
+        self._feature_ids = {}
+        self._listing_ids = {}
+        if self._layer is not None:
+            self._layer.dataProvider().truncate()
+            self._layer.removeSelection()
+            self._layer.triggerRepaint()
+
+    def select_listing(self, listing: Listing):
+        """
+        Selects the footprint for a listing on the map
+        """
+        feature_id = self._feature_ids.get(listing.id)
+        if feature_id is None:
+            return
+
+        self._updating_selection = True
+        self._layer.selectByIds([feature_id])
+        self._updating_selection = False
+
+    @staticmethod
+    def _create_layer() -> QgsVectorLayer:
+        """
+        Creates a new footprints layer
+        """
+        layer = QgsVectorLayer(
+            'Polygon?crs=EPSG:4326&field=listing_id:long&field=title:string&index=yes',
+            ResultFootprintsLayer.LAYER_NAME, 'memory')
+
+        symbol = QgsFillSymbol.createSimple({
+            'color': '255,0,0,20',
+            'outline_color': '255,0,0,160',
+            'outline_width': '0.4'
+        })
+        layer.setRenderer(QgsSingleSymbolRenderer(symbol))
+        return layer
+
+    def _add_features(self, listings: List[Listing]):
+        """
+        Adds features for listings to the layer
+        """
+        features = []
+        feature_listings = []
+        for listing in listings:
+            if not listing.has_geometry():
+                continue
+
+            feature = QgsFeature(self._layer.fields())
+            feature.setAttributes([listing.id, listing.title])
+            feature.setGeometry(listing.geometry)
+            features.append(feature)
+            feature_listings.append(listing)
+
+        if not features:
+            return
+
+        ok, added_features = self._layer.dataProvider().addFeatures(features)
+        if not ok:
+            return
+
+        for listing, feature in zip(feature_listings, added_features):
+            self._feature_ids[listing.id] = feature.id()
+            self._listing_ids[feature.id()] = listing.id
+
+        self._layer.updateExtents()
+        self._layer.triggerRepaint()
+
+    def _layer_selection_changed(self):
+        """
+        Called when the selection in the footprints layer changes
+        """
+        if self._updating_selection:
+            return
+
+        self.selection_changed.emit([self._listing_ids[feature_id]
+                                     for feature_id in self._layer.selectedFeatureIds()
+                                     if feature_id in self._listing_ids])
+
+    def select_at_point(self, point: QgsPointXY):
+        """
+        Selects the footprints at a point on the map, in the canvas CRS
+        """
+        if self._layer is None:
+            return
+
+        tolerance = self.CLICK_TOLERANCE * self.canvas.mapUnitsPerPixel()
+        search_geometry = QgsGeometry.fromRect(
+            QgsRectangle(point.x() - tolerance, point.y() - tolerance,
+                         point.x() + tolerance, point.y() + tolerance))
+        try:
+            search_geometry.transform(QgsCoordinateTransform(
+                self.canvas.mapSettings().destinationCrs(),
+                QgsCoordinateReferenceSystem('EPSG:4326'),
+                QgsProject.instance()))
+        except QgsCsException:
+            return
+
+        request = QgsFeatureRequest().setFilterRect(search_geometry.boundingBox())
+        request.setFlags(QgsFeatureRequest.Flag.ExactIntersect)
+        request.setNoAttributes()
+        self._layer.selectByIds([feature.id() for feature in self._layer.getFeatures(request)])
+
+    def eventFilter(self, obj, event):  # pylint: disable=missing-function-docstring
+        if self._layer is None or not isinstance(self.canvas.mapTool(), QgsMapToolPan):
+            return False
+
+        if event.type() == QEvent.Type.MouseButtonPress and \
+                event.button() == Qt.MouseButton.LeftButton:
+            self._press_pos = event.pos()
+        elif event.type() == QEvent.Type.MouseButtonRelease and \
+                event.button() == Qt.MouseButton.LeftButton and self._press_pos is not None:
+            # only clicks select footprints, not drags to pan the map
+            if (event.pos() - self._press_pos).manhattanLength() < \
+                    QApplication.startDragDistance():
+                self.select_at_point(
+                    self.canvas.getCoordinateTransform().toMapCoordinates(event.pos()))
+            self._press_pos = None
+
+        return False
+
+    def _canvas_layers_changed(self):
+        """
+        Adds the footprints layer to the top of the canvas layers, if it is missing
+        """
+        if self._layer is None:
+            return
+
+        layers = self.canvas.layers()
+        if any(layer.id() == self._layer.id() for layer in layers):
+            return
+
+        self.canvas.setLayers([self._layer] + layers)
+
+    def _remove_from_canvas(self, layer: QgsVectorLayer):
+        """
+        Removes a footprints layer from the canvas layers
+        """
+        self.canvas.setLayers([canvas_layer for canvas_layer in self.canvas.layers()
+                               if canvas_layer.id() != layer.id()])
@@ -16,57 +16,430 @@ __revision__ = '$Format:%H$'
 
 from collections import defaultdict
 from functools import partial
+from typing import (
+    Dict,
+    Optional,
+    Set,
+    Tuple
+)
 
 from qgis.PyQt import sip
 from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
-from qgis.PyQt.QtCore import QUrl
-from qgis.PyQt.QtGui import QImage
+from qgis.PyQt.QtCore import (
+    Qt,
+    QBuffer,
+    QByteArray,
+    QIODevice,
+    QObject,
+    QRect,
+    QRunnable,
+    QSize,
+    QThreadPool,
+    QUrl,
+    pyqtSignal
+)
+from qgis.PyQt.QtGui import (
+    QBrush,
+    QColor,
+    QImage,
+    QImageReader,
+    QPainter,
+    QPainterPath
+)
 from qgis.PyQt.QtWidgets import QWidget
 
-from qgis.core import QgsNetworkAccessManager
+from qgis.core import (
+    QgsNetworkAccessManager,
+    QgsSettings
+)
 
+from ..core.network_metrics import NETWORK_METRICS
+from ..core.thumbnail_cache import (
+    ThumbnailMemoryCache,
+    ThumbnailDiskCache
+)
 
-class ThumbnailManager:
+# url, logical width, logical height, corner radius, device pixel ratio
+CardThumbnailKey = Tuple[str, int, int, int, float]
+
+
+def render_card_thumbnail(data: Optional[bytes],
+                          size: QSize,
+                          corner_radius: int,
+                          device_pixel_ratio: float) -> QImage:
+    """
+    Decodes raw thumbnail data and renders it as a card thumbnail, cropped
+    to fill the specified (logical) size with rounded left corners.
+
+    The image is decoded directly at the required size where the image format
+    supports it. This function is safe to call from a background thread.
+    """
+    image_size = QSize(int(size.width() * device_pixel_ratio),
+                       int(size.height() * device_pixel_ratio))
+
+    img = None
+    if data:
+        buffer = QBuffer()
+        buffer.setData(QByteArray(data))
+        buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+        reader = QImageReader(buffer)
+        reader.setAutoTransform(True)
+
+        source_size = reader.size()
+        scaled_by_reader = source_size.isValid() and not source_size.isEmpty()
+        if scaled_by_reader:
+            reader.setScaledSize(
+                source_size.scaled(image_size, Qt.AspectRatioMode.KeepAspectRatioByExpanding))
+
+        img = reader.read()
+        if img.isNull():
+            img = None
+        elif not scaled_by_reader:
+            # the reader couldn't determine the image size up front
+            img = img.scaled(image_size.width(),
+                             image_size.height(),
+                             Qt.AspectRatioMode.KeepAspectRatioByExpanding,
+                             Qt.TransformationMode.SmoothTransformation)
+
+    target = QImage(image_size, QImage.Format.Format_ARGB32_Premultiplied)
+    target.fill(Qt.GlobalColor.transparent)
+
+    painter = QPainter(target)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
+
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.setBrush(QBrush(QColor(255, 0, 0)))
+
+    # the mask path is defined in logical pixels
+    painter.scale(device_pixel_ratio, device_pixel_ratio)
+    path = QPainterPath()
+    path.moveTo(corner_radius, 0)
+    path.lineTo(size.width(), 0)
+    path.lineTo(size.width(), size.height())
+    path.lineTo(corner_radius, size.height())
+    path.arcTo(0,
+               size.height() - corner_radius * 2,
+               corner_radius * 2,
+               corner_radius * 2,
+               270, -90
+               )
+    path.lineTo(0, corner_radius)
+    path.arcTo(0,
+               0,
+               corner_radius * 2,
+               corner_radius * 2,
+               180, -90
+               )
+
+    painter.drawPath(path)
+    painter.resetTransform()
+    painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceIn)
+
+    if img is not None:
+        left = max(0, int((img.width() - image_size.width()) / 2))
+        top = max(0, int((img.height() - image_size.height()) / 2))
+        painter.drawImage(0, 0, img, left, top, image_size.width(), image_size.height())
+    else:
+        painter.setBrush(QBrush(QColor('#cccccc')))
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.drawRect(QRect(0, 0, image_size.width(), image_size.height()))
+    painter.end()
+
+    target.setDevicePixelRatio(device_pixel_ratio)
+    target.setDotsPerMeterX(
+        int(target.dotsPerMeterX() * device_pixel_ratio))
+    target.setDotsPerMeterY(int(
+        target.dotsPerMeterY() * device_pixel_ratio))
+
+    return target
+
+
+class CardThumbnailProcessor(QObject):
+    """
+    Receives processed card thumbnails from background tasks
+    """
+
+    processed = pyqtSignal(object, QImage)
+
+
+class CardThumbnailTask(QRunnable):
     """
-    Handles download, caching and display of thumbnails
+    Background task for rendering a card thumbnail
     """
 
+    def __init__(self, processor: CardThumbnailProcessor, key: CardThumbnailKey, data: bytes):
+        super().__init__()
+        self.processor = processor
+        self.key = key
+        self.data = data
+
+    def run(self):  # pylint: disable=missing-function-docstring
+        _, width, height, corner_radius, device_pixel_ratio = self.key
+        img = render_card_thumbnail(self.data, QSize(width, height), corner_radius,
+                                    device_pixel_ratio)
+        self.data = None
+        self.processor.processed.emit(self.key, img)
+
+
+class ThumbnailManager:  # pylint: disable=too-many-instance-attributes
+    """
+    Handles download, caching and display of thumbnails.
+
+    Downloads are scheduled by priority (lower values first) with a maximum
+    number of concurrent downloads. Queued and in-progress downloads are
+    cancelled when all the widgets waiting on them have been deleted or
+    released.
+    """
+
+    MAX_PROCESSING_THREADS = 4
+    DEFAULT_MAX_CONCURRENT_DOWNLOADS = 6
+
     def __init__(self):
-        self.cache = {}
+        # decoded full size thumbnails, limited by a memory budget
+        self.cache = ThumbnailMemoryCache()
+        # rendered card thumbnails, by card thumbnail key
+        self.card_cache = ThumbnailMemoryCache()
+        # raw thumbnail data, which persists between sessions
+        self.disk_cache = ThumbnailDiskCache()
+        # widgets waiting on full size thumbnails, by url
         self.widgets = defaultdict(list)
+        # widgets waiting on card thumbnails, by card thumbnail key
+        self.card_widgets = defaultdict(list)
         self.queued_replies = set()
+        # ids of waiting widgets which we are watching for deletion
+        self._watched_widgets: Set[int] = set()
+
+        # queued downloads, as priority by url
+        self._queue: Dict[str, float] = {}
+        # in-progress downloads, by url
+        self._downloads: Dict[str, QNetworkReply] = {}
+        # card thumbnails being rendered in the background, and their tasks
+        self._processing: Dict[CardThumbnailKey, CardThumbnailTask] = {}
+
+        self._processor: Optional[CardThumbnailProcessor] = None
+        self._thread_pool: Optional[QThreadPool] = None
+
+    @staticmethod
+    def max_concurrent_downloads() -> int:
+        """
+        Returns the maximum number of concurrent thumbnail downloads
+        """
+        return max(1, QgsSettings().value('soar/max_concurrent_thumbnail_downloads',
+                                          ThumbnailManager.DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+                                          int))
 
     def download(self, url: str, widget: QWidget):
         """
         Downloads a thumbnail from a url and applies it to a widget on completion
         """
-        if url in self.cache:
-            widget.set_thumbnail(self.cache[url])
+        img = self.cache.get(url)
+        if img is None:
+            data = self.disk_cache.data(url)
+            if data is not None:
+                img = QImage()
+                if img.loadFromData(data):
+                    self.cache.insert(url, img)
+                else:
+                    img = None
+
+        if img is not None:
+            NETWORK_METRICS.record_cache_hit('thumbnails')
+            widget.set_thumbnail(img)
         else:
-            self.widgets[url].append(widget)
-            reply = QgsNetworkAccessManager.instance().get(QNetworkRequest(QUrl(url)))
+            self._add_waiting_widget(self.widgets[url], widget)
+            self._request(url, 0)
+
+    def download_card(self,  # pylint: disable=too-many-arguments
+                      url: str,
+                      widget: QWidget,
+                      size: QSize,
+                      corner_radius: int,
+                      device_pixel_ratio: float,
+                      priority: float = 0):
+        """
+        Downloads a thumbnail from a url and applies it to a widget on completion,
+        rendered as a card thumbnail at the specified size and device pixel ratio.
+
+        Decoding and rendering of the thumbnail happens in a background thread.
+        """
+        key = (url, size.width(), size.height(), corner_radius, device_pixel_ratio)
+        img = self.card_cache.get(key)
+        if img is not None:
+            NETWORK_METRICS.record_cache_hit('thumbnails')
+            widget.set_thumbnail(img)
+            return
+
+        self._add_waiting_widget(self.card_widgets[key], widget)
+        if key in self._processing:
+            return
+
+        data = self.disk_cache.data(url)
+        if data is not None:
+            NETWORK_METRICS.record_cache_hit('thumbnails')
+            self._process_card(key, data)
+        else:
+            self._request(url, priority)
+
+    def set_priority(self, url: str, priority: float):
+        """
+        Sets the priority for a queued download. Lower values are downloaded first.
+        """
+        if url in self._queue:
+            self._queue[url] = priority
+
+    def release_widget(self, widget: QWidget):
+        """
+        Stops applying pending thumbnails to a widget, e.g. when the widget
+        is being reused for a different listing. Downloads which are no longer
+        required by any widget are cancelled.
+        """
+        self._remove_waiting_widget(id(widget))
+
+    def _add_waiting_widget(self, waiting: list, widget: QWidget):
+        """
+        Adds a widget to a list of widgets waiting on a thumbnail
+        """
+        if widget in waiting:
+            return
+
+        waiting.append(widget)
+        widget_id = id(widget)
+        if widget_id not in self._watched_widgets:
+            self._watched_widgets.add(widget_id)
+            widget.destroyed.connect(partial(self._widget_destroyed, widget_id))
+
+    def _widget_destroyed(self, widget_id: int):
+        """
+        Called when a widget waiting on a thumbnail is destroyed
+        """
+        self._watched_widgets.discard(widget_id)
+        self._remove_waiting_widget(widget_id)
+
+    def _remove_waiting_widget(self, widget_id: int):
+        """
+        Removes a widget from all waiting lists, cancelling any downloads
+        which are no longer required
+        """
+        for waiting_widgets in (self.widgets, self.card_widgets):
+            for key in list(waiting_widgets.keys()):
+                remaining = [w for w in waiting_widgets[key]
+                             if id(w) != widget_id and not sip.isdeleted(w)]
+                if remaining:
+                    waiting_widgets[key] = remaining
+                else:
+                    del waiting_widgets[key]
+
+        required_urls = set(self.widgets.keys())
+        required_urls.update(key[0] for key in self.card_widgets)
+
+        for url in list(self._queue.keys()):
+            if url not in required_urls:
+                del self._queue[url]
+
+        for key, task in list(self._processing.items()):
+            if key not in self.card_widgets and self._thread_pool.tryTake(task):
+                del self._processing[key]
+
+        for url, reply in list(self._downloads.items()):
+            if url not in required_urls and not sip.isdeleted(reply):
+                # triggers thumbnail_downloaded
+                reply.abort()
+
+    def _request(self, url: str, priority: float):
+        """
+        Queues a thumbnail download, if it isn't already being downloaded
+        """
+        if url in self._downloads:
+            return
+
+        self._queue[url] = min(priority, self._queue.get(url, priority))
+        self._start_next()
+
+    def _start_next(self):
+        """
+        Starts queued downloads, up to the concurrency limit
+        """
+        max_concurrent = self.max_concurrent_downloads()
+        while self._queue and len(self._downloads) < max_concurrent:
+            url = min(self._queue.keys(), key=self._queue.get)
+            del self._queue[url]
+
+            request = QNetworkRequest(QUrl(url))
+            NETWORK_METRICS.tag_request(request, 'thumbnails')
+            reply = QgsNetworkAccessManager.instance().get(request)
+            self._downloads[url] = reply
             self.queued_replies.add(reply)
             if reply.isFinished():
-                self.thumbnail_downloaded(reply)
+                self.thumbnail_downloaded(reply, url)
             else:
-                reply.finished.connect(partial(self.thumbnail_downloaded, reply))
+                reply.finished.connect(partial(self.thumbnail_downloaded, reply, url))
 
-    def thumbnail_downloaded(self, reply):
+    def thumbnail_downloaded(self, reply: QNetworkReply, url: str):
         """
         Called when a thumbnail has been fetched
         """
-        self.queued_replies.remove(reply)
-        if reply.error() == QNetworkReply.NetworkError.NoError:
-            url = reply.url().toString()
+        self.queued_replies.discard(reply)
+        if self._downloads.get(url) == reply:
+            del self._downloads[url]
+
+        card_keys = [key for key in self.card_widgets
+                     if key[0] == url and key not in self._processing]
+
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            self.widgets.pop(url, None)
+            for key in card_keys:
+                del self.card_widgets[key]
+            self._start_next()
+            return
+
+        data = reply.readAll().data()
+        self.disk_cache.store(url, data)
+
+        for key in card_keys:
+            self._process_card(key, data)
+
+        widgets = self.widgets.pop(url, [])
+        if widgets:
             img = QImage()
-            img.loadFromData(reply.readAll())
-            self.cache[url] = img
-            for w in self.widgets[url]:
+            if img.loadFromData(data):
+                self.cache.insert(url, img)
+            for w in widgets:
                 # the widget might have been deleted
                 if not sip.isdeleted(w):
                     w.set_thumbnail(img)
 
-            del self.widgets[url]
+        self._start_next()
+
+    def _process_card(self, key: CardThumbnailKey, data: bytes):
+        """
+        Starts a background task to render a card thumbnail
+        """
+        if self._thread_pool is None:
+            self._thread_pool = QThreadPool()
+            self._thread_pool.setMaxThreadCount(
+                max(1, min(self.MAX_PROCESSING_THREADS, QThreadPool.globalInstance().maxThreadCount())))
+            self._processor = CardThumbnailProcessor()
+            self._processor.processed.connect(self._card_processed,
+                                              Qt.ConnectionType.QueuedConnection)
+
+        task = CardThumbnailTask(self._processor, key, data)
+        # the pool must not delete the task, as we may need to take it back from the queue
+        task.setAutoDelete(False)
+        self._processing[key] = task
+        self._thread_pool.start(task)
+
+    def _card_processed(self, key: CardThumbnailKey, img: QImage):
+        """
+        Called when a card thumbnail has been rendered
+        """
+        self._processing.pop(key, None)
+        self.card_cache.insert(key, img)
+
+        for w in self.card_widgets.pop(key, []):
+            # the widget might have been deleted
+            if not sip.isdeleted(w):
+                w.set_thumbnail(img)
 
 
 THUMBNAIL_MANAGER_INSTANCE = ThumbnailManager()
@@ -77,3 +450,19 @@ def download_thumbnail(url, widget):
     Downloads a thumbnail and automatically applies it to a widget when fetched
     """
     THUMBNAIL_MANAGER_INSTANCE.download(url, widget)
+
+
+def download_card_thumbnail(url: str,  # pylint: disable=too-many-arguments
+                            widget,
+                            size: QSize,
+                            corner_radius: int,
+                            device_pixel_ratio: float,
+                            priority: float = 0):
+    """
+    Downloads a thumbnail and automatically applies it to a widget when fetched,
+    rendered as a card thumbnail.
+
+    Lower priority values are downloaded first.
+    """
+    THUMBNAIL_MANAGER_INSTANCE.download_card(url, widget, size, corner_radius,
+                                             device_pixel_ratio, priority)
@@ -41,10 +41,13 @@ from qgis.gui import (
 )
 
 from .core import (
+    API_CLIENT,
     ProjectManager,
     MapValidator,
     MapPublisher,
-    SoarEarthProvider
+    SoarEarthProvider,
+    NETWORK_METRICS,
+    NetworkMetrics
 )
 from .gui import (
     GuiUtils,
@@ -174,12 +177,22 @@ class SoarPlugin:
 
         LOGIN_MANAGER.status_changed.connect(self._login_status_changed)
 
+        self.project_manager.refresh_scheduler.progress_changed.connect(
+            self._layer_refresh_progress)
+        self.project_manager.refresh_scheduler.finished.connect(
+            self._layer_refresh_finished)
+
     def initProcessing(self):
         """Create the Processing provider"""
         QgsApplication.processingRegistry().addProvider(self.provider)
 
     def unload(self):
         QgsApplication.processingRegistry().removeProvider(self.provider)
+
+        self.project_manager.refresh_scheduler.progress_changed.disconnect(
+            self._layer_refresh_progress)
+        self.project_manager.refresh_scheduler.finished.disconnect(
+            self._layer_refresh_finished)
         self.provider = None
 
         if self.map_dialog and not sip.isdeleted(self.map_dialog):
@@ -207,6 +220,18 @@ class SoarPlugin:
             QgsGui.sourceSelectProviderRegistry().removeProvider(self.source_select_provider)
         self.source_select_provider = None
 
+        if NETWORK_METRICS.log_level() > NetworkMetrics.LOG_NONE:
+            NETWORK_METRICS.log_summary()
+        metrics_path = NetworkMetrics.dump_path()
+        if metrics_path:
+            try:
+                NETWORK_METRICS.dump_json(metrics_path)
+            except OSError:
+                pass
+        NETWORK_METRICS.stop()
+
+        API_CLIENT.listings_cache.flush()
+
         QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete)
 
     # pylint: enable=missing-function-docstring
@@ -232,6 +257,19 @@ class SoarPlugin:
         """
         self.logout_action.setEnabled(status == LoginStatus.LoggedIn)
 
+    def _layer_refresh_progress(self, completed: int, total: int):
+        """
+        Called when the progress of a bulk Soar layer refresh changes
+        """
+        self.iface.statusBarIface().showMessage(
+            self.tr('Refreshing Soar layers ({}/{})').format(completed, total))
+
+    def _layer_refresh_finished(self):
+        """
+        Called when a bulk Soar layer refresh has finished
+        """
+        self.iface.statusBarIface().clearMessage()
+
     def _logout(self):
         """
         Triggers a logout
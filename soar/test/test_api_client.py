@@ -245,6 +245,45 @@ class ApiClientTest(unittest.TestCase):
         self.assertEqual(listing.tile_url_expiry_at.toUTC(),
                          QDateTime(QDate(2022, 12, 2), QTime(16, 0, 17, 0), Qt.TimeSpec(1)))
 
+    def test_listing_lazy_attributes(self):
+        """
+        Test that lazily materialized listing attributes behave as normal attributes
+        """
+        listing = Listing()
+        self.assertFalse(hasattr(listing, '__dict__'))
+        self.assertEqual(listing.metadata, {})
+        self.assertIsNone(listing.geometry)
+        self.assertFalse(listing.has_geometry())
+        self.assertFalse(listing.created_at.isValid())
+        self.assertFalse(listing.updated_at.isValid())
+        self.assertFalse(listing.tile_url_expiry_at.isValid())
+
+        listing = Listing.from_json({
+            'metadata': '{"tc": true}',
+            'geometryWKT': 'POLYGON((48.1 38.1,48 38.1,48 38,48.1 38,48.1 38.1))',
+            'createdAt': 1630467771,
+        })
+        self.assertTrue(listing.has_geometry())
+        self.assertEqual(listing.metadata, {'tc': True})
+        self.assertEqual(listing.geometry.asWkt(1),
+                         'Polygon ((48.1 38.1, 48 38.1, 48 38, 48.1 38, 48.1 38.1))')
+        # materialized values must be reused
+        self.assertIs(listing.geometry, listing.geometry)
+        self.assertIs(listing.metadata, listing.metadata)
+        self.assertEqual(listing.created_at.toUTC(),
+                         QDateTime(QDate(2021, 9, 1), QTime(3, 42, 51, 0), Qt.TimeSpec(1)))
+
+        listing.geometry = None
+        self.assertFalse(listing.has_geometry())
+
+        # unparseable WKT is not a geometry
+        listing = Listing.from_json({'geometryWKT': 'POLYGON((48.1 38.1,'})
+        self.assertFalse(listing.has_geometry())
+        listing.metadata = {'a': 1}
+        self.assertEqual(listing.metadata, {'a': 1})
+        listing.created_at = QDateTime(QDate(2020, 1, 1), QTime(0, 0))
+        self.assertEqual(listing.created_at, QDateTime(QDate(2020, 1, 1), QTime(0, 0)))
+
     def test_listing_to_layer(self):
         """
         Test converting a listing to a QGIS layer
@@ -393,6 +432,32 @@ class ApiClientTest(unittest.TestCase):
         self.assertEqual(self._result.id, 10464)
         self.assertEqual(self._result.file_size, 3894594)
 
+    def test_fetch_listing_coalesced(self):
+        """
+        Test that concurrent listing fetches share a single request
+        """
+        client = ApiClient()
+        results = []
+
+        client.fetch_listing(10464, results.append)
+        client.fetch_listing(10464, results.append)
+        self.assertEqual(len(client._listing_replies), 1)  # pylint: disable=protected-access
+        reply = list(client._listing_replies.values())[0]  # pylint: disable=protected-access
+
+        spy = QSignalSpy(reply.finished)
+        spy.wait()
+
+        self.assertEqual(len(results), 2)
+        self.assertIs(results[0], results[1])
+        self.assertEqual(results[0].id, 10464)
+        self.assertFalse(client._listing_replies)  # pylint: disable=protected-access
+
+        # should be immediately returned from memo cache
+        client.fetch_listing(10464, results.append)
+        self.assertEqual(len(results), 3)
+        self.assertIs(results[2], results[0])
+        self.assertFalse(client._listing_replies)  # pylint: disable=protected-access
+
 
 if __name__ == "__main__":
     suite = unittest.makeSuite(ApiClientTest)
@@ -0,0 +1,116 @@
+# coding=utf-8
+"""Browse widget Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+from unittest import mock
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsGeometry,
+    QgsRectangle,
+    QgsSettings
+)
+
+from .utilities import get_qgis_app
+from ..core.client import Listing
+from ..core.footprint_index import ListingFootprintIndex
+from ..core.tile_grid import snap_extent_to_tile_grid
+from ..gui import (
+    browse_widget,
+    listings_browser_widget
+)
+from ..gui.browse_widget import BrowseWidget
+
+QGIS_APP = get_qgis_app()
+IFACE = QGIS_APP[2]
+
+
+def _listing(listing_id: int, x_min: float, x_max: float, y: float) -> Listing:
+    """
+    Creates a listing with a small footprint
+    """
+    footprint = QgsGeometry.fromRect(QgsRectangle(x_min, y - 0.01, x_max, y + 0.01))
+    return Listing.from_json({'id': listing_id, 'title': f'listing {listing_id}',
+                              'geometryWKT': footprint.asWkt()})
+
+
+class BrowseWidgetTest(unittest.TestCase):
+    """Test browse widget work."""
+
+    def tearDown(self):
+        QgsSettings().remove('soar/snap_aoi_to_tiles')
+
+    def test_filter_within_snapped_tiles(self):
+        """
+        Test that panning within the same snapped tiles filters the
+        results to the visible area
+        """
+        QgsSettings().setValue('soar/snap_aoi_to_tiles', True)
+
+        canvas = IFACE.mapCanvas()
+        canvas.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:4326'))
+        canvas.setExtent(QgsRectangle(10.0, 0.2, 10.5, 0.7))
+        extent = canvas.extent()
+
+        # a pan which stays within the snapped tiles
+        snapped = snap_extent_to_tile_grid(extent)
+        dx = (snapped.xMaximum() - extent.xMaximum()) / 2
+        self.assertGreater(dx, 0)
+        y = extent.center().y()
+
+        with mock.patch.object(browse_widget, 'iface', IFACE), \
+                mock.patch.object(listings_browser_widget, 'iface', IFACE):
+            widget = BrowseWidget()
+            widget.restrict_to_map_extent.setChecked(True)
+            widget._update_query_timeout.stop()  # pylint: disable=protected-access
+
+            # results fetched for the snapped area of interest
+            query = widget._build_query()  # pylint: disable=protected-access
+            browser = widget.browser
+            browser._current_query = query  # pylint: disable=protected-access
+            browser._footprint_index = ListingFootprintIndex(query.aoi)  # pylint: disable=protected-access
+            browser._footprint_index.add_listings([  # pylint: disable=protected-access
+                # only visible before the pan
+                _listing(1, extent.xMinimum(), extent.xMinimum() + dx / 2, y),
+                # only visible after the pan
+                _listing(2, extent.xMaximum() + dx / 4, extent.xMaximum() + dx / 2, y),
+                _listing(3, extent.center().x(), extent.center().x() + dx / 2, y),
+            ])
+            browser.filter_to_aoi(widget._build_query(snap_aoi=False).aoi)  # pylint: disable=protected-access
+
+            visible_counts = []
+            browser.visible_count_changed.connect(visible_counts.append)
+            self.assertEqual(
+                sorted(browser.footprints_layer._listings.keys()),  # pylint: disable=protected-access
+                [1, 3])
+
+            canvas.setExtent(QgsRectangle(extent.xMinimum() + dx, extent.yMinimum(),
+                                          extent.xMaximum() + dx, extent.yMaximum()))
+            self.assertTrue(widget._build_query().aoi.equals(query.aoi))  # pylint: disable=protected-access
+            # filtered locally, without a new query
+            self.assertFalse(widget._update_query_timeout.isActive())  # pylint: disable=protected-access
+            self.assertEqual(visible_counts, [2])
+            self.assertEqual(
+                sorted(browser.footprints_layer._listings.keys()),  # pylint: disable=protected-access
+                [2, 3])
+
+            canvas.extentsChanged.disconnect(widget._map_extent_changed)  # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BrowseWidgetTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,194 @@
+# coding=utf-8
+"""Export estimator Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QSize,
+    QThread
+)
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsFeature,
+    QgsGeometry,
+    QgsMapSettings,
+    QgsRectangle,
+    QgsSettings,
+    QgsVectorLayer
+)
+
+from .utilities import get_qgis_app
+from ..core.export_estimator import (
+    ExportEstimator,
+    LayerRenderCost
+)
+from ..core.map_exporter import (
+    MapExportSettings,
+    OutputCompression
+)
+from ..core.tiled_renderer import TiledMapRenderer
+
+QGIS_APP = get_qgis_app()
+
+
+def _export_settings(width: int, height: int) -> MapExportSettings:
+    """
+    Returns export settings for testing
+    """
+    settings = MapExportSettings()
+    settings.size = QSize(width, height)
+    settings.tile_size = 2048
+    settings.max_parallel_jobs = 2
+    settings.compression = OutputCompression.NoCompression
+    settings.cloud_optimized = False
+    return settings
+
+
+def _map_settings(width: int, height: int) -> QgsMapSettings:
+    """
+    Returns map settings for testing
+    """
+    map_settings = QgsMapSettings()
+    map_settings.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:3857'))
+    map_settings.setExtent(QgsRectangle(0, 0, width * 10, height * 10))
+    map_settings.setOutputSize(QSize(width, height))
+    map_settings.setOutputDpi(96)
+    return map_settings
+
+
+class ExportEstimatorTest(unittest.TestCase):
+    """Test export estimator work."""
+
+    def tearDown(self):
+        QgsSettings().remove('soar/export_max_memory_mb')
+        QgsSettings().remove('soar/export_upload_bandwidth_mbps')
+
+    def test_layer_render_cost(self):
+        """
+        Test layer render costs
+        """
+        cost = LayerRenderCost(0.5, 0.001)
+        self.assertAlmostEqual(cost.render_time(1000), 1.5)
+
+    def test_trial_map_settings(self):
+        """
+        Test trial render map settings are at the same scale as the export
+        """
+        map_settings = _map_settings(4000, 2000)
+        estimator = ExportEstimator(map_settings)
+
+        trial_settings = estimator.trial_map_settings(256)
+        self.assertEqual(trial_settings.outputSize(), QSize(256, 128))
+        self.assertAlmostEqual(trial_settings.outputDpi(), 96 * 256 / 4000)
+        self.assertAlmostEqual(trial_settings.scale(), map_settings.scale(), -1)
+
+    def test_sample(self):
+        """
+        Test sampling layer render costs via background trial renders
+        """
+        layer = QgsVectorLayer('Polygon?crs=EPSG:3857', 'layer', 'memory')
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromWkt('Polygon((0 0, 1000 0, 1000 1000, 0 0))'))
+        layer.dataProvider().addFeatures([feature])
+
+        map_settings = _map_settings(1000, 1000)
+        map_settings.setLayers([layer])
+        estimator = ExportEstimator(map_settings)
+        finished = []
+        estimator.sampling_finished.connect(lambda: finished.append(True))
+
+        # sampling does not block
+        estimator.sample()
+        self.assertTrue(estimator.is_sampling())
+        self.assertFalse(estimator.is_sampled())
+
+        while estimator.is_sampling():
+            QCoreApplication.processEvents()
+
+        self.assertEqual(finished, [True])
+        self.assertTrue(estimator.is_sampled())
+        self.assertEqual(list(estimator.layer_costs.keys()), [layer.id()])
+
+        # canceled sampling is not completed
+        estimator.sample()
+        estimator.cancel()
+        self.assertFalse(estimator.is_sampling())
+        self.assertFalse(estimator.is_sampled())
+        QCoreApplication.processEvents()
+        self.assertEqual(finished, [True])
+
+    def test_render_sizes(self):
+        """
+        Test that calculated render sizes match the tiled renderer's render areas
+        """
+        for width, height, tile_size in ((1000, 600, 512),
+                                         (3000, 2000, 256),
+                                         (500, 400, 512),
+                                         (1000, 600, 0)):
+            renderer = TiledMapRenderer(_map_settings(width, height), tile_size, 2)
+            render_rects = [renderer.render_rect(tile) for tile in renderer.tiles()]
+
+            widths = ExportEstimator.render_sizes(width, tile_size)
+            heights = ExportEstimator.render_sizes(height, tile_size)
+            self.assertEqual(sorted(w * h for h in heights for w in widths),
+                             sorted(rect.width() * rect.height() for rect in render_rects))
+
+    def test_estimate(self):
+        """
+        Test estimating export costs
+        """
+        QgsSettings().setValue('soar/export_upload_bandwidth_mbps', 8)
+
+        estimator = ExportEstimator(_map_settings(10000, 10000))
+        settings = _export_settings(10000, 10000)
+
+        estimate = estimator.estimate(settings)
+        self.assertEqual(estimate.tile_size, 2048)
+        self.assertFalse(estimate.tile_size_reduced)
+        self.assertEqual(estimate.tile_count, 25)
+        # two concurrent 2560px square jobs, each with a labeling and composed image
+        self.assertEqual(estimate.peak_memory, 2 * 2560 * 2560 * 2 * 4)
+        self.assertEqual(estimate.file_size, 400000000)
+        self.assertAlmostEqual(estimate.upload_time, 400)
+        self.assertFalse(estimate.warnings)
+
+        # tiles are reduced to fit within the memory limit
+        QgsSettings().setValue('soar/export_max_memory_mb', 50)
+        estimate = estimator.estimate(settings)
+        self.assertEqual(estimate.tile_size, 1024)
+        self.assertTrue(estimate.tile_size_reduced)
+        self.assertEqual(estimate.peak_memory, 2 * 1536 * 1536 * 2 * 4)
+
+        estimator.layer_costs = {'layer': LayerRenderCost(1, 0)}
+        estimate = estimator.estimate(settings)
+        self.assertAlmostEqual(estimate.render_time,
+                               estimate.tile_count / min(QThread.idealThreadCount(), 2))
+
+    def test_format_duration(self):
+        """
+        Test formatting durations
+        """
+        self.assertEqual(ExportEstimator.format_duration(None), '?')
+        self.assertEqual(ExportEstimator.format_duration(0.2), '1 s')
+        self.assertEqual(ExportEstimator.format_duration(150), '2 min')
+        self.assertEqual(ExportEstimator.format_duration(5400), '1.5 h')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ExportEstimatorTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
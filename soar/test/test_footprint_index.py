@@ -0,0 +1,102 @@
+# coding=utf-8
+"""Listing footprint index Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.core import (
+    QgsGeometry,
+    QgsRectangle
+)
+
+from .utilities import get_qgis_app
+from ..core.client import Listing
+from ..core.footprint_index import ListingFootprintIndex
+
+QGIS_APP = get_qgis_app()
+
+
+def _listing(listing_id: int, wkt: str = None) -> Listing:
+    """
+    Creates a listing with an optional footprint
+    """
+    return Listing.from_json({'id': listing_id, 'geometryWKT': wkt})
+
+
+class ListingFootprintIndexTest(unittest.TestCase):
+    """Test listing footprint index work."""
+
+    def test_covers(self):
+        """
+        Test checking whether an area of interest is covered
+        """
+        index = ListingFootprintIndex()
+        self.assertIsNone(index.coverage)
+        # unfiltered results cover everything
+        self.assertTrue(index.covers(None))
+        self.assertTrue(index.covers(QgsGeometry.fromRect(QgsRectangle(1, 2, 3, 4))))
+
+        index = ListingFootprintIndex(QgsGeometry.fromRect(QgsRectangle(0, 0, 10, 10)))
+        self.assertTrue(index.covers(QgsGeometry.fromRect(QgsRectangle(1, 2, 3, 4))))
+        self.assertFalse(index.covers(QgsGeometry.fromRect(QgsRectangle(5, 5, 15, 15))))
+        self.assertFalse(index.covers(None))
+
+    def test_intersecting(self):
+        """
+        Test filtering listings by area of interest
+        """
+        index = ListingFootprintIndex()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.intersecting(QgsGeometry.fromRect(QgsRectangle(0, 0, 1, 1))), [])
+
+        index.add_listings([
+            _listing(1, 'POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))'),
+            _listing(2, 'POLYGON((5 5, 6 5, 6 6, 5 6, 5 5))'),
+            _listing(3),
+        ])
+        self.assertEqual(len(index), 3)
+        self.assertEqual([listing.id for listing in index.listings()], [1, 2, 3])
+
+        self.assertEqual([listing.id for listing in index.intersecting(None)], [1, 2, 3])
+        self.assertEqual(
+            [listing.id for listing in index.intersecting(
+                QgsGeometry.fromRect(QgsRectangle(0.5, 0.5, 2, 2)))],
+            [1, 3])
+
+        # bounding box intersects, but geometry does not
+        self.assertEqual(
+            [listing.id for listing in index.intersecting(
+                QgsGeometry.fromWkt('POLYGON((2 0.5, 2 2, 0.5 2, 2 0.5))'))],
+            [3])
+
+        # listings added after the index was built
+        index.add_listings([_listing(4, 'POLYGON((0.5 0.5, 3 0.5, 3 3, 0.5 3, 0.5 0.5))')])
+        aoi = QgsGeometry.fromRect(QgsRectangle(0.5, 0.5, 2, 2))
+        self.assertEqual([listing.id for listing in index.intersecting(aoi)], [1, 3, 4])
+        self.assertEqual([listing.id for listing in index.intersecting(aoi, 3)], [4])
+
+        # candidates and listings without footprints are merged in order
+        index.add_listings([_listing(5),
+                            _listing(6, 'POLYGON((1 1, 2 1, 2 2, 1 2, 1 1))'),
+                            _listing(7, 'POLYGON((5 5, 6 5, 6 6, 5 6, 5 5))')])
+        self.assertEqual([listing.id for listing in index.intersecting(aoi)], [1, 3, 4, 5, 6])
+        self.assertEqual([listing.id for listing in index.intersecting(aoi, 3)], [4, 5, 6])
+        self.assertEqual([listing.id for listing in index.intersecting(aoi, 5)], [6])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ListingFootprintIndexTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
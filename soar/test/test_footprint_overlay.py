@@ -0,0 +1,67 @@
+# coding=utf-8
+"""Footprint overlay Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.core import QgsCoordinateReferenceSystem
+from qgis.gui import QgsMapCanvas
+
+from .utilities import get_qgis_app
+from ..core.client import Listing
+from ..gui.footprint_overlay import FootprintOverlay
+
+QGIS_APP = get_qgis_app()
+
+
+class FootprintOverlayTest(unittest.TestCase):
+    """Test footprint overlay work."""
+
+    def test_footprints(self):
+        """
+        Test transformed footprint caching
+        """
+        canvas = QgsMapCanvas()
+        canvas.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:4326'))
+        overlay = FootprintOverlay(canvas)
+
+        listing = Listing.from_json({'id': 1,
+                                     'geometryWKT': 'POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))'})
+        self.assertIsNone(overlay.footprint(Listing.from_json({'id': 2, 'geometryWKT': None})))
+
+        footprint = overlay.footprint(listing)
+        self.assertAlmostEqual(footprint.boundingBox().xMaximum(), 1, 3)
+        # cached footprint is reused
+        self.assertIs(overlay.footprint(listing), footprint)
+
+        overlay.highlight(listing)
+        self.assertEqual(overlay.highlighted_listing, listing)
+
+        # cache is invalidated when the canvas CRS changes
+        canvas.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:3857'))
+        footprint = overlay.footprint(listing)
+        self.assertAlmostEqual(footprint.boundingBox().xMaximum(), 111319.49, 1)
+        self.assertEqual(overlay.highlighted_listing, listing)
+
+        overlay.clear_highlight(Listing.from_json({'id': 2, 'geometryWKT': None}))
+        self.assertEqual(overlay.highlighted_listing, listing)
+        overlay.clear_highlight(listing)
+        self.assertIsNone(overlay.highlighted_listing)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(FootprintOverlayTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,134 @@
+# coding=utf-8
+"""Layer refresh scheduler Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+from unittest import mock
+
+from qgis.core import (
+    QgsProject,
+    QgsSettings,
+    QgsVectorLayer
+)
+
+from .utilities import get_qgis_app
+from ..core import layer_refresh
+from ..core.layer_refresh import LayerRefreshScheduler
+
+QGIS_APP = get_qgis_app()
+
+
+def _soar_layer(project: QgsProject, listing_id: int, visible: bool = True) -> QgsVectorLayer:
+    """
+    Returns a layer for a Soar listing, added to a project
+    """
+    layer = QgsVectorLayer('Point', str(listing_id), 'memory')
+    layer.setCustomProperty('_soar_layer_id', listing_id)
+    project.addMapLayer(layer)
+    project.layerTreeRoot().findLayer(layer.id()).setItemVisibilityChecked(visible)
+    return layer
+
+
+class LayerRefreshSchedulerTest(unittest.TestCase):
+    """Test layer refresh scheduler work."""
+
+    def tearDown(self):
+        QgsSettings().remove('soar/max_concurrent_layer_refreshes')
+
+    def test_scheduling(self):
+        """
+        Test deduplication, ordering and concurrency of layer refreshes
+        """
+        QgsSettings().setValue('soar/max_concurrent_layer_refreshes', 2)
+
+        project = QgsProject()
+        hidden = _soar_layer(project, 1, visible=False)
+        visible_1 = _soar_layer(project, 2)
+        visible_2 = _soar_layer(project, 2)
+        visible_3 = _soar_layer(project, 3)
+        hidden_2 = _soar_layer(project, 4, visible=False)
+
+        scheduler = LayerRefreshScheduler(project)
+        progress = []
+        scheduler.progress_changed.connect(lambda done, total: progress.append((done, total)))
+        finished = []
+        scheduler.finished.connect(lambda: finished.append(True))
+
+        requests = []
+        with mock.patch.object(layer_refresh, 'API_CLIENT') as client:
+            client.fetch_listing.side_effect = \
+                lambda listing_id, callback: requests.append((listing_id, callback))
+
+            scheduler.add_layers([hidden, visible_1, visible_2, visible_3, hidden_2])
+            self.assertTrue(scheduler.is_active())
+            # layers sharing a listing are fetched once, visible layers first,
+            # limited to the maximum concurrent requests
+            self.assertEqual([r[0] for r in requests], [2, 3])
+            self.assertEqual(progress, [(0, 4)])
+
+            # already queued listings are not added again
+            scheduler.add_layers([hidden, visible_1])
+            self.assertEqual(progress[-1], (0, 4))
+
+            requests[0][1](None)
+            self.assertEqual([r[0] for r in requests], [2, 3, 1])
+            self.assertEqual(progress[-1], (1, 4))
+
+            for _, callback in requests[1:]:
+                callback(None)
+            self.assertEqual([r[0] for r in requests], [2, 3, 1, 4])
+            self.assertFalse(finished)
+
+            requests[-1][1](None)
+
+        self.assertEqual(progress[-1], (4, 4))
+        self.assertEqual(finished, [True])
+        self.assertFalse(scheduler.is_active())
+
+    def test_cancel(self):
+        """
+        Test canceling queued layer refreshes
+        """
+        QgsSettings().setValue('soar/max_concurrent_layer_refreshes', 1)
+
+        project = QgsProject()
+        layers = [_soar_layer(project, listing_id) for listing_id in (1, 2, 3)]
+
+        scheduler = LayerRefreshScheduler(project)
+        finished = []
+        scheduler.finished.connect(lambda: finished.append(True))
+
+        requests = []
+        with mock.patch.object(layer_refresh, 'API_CLIENT') as client:
+            client.fetch_listing.side_effect = \
+                lambda listing_id, callback: requests.append((listing_id, callback))
+
+            scheduler.add_layers(layers)
+            scheduler.cancel()
+            # in progress requests are still completed
+            self.assertTrue(scheduler.is_active())
+            self.assertFalse(finished)
+
+            requests[0][1](None)
+
+        self.assertEqual([r[0] for r in requests], [1])
+        self.assertEqual(finished, [True])
+        self.assertFalse(scheduler.is_active())
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LayerRefreshSchedulerTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,300 @@
+# coding=utf-8
+"""Listing model benchmarks.
+
+Benchmarks the listing model hot paths using synthetic listings payloads,
+reporting the time and peak Python memory allocation per operation.
+
+Benchmarks are skipped unless the SOAR_BENCHMARKS environment variable is set.
+Results are logged and compared against the baseline stored in
+data/listing_benchmarks.json, and the test fails if any operation regresses
+beyond REGRESSION_FACTOR. Operations without a baseline are reported but not
+compared. Set the SOAR_UPDATE_BENCHMARK_BASELINE environment variable to store
+the results as the new baseline, and commit the updated file.
+
+The listing counts to benchmark can be set via SOAR_BENCHMARK_SIZES, e.g.
+SOAR_BENCHMARK_SIZES=1000,10000
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import json
+import logging
+import math
+import os
+import random
+import time
+import tracemalloc
+import unittest
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Tuple
+)
+
+from qgis.core import Qgis
+
+from .utilities import get_qgis_app
+from ..core.client import (
+    Listing,
+    ListingQuery
+)
+
+QGIS_APP = get_qgis_app()
+LOGGER = logging.getLogger('QGIS')
+
+BENCHMARKS_ENABLED = bool(os.environ.get('SOAR_BENCHMARKS'))
+UPDATE_BASELINE = bool(os.environ.get('SOAR_UPDATE_BENCHMARK_BASELINE'))
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# creating map layers is much more expensive than the other operations,
+# so the number of listings used for this operation is capped
+MAX_LAYER_COUNT = 1000
+
+BASELINE_PATH = Path(__file__).parent / 'data' / 'listing_benchmarks.json'
+
+# an operation is considered a regression if it takes longer than this factor
+# of its baseline time (or allocates more than this factor of its baseline memory)
+REGRESSION_FACTOR = 1.5
+# differences below these are considered noise
+TIME_TOLERANCE_SECONDS = 0.05
+MEMORY_TOLERANCE_BYTES = 1024 * 1024
+
+
+def benchmark_sizes() -> List[int]:
+    """
+    Returns the listing counts to benchmark
+    """
+    sizes = os.environ.get('SOAR_BENCHMARK_SIZES')
+    if not sizes:
+        return list(DEFAULT_SIZES)
+
+    return [int(size) for size in sizes.split(',') if size.strip()]
+
+
+def synthetic_footprint_wkt(rng: random.Random) -> str:
+    """
+    Generates a footprint polygon WKT, similar to the irregular scene
+    footprints returned by the listings api
+    """
+    center_x = rng.uniform(-175, 175)
+    center_y = rng.uniform(-80, 80)
+    radius = rng.uniform(0.01, 2)
+    vertex_count = rng.randint(4, 60)
+
+    points = []
+    for i in range(vertex_count):
+        angle = 2 * math.pi * i / vertex_count
+        distance = radius * rng.uniform(0.7, 1.0)
+        points.append(f'{center_x + distance * math.cos(angle):.8f} '
+                      f'{center_y + distance * math.sin(angle):.8f}')
+    points.append(points[0])
+
+    return f"POLYGON(({','.join(points)}))"
+
+
+def synthetic_listing_json(listing_id: int, rng: random.Random) -> dict:
+    """
+    Generates a listing JSON object, in the form returned by the listings api
+    """
+    user_id = f'{rng.getrandbits(128):032x}'
+    filehash = f'{rng.getrandbits(128):032x}'
+    title = f'Synthetic listing {listing_id}'
+    description = 'Synthetic imagery listing ' * rng.randint(1, 20)
+    created_at = rng.randint(1500000000, 1670000000)
+    return {
+        'owner': user_id,
+        'metadata': json.dumps({'description': description,
+                                'category': 'satellite',
+                                'title': title,
+                                'tc': True,
+                                'tags': []}),
+        'previewUrl': f'https://short-preview.soar.earth/preview%2F{filehash}.tiff.png',
+        'avatarUrl': f'https://avatar.soar.earth/{user_id}.png/preview',
+        'description': description,
+        'minZoom': rng.randint(8, 16),
+        'listingType': 'TILE_LAYER',
+        'title': title,
+        'userName': f'user{listing_id % 100}',
+        'userId': user_id,
+        'tags': rng.sample(['flood', 'emergency', 'fire', 'urban', 'ocean', 'drone'], 2),
+        'createdAt': created_at,
+        'totalComments': rng.randint(0, 10),
+        'filename': f'browser/prod/{user_id}@soar/{filehash}.tiff',
+        'totalViews': rng.randint(0, 10000),
+        'id': listing_id,
+        'filehash': filehash,
+        'totalLikes': rng.randint(0, 100),
+        'categories': rng.sample(['marine', 'environment', 'urban', 'agriculture'], 2),
+        'geometryWKT': synthetic_footprint_wkt(rng),
+        'updatedAt': created_at + rng.randint(0, 10000000),
+        'tileUrl': f'https://shared-tile.soar.earth/images/browser/prod/{user_id}@soar/'
+                   f'{filehash}.tif/tile?z={{z}}&x={{x}}&y={{y}}&access_token={filehash * 8}',
+        'tileUrlExpiryAt': created_at + 864000
+    }
+
+
+def synthetic_payload(count: int, seed: int = 10465) -> List[dict]:
+    """
+    Generates a synthetic listings payload
+    """
+    rng = random.Random(seed)
+    return [synthetic_listing_json(listing_id, rng) for listing_id in range(1, count + 1)]
+
+
+def measure(setup: Callable[[], object], func: Callable[[object], object]) -> Tuple[float, int]:
+    """
+    Measures a function, returning the elapsed time in seconds and the
+    peak memory allocated in bytes.
+
+    The function is called with the result of setup(), which is excluded from
+    the measurements. Time and memory are measured in separate runs, so that
+    the timing isn't affected by the memory tracing overhead.
+    """
+    data = setup()
+    start = time.perf_counter()
+    func(data)
+    elapsed = time.perf_counter() - start
+
+    data = setup()
+    tracemalloc.start()
+    try:
+        func(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def run_benchmarks(count: int) -> Dict[str, Dict[str, float]]:
+    """
+    Runs all benchmarks for a payload of the specified size
+    """
+    payload = synthetic_payload(count)
+
+    def parse_listings():
+        return [Listing.from_json(listing_json) for listing_json in payload]
+
+    # geometries are parsed lazily, so parse them ahead of the operations which
+    # depend on them to avoid including the geometry parsing in their results
+    parsed_listings = parse_listings()
+    for listing in parsed_listings:
+        _ = listing.geometry
+
+    queries = [ListingQuery(keywords='flood', aoi=listing.geometry)
+               for listing in parsed_listings]
+
+    operations = {
+        'from_json': (lambda: payload, lambda _: parse_listings()),
+        'geometry': (parse_listings,
+                     lambda listings: [listing.geometry for listing in listings]),
+        'to_qgis_layer_source_string': (lambda: parsed_listings,
+                                        lambda listings: [listing.to_qgis_layer_source_string()
+                                                          for listing in listings]),
+        'to_layer_metadata': (lambda: parsed_listings,
+                              lambda listings: [listing.to_layer_metadata()
+                                                for listing in listings]),
+        'to_qgis_layer': (lambda: parsed_listings[:MAX_LAYER_COUNT],
+                          lambda listings: [listing.to_qgis_layer() for listing in listings]),
+        'to_query_parameters': (lambda: queries,
+                                lambda queries: [query.to_query_parameters()
+                                                 for query in queries]),
+    }
+
+    results = {}
+    for name, (setup, func) in operations.items():
+        elapsed, peak = measure(setup, func)
+        results[name] = {'seconds': elapsed, 'peak_bytes': peak}
+
+    return results
+
+
+def load_baseline() -> dict:
+    """
+    Loads the stored benchmark baseline
+    """
+    if not BASELINE_PATH.exists():
+        return {}
+
+    return json.loads(BASELINE_PATH.read_text(encoding='utf-8'))
+
+
+def store_baseline(results: Dict[str, Dict[str, Dict[str, float]]]):
+    """
+    Stores benchmark results as the new baseline
+    """
+    BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    BASELINE_PATH.write_text(json.dumps({
+        'qgis_version': Qgis.QGIS_VERSION,
+        'results': results
+    }, indent=2), encoding='utf-8')
+
+
+@unittest.skipUnless(BENCHMARKS_ENABLED, 'Set SOAR_BENCHMARKS=1 to run benchmarks')
+class ListingBenchmarks(unittest.TestCase):
+    """Benchmark the listing model."""
+
+    def test_benchmarks(self):
+        """
+        Run benchmarks and compare against the baseline
+        """
+        baseline = load_baseline()
+        baseline_results = baseline.get('results', {})
+
+        results = {}
+        report = []
+        regressions = []
+        for count in benchmark_sizes():
+            size_results = run_benchmarks(count)
+            results[str(count)] = size_results
+
+            for name, result in size_results.items():
+                line = f'{count:>7} {name:<30} {result["seconds"]:>9.3f}s ' \
+                       f'{result["peak_bytes"] / 1024 / 1024:>9.1f}MB'
+
+                previous = baseline_results.get(str(count), {}).get(name)
+                if previous:
+                    line += f' (baseline {previous["seconds"]:.3f}s, ' \
+                            f'{previous["peak_bytes"] / 1024 / 1024:.1f}MB)'
+                    if result['seconds'] > previous['seconds'] * REGRESSION_FACTOR + \
+                            TIME_TOLERANCE_SECONDS:
+                        regressions.append(f'{name} ({count}): time {result["seconds"]:.3f}s, '
+                                           f'baseline {previous["seconds"]:.3f}s')
+                    if result['peak_bytes'] > previous['peak_bytes'] * REGRESSION_FACTOR + \
+                            MEMORY_TOLERANCE_BYTES:
+                        regressions.append(f'{name} ({count}): peak memory '
+                                           f'{result["peak_bytes"]} bytes, baseline '
+                                           f'{previous["peak_bytes"]} bytes')
+                else:
+                    line += ' (no baseline)'
+                LOGGER.info(line)
+                report.append(line)
+
+        if UPDATE_BASELINE:
+            store_baseline(results)
+            LOGGER.info('Stored benchmark baseline in %s', BASELINE_PATH)
+            return
+
+        self.assertFalse(regressions,
+                         'Regressions against baseline from QGIS {}:\n{}\n\n{}'.format(
+                             baseline.get('qgis_version'), '\n'.join(regressions),
+                             '\n'.join(report)))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ListingBenchmarks)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,182 @@
+# coding=utf-8
+"""Listings cache Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import tempfile
+import time
+import unittest
+
+from .utilities import get_qgis_app
+from ..core.client import ListingQuery
+from ..core.listings_cache import ListingsCache
+
+QGIS_APP = get_qgis_app()
+
+
+class ListingsCacheTest(unittest.TestCase):
+    """Test listings cache work."""
+
+    def test_cache_key(self):
+        """
+        Test cache key generation
+        """
+        query = ListingQuery(keywords='flood', category='marine')
+        key = ListingsCache.cache_key(query.to_query_parameters(), 'soar.earth')
+
+        # same parameters, different order
+        self.assertEqual(ListingsCache.cache_key(
+            {'category': 'marine',
+             'listingType': 'TILE_LAYER',
+             'limit': 50,
+             'keywords': 'flood'}, 'soar.earth'), key)
+
+        # different domain
+        self.assertNotEqual(ListingsCache.cache_key(query.to_query_parameters(), 'test.earth'),
+                            key)
+        # different query
+        query.offset = 20
+        self.assertNotEqual(ListingsCache.cache_key(query.to_query_parameters(), 'soar.earth'),
+                            key)
+
+    def test_store_and_retrieve(self):
+        """
+        Test storing and retrieving responses
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ListingsCache(temp_dir, ttl=100, max_size=1000)
+            self.assertIsNone(cache.entry('a'))
+            self.assertIsNone(cache.body('a'))
+
+            cache.store('a', b'{"listings": []}', etag='"abc"',
+                        last_modified='Tue, 22 Nov 2022 10:00:00 GMT')
+            entry = cache.entry('a')
+            self.assertEqual(entry.etag, '"abc"')
+            self.assertEqual(entry.last_modified, 'Tue, 22 Nov 2022 10:00:00 GMT')
+            self.assertEqual(entry.size, 16)
+            self.assertTrue(cache.is_fresh(entry))
+            self.assertEqual(cache.body('a'), b'{"listings": []}')
+            self.assertEqual(cache.fresh_body('a'), b'{"listings": []}')
+
+            # cache should persist
+            cache2 = ListingsCache(temp_dir, ttl=100, max_size=1000)
+            self.assertEqual(cache2.entry('a').etag, '"abc"')
+            self.assertEqual(cache2.body('a'), b'{"listings": []}')
+
+            cache2.clear()
+            self.assertIsNone(cache2.entry('a'))
+            self.assertEqual(cache2.total_size(), 0)
+
+    def test_deferred_index_write(self):
+        """
+        Test that cache reads don't rewrite the index immediately
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ListingsCache(temp_dir, ttl=100, max_size=1000)
+            cache.store('a', b'aaaa')
+            index_path = cache.path() / ListingsCache.INDEX_FILE
+            index = index_path.read_text(encoding='utf8')
+
+            self.assertEqual(cache.body('a'), b'aaaa')
+            self.assertEqual(index_path.read_text(encoding='utf8'), index)
+
+            cache.flush()
+            cache2 = ListingsCache(temp_dir, ttl=100, max_size=1000)
+            self.assertAlmostEqual(cache2.entry('a').accessed_at,
+                                   cache.entry('a').accessed_at)
+
+    def test_ttl(self):
+        """
+        Test cache freshness
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ListingsCache(temp_dir, ttl=100, max_size=1000)
+            cache.store('a', b'aaaa')
+            cache.entry('a').stored_at = time.time() - 200
+
+            self.assertFalse(cache.is_fresh(cache.entry('a')))
+            self.assertIsNone(cache.fresh_body('a'))
+            # stale entries are still available for revalidation
+            self.assertEqual(cache.body('a'), b'aaaa')
+
+            cache.mark_revalidated('a')
+            self.assertTrue(cache.is_fresh(cache.entry('a')))
+            self.assertEqual(cache.fresh_body('a'), b'aaaa')
+
+    def test_writer(self):
+        """
+        Test storing responses incrementally
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ListingsCache(temp_dir, ttl=100, max_size=10)
+            writer = cache.writer('a')
+            writer.write(b'aa')
+            writer.write(b'aa')
+            # not stored until committed
+            self.assertIsNone(cache.entry('a'))
+            writer.commit(etag='"abc"')
+            self.assertEqual(cache.body('a'), b'aaaa')
+            self.assertEqual(cache.entry('a').etag, '"abc"')
+            self.assertEqual(cache.total_size(), 4)
+
+            # discarded writes leave the existing entry alone
+            writer = cache.writer('a')
+            writer.write(b'bb')
+            writer.discard()
+            self.assertEqual(cache.body('a'), b'aaaa')
+
+            # too large to cache
+            writer = cache.writer('b')
+            writer.write(b'b' * 6)
+            writer.write(b'b' * 6)
+            self.assertFalse(writer.is_valid())
+            writer.commit()
+            self.assertIsNone(cache.entry('b'))
+            self.assertFalse(list(cache.path().glob('*.partial')))
+
+            cache.set_max_size(0)
+            self.assertIsNone(cache.writer('c'))
+
+    def test_eviction(self):
+        """
+        Test least recently used eviction
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ListingsCache(temp_dir, ttl=100, max_size=10)
+            cache.store('a', b'aaaa')
+            cache.entry('a').accessed_at -= 30
+            cache.store('b', b'bbbb')
+            cache.entry('b').accessed_at -= 20
+            # touch a, so b becomes least recently used
+            cache.body('a')
+            cache.store('c', b'cccc')
+
+            self.assertIsNotNone(cache.entry('a'))
+            self.assertIsNone(cache.entry('b'))
+            self.assertIsNotNone(cache.entry('c'))
+            self.assertEqual(cache.total_size(), 8)
+
+            # too large to ever cache
+            cache.store('d', b'd' * 11)
+            self.assertIsNone(cache.entry('d'))
+
+            cache.set_max_size(5)
+            self.assertEqual(cache.total_size(), 4)
+            self.assertIsNotNone(cache.entry('c'))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ListingsCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Listings stream parser Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import json
+import unittest
+
+from .utilities import get_qgis_app
+from ..core.listings_stream import ListingsStreamParser
+
+QGIS_APP = get_qgis_app()
+
+
+class ListingsStreamParserTest(unittest.TestCase):
+    """Test incremental listings parsing."""
+
+    def test_chunked_parsing(self):
+        """
+        Test parsing a response split into chunks of varying size
+        """
+        response = {
+            'total': 3,
+            'other': {'listings': [1, 2, 'x]'], 'title': 'not "the" listings'},
+            'listings': [{'id': i,
+                          'title': 'Ürümqi "}]' * i,
+                          'geometryWKT': 'POLYGON((1 1,2 1,2 2,1 1))'} for i in range(30)],
+            'count': 12345
+        }
+        data = json.dumps(response, ensure_ascii=False).encode()
+
+        for chunk_size in (1, 2, 7, 64, len(data)):
+            parser = ListingsStreamParser()
+            listings = []
+            for i in range(0, len(data), chunk_size):
+                listings.extend(parser.feed(data[i:i + chunk_size]))
+            listings.extend(parser.finish())
+            self.assertTrue(parser.is_done())
+            self.assertEqual(listings, response['listings'])
+
+    def test_listings_emitted_progressively(self):
+        """
+        Test that listings are returned as soon as they are complete
+        """
+        parser = ListingsStreamParser()
+        self.assertEqual(parser.feed(b'{"listings": [{"id": 1}, {"id"'), [{'id': 1}])
+        self.assertEqual(parser.feed(b': 2}'), [{'id': 2}])
+        self.assertEqual(parser.feed(b']}'), [])
+        self.assertEqual(parser.finish(), [])
+        self.assertTrue(parser.is_done())
+
+    def test_empty(self):
+        """
+        Test parsing an empty listings response
+        """
+        parser = ListingsStreamParser()
+        self.assertEqual(parser.feed(b'{"listings": []}'), [])
+        self.assertEqual(parser.finish(), [])
+
+    def test_invalid(self):
+        """
+        Test parsing incomplete or invalid responses
+        """
+        parser = ListingsStreamParser()
+        parser.feed(b'{"listings": [{"id": 1}')
+        with self.assertRaises(ValueError):
+            parser.finish()
+
+        parser = ListingsStreamParser()
+        with self.assertRaises(ValueError):
+            parser.feed(b'["listings"]')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ListingsStreamParserTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
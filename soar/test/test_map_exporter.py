@@ -0,0 +1,112 @@
+# coding=utf-8
+"""Map exporter Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.PyQt.QtCore import QSize
+
+from .utilities import get_qgis_app
+from ..core.map_exporter import (
+    MapExportSettings,
+    OutputCompression
+)
+
+QGIS_APP = get_qgis_app()
+
+
+class MapExporterTest(unittest.TestCase):
+    """Test map exporter work."""
+
+    def test_output_compression(self):
+        """
+        Test output compression methods
+        """
+        self.assertEqual(OutputCompression.from_string('deflate'), OutputCompression.Deflate)
+        self.assertEqual(OutputCompression.from_string('WEBP'), OutputCompression.Webp)
+        self.assertIsNone(OutputCompression.from_string('xxx'))
+        self.assertIsNone(OutputCompression.from_string(None))
+
+        self.assertTrue(OutputCompression.Jpeg.is_lossy())
+        self.assertFalse(OutputCompression.Zstd.is_lossy())
+        self.assertTrue(OutputCompression.NoCompression.is_available())
+        self.assertTrue(OutputCompression.Deflate.is_available())
+
+    def test_creation_options(self):
+        """
+        Test output creation options
+        """
+        settings = MapExportSettings()
+        settings.compression = OutputCompression.Deflate
+        settings.cloud_optimized = True
+        options = settings.creation_options()
+        self.assertIn('COMPRESS=DEFLATE', options)
+        self.assertIn('PREDICTOR=YES', options)
+        self.assertIn('BLOCKSIZE=512', options)
+        self.assertIn('NUM_THREADS=ALL_CPUS', options)
+
+        settings.cloud_optimized = False
+        options = settings.creation_options()
+        self.assertIn('PREDICTOR=2', options)
+        self.assertIn('TILED=YES', options)
+        self.assertIn('BLOCKXSIZE=512', options)
+
+        self.assertIn('ALPHA=YES', options)
+        self.assertFalse(settings.uses_mask_band())
+
+        # JPEG compressed GeoTIFFs have a mask band instead of an alpha band
+        settings.compression = OutputCompression.Jpeg
+        settings.quality = 60
+        options = settings.creation_options()
+        self.assertIn('COMPRESS=JPEG', options)
+        self.assertIn('QUALITY=60', options)
+        self.assertIn('PHOTOMETRIC=YCBCR', options)
+        self.assertNotIn('ALPHA=YES', options)
+        self.assertTrue(settings.uses_mask_band())
+
+        settings.cloud_optimized = True
+        self.assertFalse(settings.uses_mask_band())
+
+    def test_estimated_file_size(self):
+        """
+        Test estimating output file sizes
+        """
+        settings = MapExportSettings()
+        settings.size = QSize(1000, 1000)
+        settings.compression = OutputCompression.NoCompression
+        settings.cloud_optimized = False
+        self.assertEqual(settings.estimated_file_size(), 4000000)
+
+        # overviews add a third
+        settings.cloud_optimized = True
+        self.assertEqual(settings.estimated_file_size(), 5333333)
+
+        settings.compression = OutputCompression.Jpeg
+        settings.quality = 75
+        jpeg_size = settings.estimated_file_size()
+        self.assertLess(jpeg_size, 5333333 / 10)
+
+        settings.quality = 95
+        self.assertGreater(settings.estimated_file_size(), jpeg_size)
+
+        settings.quality = 75
+        settings.compression = OutputCompression.Webp
+        self.assertLess(settings.estimated_file_size(), jpeg_size)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(MapExporterTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,97 @@
+# coding=utf-8
+"""Network metrics Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from qgis.PyQt.QtCore import QUrl
+from qgis.PyQt.QtNetwork import QNetworkRequest
+
+from .utilities import get_qgis_app
+from ..core.network_metrics import (
+    EndpointMetrics,
+    NetworkMetrics
+)
+
+QGIS_APP = get_qgis_app()
+
+
+class NetworkMetricsTest(unittest.TestCase):
+    """Test network metrics work."""
+
+    def test_normalize_endpoint(self):
+        """
+        Test endpoint normalization
+        """
+        self.assertEqual(NetworkMetrics.normalize_endpoint('listings'), 'listings')
+        self.assertEqual(NetworkMetrics.normalize_endpoint('listings/123'), 'listings/{id}')
+        self.assertEqual(NetworkMetrics.normalize_endpoint('listings/123/comments'),
+                         'listings/{id}/comments')
+        self.assertEqual(NetworkMetrics.normalize_endpoint('listings/upload'), 'listings/upload')
+
+    def test_endpoint_metrics(self):
+        """
+        Test endpoint metrics
+        """
+        metrics = EndpointMetrics('listings')
+        self.assertIsNone(metrics.mean_latency_ms())
+        metrics.completed = 2
+        metrics.total_latency_ms = 300
+        metrics.status_codes[200] += 2
+        self.assertEqual(metrics.mean_latency_ms(), 150)
+        self.assertEqual(metrics.as_dict()['status_codes'], {'200': 2})
+
+    def test_tag_request(self):
+        """
+        Test tagging requests
+        """
+        metrics = NetworkMetrics()
+        request = QNetworkRequest(QUrl('https://api.soar.earth/v1/listings/5'))
+        metrics.tag_request(request, 'listings/5')
+        self.assertEqual(request.attribute(NetworkMetrics.ENDPOINT_ATTRIBUTE), 'listings/{id}')
+        metrics.stop()
+
+    def test_cache_hits(self):
+        """
+        Test recording cache hits and dumping metrics
+        """
+        metrics = NetworkMetrics()
+        self.assertIsNone(metrics.endpoint_metrics('listings'))
+        self.assertEqual(metrics.to_json(), {'endpoints': []})
+
+        metrics.record_cache_hit('listings')
+        metrics.record_cache_hit('listings')
+        metrics.record_cache_hit('listings/7')
+        self.assertEqual(metrics.endpoint_metrics('listings').cache_hits, 2)
+        self.assertEqual(metrics.endpoint_metrics('listings/8').cache_hits, 1)
+        self.assertEqual([e['endpoint'] for e in metrics.to_json()['endpoints']],
+                         ['listings', 'listings/{id}'])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / 'metrics.json'
+            metrics.dump_json(str(path))
+            self.assertEqual(json.loads(path.read_text(encoding='utf-8')), metrics.to_json())
+
+        metrics.reset()
+        self.assertEqual(metrics.metrics(), {})
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(NetworkMetricsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,175 @@
+# coding=utf-8
+"""Responsive table Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.PyQt.QtCore import QRect
+from qgis.PyQt.QtWidgets import (
+    QSizePolicy,
+    QSpacerItem,
+    QWidget
+)
+
+from .utilities import get_qgis_app
+from ..core.client import Listing
+from ..gui.listing_items import (
+    EmptyDatasetItemWidget,
+    ListingItemWidget
+)
+from ..gui.responsive_table_layout import (
+    ResponsiveTableLayout,
+    ResponsiveTableWidget
+)
+
+QGIS_APP = get_qgis_app()
+
+
+class ResponsiveTableTest(unittest.TestCase):
+    """Test responsive table work."""
+
+    def test_layout(self):
+        """
+        Test incremental layout
+        """
+        layout = ResponsiveTableLayout(None, 10, 10)
+        layout.setContentsMargins(0, 0, 16, 16)
+
+        def create_item():
+            return QSpacerItem(306, 102, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Fixed)
+
+        items = [create_item() for _ in range(5)]
+        for item in items:
+            layout.addItem(item)
+
+        # two columns
+        self.assertEqual(layout.heightForWidth(916), 3 * 102 + 2 * 10 + 16)
+        # one column
+        self.assertEqual(layout.heightForWidth(500), 5 * 102 + 4 * 10 + 16)
+
+        layout.setGeometry(QRect(0, 0, 916, 342))
+        self.assertEqual(layout.column_count(), 2)
+        self.assertEqual(items[0].geometry(), QRect(0, 0, 445, 102))
+        self.assertEqual(items[3].geometry(), QRect(455, 112, 445, 102))
+        self.assertEqual(items[4].geometry(), QRect(0, 224, 445, 102))
+
+        # append items
+        items.append(create_item())
+        items.append(create_item())
+        layout.addItem(items[5])
+        layout.addItem(items[6])
+        self.assertEqual(layout.heightForWidth(916), 4 * 102 + 3 * 10 + 16)
+        layout.setGeometry(QRect(0, 0, 916, 454))
+        self.assertEqual(items[5].geometry(), QRect(455, 224, 445, 102))
+        self.assertEqual(items[6].geometry(), QRect(0, 336, 445, 102))
+
+        # remove an item, subsequent items are re-flowed
+        layout.takeAt(1)
+        self.assertEqual(layout.heightForWidth(916), 3 * 102 + 2 * 10 + 16)
+        layout.setGeometry(QRect(0, 0, 916, 342))
+        self.assertEqual(items[0].geometry(), QRect(0, 0, 445, 102))
+        self.assertEqual(items[2].geometry(), QRect(455, 0, 445, 102))
+        self.assertEqual(items[6].geometry(), QRect(455, 224, 445, 102))
+
+        # change column count
+        layout.setGeometry(QRect(0, 0, 500, 666))
+        self.assertEqual(layout.column_count(), 1)
+        self.assertEqual(items[2].geometry(), QRect(0, 112, 484, 102))
+
+        layout.set_items([])
+        self.assertEqual(layout.heightForWidth(916), 0)
+
+    def test_virtualized_cards(self):
+        """
+        Test that cards are only created close to the visible area, and are reused
+        """
+        viewport = QWidget()
+        viewport.resize(300, 250)
+        table = ResponsiveTableWidget(viewport)
+
+        for _ in range(100):
+            table.push_empty_widget()
+
+        table.resize(300, table.layout().heightForWidth(300))
+        table.layout().setGeometry(table.rect())
+
+        # rows are 112px apart, so rows within 250px (the viewport height)
+        # of the visible area have cards
+        cards = viewport.findChildren(EmptyDatasetItemWidget)
+        self.assertEqual(len(cards), 5)
+        self.assertEqual(sorted(card.y() for card in cards), [0, 112, 224, 336, 448])
+
+        table.clear()
+        for _ in range(100):
+            table.push_empty_widget()
+        table.layout().setGeometry(table.rect())
+
+        # existing cards are reused
+        self.assertEqual(len(viewport.findChildren(EmptyDatasetItemWidget)), 5)
+
+        table.remove_empty_widgets()
+        table.layout().setGeometry(table.rect())
+        self.assertEqual(len([card for card in viewport.findChildren(EmptyDatasetItemWidget)
+                              if not card.isHidden()]), 0)
+
+    def test_set_listings(self):
+        """
+        Test replacing the listings shown in the table with only the differences applied
+        """
+        viewport = QWidget()
+        viewport.resize(300, 250)
+        table = ResponsiveTableWidget(viewport)
+
+        listings = []
+        for listing_id in range(4):
+            listing = Listing()
+            listing.id = listing_id
+            listing.title = f'listing {listing_id}'
+            listings.append(listing)
+
+        for listing in listings[:3]:
+            table.push_listing(listing)
+        table.push_empty_widget()
+
+        table.resize(300, table.layout().heightForWidth(300))
+        table.layout().setGeometry(table.rect())
+
+        cards = {card.listing.id: card for card in table.listing_widgets()}
+        self.assertEqual(set(cards.keys()), {0, 1, 2})
+
+        refreshed = Listing()
+        refreshed.id = 2
+        refreshed.title = 'refreshed'
+        table.set_listings([refreshed, listings[0], listings[3]])
+        table.layout().setGeometry(table.rect())
+
+        self.assertEqual([entry.listing.id for entry in table._entries], [2, 0, 3])
+        new_cards = {card.listing.id: card for card in table.listing_widgets()}
+        self.assertEqual(set(new_cards.keys()), {0, 2, 3})
+        # cards for listings which are still present are kept
+        self.assertIs(new_cards[0], cards[0])
+        self.assertIs(new_cards[2], cards[2])
+        self.assertEqual(new_cards[2].title_label.text(), 'refreshed')
+        self.assertEqual(new_cards[2].y(), 0)
+        self.assertEqual(new_cards[0].y(), 112)
+        # the removed listing's card is reused
+        self.assertIs(new_cards[3], cards[1])
+        self.assertEqual(len(viewport.findChildren(ListingItemWidget)), 3)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ResponsiveTableTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
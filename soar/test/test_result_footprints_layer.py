@@ -0,0 +1,119 @@
+# coding=utf-8
+"""Result footprints layer Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.PyQt.QtTest import QSignalSpy
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsPointXY,
+    QgsProject,
+    QgsRectangle,
+    QgsVectorLayer
+)
+from qgis.gui import QgsMapCanvas
+
+from .utilities import get_qgis_app
+from ..core.client import Listing
+from ..gui.result_footprints_layer import ResultFootprintsLayer
+
+QGIS_APP = get_qgis_app()
+
+
+def _listing(listing_id: int, wkt: str = None) -> Listing:
+    """
+    Creates a listing with an optional footprint
+    """
+    return Listing.from_json({'id': listing_id, 'title': f'listing {listing_id}',
+                              'geometryWKT': wkt})
+
+
+class ResultFootprintsLayerTest(unittest.TestCase):
+    """Test result footprints layer work."""
+
+    def test_layer(self):
+        """
+        Test the footprints layer
+        """
+        canvas = QgsMapCanvas()
+        canvas.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:4326'))
+        canvas.resize(600, 400)
+        canvas.setExtent(QgsRectangle(-1, -1, 7, 7))
+
+        footprints = ResultFootprintsLayer(canvas)
+        listing_1 = _listing(1, 'POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))')
+        listing_2 = _listing(2, 'POLYGON((5 5, 6 5, 6 6, 5 6, 5 5))')
+
+        # listings added before the layer is enabled are shown when it is enabled
+        footprints.add_listings([listing_1, _listing(3)])
+        self.assertIsNone(footprints.layer())
+
+        footprints.set_enabled(True)
+        layer = footprints.layer()
+        self.assertEqual(layer.featureCount(), 1)
+
+        # layer is shown in the canvas only, not added to the project
+        self.assertEqual([canvas_layer.id() for canvas_layer in canvas.layers()], [layer.id()])
+        self.assertNotIn(layer.id(), QgsProject.instance().mapLayers())
+
+        # layer is restored when the canvas layers are reset
+        other_layer = QgsVectorLayer('Point', 'other', 'memory')
+        canvas.setLayers([other_layer])
+        self.assertEqual([canvas_layer.id() for canvas_layer in canvas.layers()], [layer.id(), other_layer.id()])
+
+        footprints.add_listings([listing_1, listing_2])
+        self.assertEqual(layer.featureCount(), 2)
+        self.assertEqual(sorted(f['listing_id'] for f in layer.getFeatures()), [1, 2])
+
+        spy = QSignalSpy(footprints.selection_changed)
+        # selecting from cards doesn't emit selection_changed
+        footprints.select_listing(listing_2)
+        self.assertEqual(layer.selectedFeatureCount(), 1)
+        self.assertEqual(len(spy), 0)
+
+        layer.selectByIds([f.id() for f in layer.getFeatures()])
+        self.assertEqual(len(spy), 1)
+        self.assertEqual(sorted(spy[-1][0]), [1, 2])
+
+        # selecting footprints from the map
+        footprints.select_at_point(QgsPointXY(0.5, 0.5))
+        self.assertEqual(spy[-1][0], [1])
+        footprints.select_at_point(QgsPointXY(3, 3))
+        self.assertEqual(spy[-1][0], [])
+
+        footprints.remove_listing(listing_1)
+        self.assertEqual(layer.featureCount(), 1)
+
+        # only the differences are applied when replacing the listings
+        kept_feature_id = next(layer.getFeatures()).id()
+        footprints.set_listings([listing_2, listing_1])
+        self.assertEqual(sorted(f['listing_id'] for f in layer.getFeatures()), [1, 2])
+        self.assertIn(kept_feature_id, [f.id() for f in layer.getFeatures()])
+        footprints.set_listings([listing_1])
+        self.assertEqual([f['listing_id'] for f in layer.getFeatures()], [1])
+
+        footprints.clear()
+        self.assertEqual(layer.featureCount(), 0)
+
+        footprints.set_enabled(False)
+        self.assertFalse(footprints.is_enabled())
+        self.assertEqual([canvas_layer.id() for canvas_layer in canvas.layers()], [other_layer.id()])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ResultFootprintsLayerTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
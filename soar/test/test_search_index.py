@@ -0,0 +1,81 @@
+# coding=utf-8
+"""Listing search index Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from .utilities import get_qgis_app
+from ..core.client import Listing
+from ..core.search_index import ListingSearchIndex
+
+QGIS_APP = get_qgis_app()
+
+
+class ListingSearchIndexTest(unittest.TestCase):
+    """Test listing search index work."""
+
+    def test_tokenize(self):
+        """
+        Test splitting text into search terms
+        """
+        self.assertEqual(ListingSearchIndex.tokenize(None), [])
+        self.assertEqual(ListingSearchIndex.tokenize(''), [])
+        self.assertEqual(ListingSearchIndex.tokenize('Flood map, Brisbane-2022'),
+                         ['flood', 'map', 'brisbane', '2022'])
+
+    def test_search(self):
+        """
+        Test searching the index
+        """
+        index = ListingSearchIndex()
+        self.assertEqual(index.search('flood'), [])
+
+        index.add_listings([
+            Listing.from_json({'id': 1, 'title': 'Flood map of Brisbane',
+                               'description': 'River flooding', 'tags': ['flood'],
+                               'categories': ['climate']}),
+            Listing.from_json({'id': 2, 'title': 'Brisbane city',
+                               'tags': ['urban'], 'categories': ['urban']}),
+            Listing.from_json({'id': 3, 'title': 'Sydney floods',
+                               'description': 'flood', 'categories': ['marine']}),
+        ])
+        self.assertEqual(len(index), 3)
+
+        self.assertEqual([listing.id for listing in index.search('')], [])
+        self.assertEqual([listing.id for listing in index.search('brisbane')], [1, 2])
+        self.assertEqual([listing.id for listing in index.search('BRISBANE')], [1, 2])
+        self.assertEqual([listing.id for listing in index.search('marine')], [3])
+        # all terms must match
+        self.assertEqual([listing.id for listing in index.search('flood brisbane')], [1])
+        # partially typed final term
+        self.assertEqual([listing.id for listing in index.search('flood bris')], [1])
+        self.assertEqual([listing.id for listing in index.search('flo')], [1, 3])
+        # final term is complete
+        self.assertEqual([listing.id for listing in index.search('flo ')], [])
+        self.assertEqual([listing.id for listing in index.search('flood', limit=1)], [1])
+
+        # update an existing listing
+        index.add_listings([
+            Listing.from_json({'id': 2, 'title': 'Brisbane flood extent'})
+        ])
+        self.assertEqual(len(index), 3)
+        self.assertEqual([listing.id for listing in index.search('flood')], [1, 2, 3])
+        self.assertEqual([listing.id for listing in index.search('urban')], [])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ListingSearchIndexTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,119 @@
+# coding=utf-8
+"""Thumbnail cache Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import os
+import tempfile
+import time
+import unittest
+
+from qgis.PyQt.QtGui import QImage
+
+from .utilities import get_qgis_app
+from ..core.thumbnail_cache import (
+    ThumbnailMemoryCache,
+    ThumbnailDiskCache
+)
+
+QGIS_APP = get_qgis_app()
+
+
+class ThumbnailCacheTest(unittest.TestCase):
+    """Test thumbnail cache work."""
+
+    def test_memory_cache(self):
+        """
+        Test the in-memory thumbnail cache
+        """
+        image = QImage(10, 10, QImage.Format.Format_ARGB32)
+        image_size = ThumbnailMemoryCache.image_size(image)
+        self.assertEqual(image_size, 400)
+
+        cache = ThumbnailMemoryCache(max_size=image_size * 2)
+        self.assertIsNone(cache.get('a'))
+
+        cache.insert('a', QImage(image))
+        cache.insert('b', QImage(image))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size(), image_size * 2)
+
+        # mark a as recently used
+        self.assertIsNotNone(cache.get('a'))
+
+        cache.insert('c', QImage(image))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.size(), image_size * 2)
+
+        # too big to cache
+        cache.insert('d', QImage(100, 100, QImage.Format.Format_ARGB32))
+        self.assertNotIn('d', cache)
+
+        cache.set_max_size(image_size)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('c', cache)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size(), 0)
+
+    def test_disk_cache(self):
+        """
+        Test the on-disk thumbnail cache
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ThumbnailDiskCache(temp_dir, max_size=10, max_age_days=1)
+            self.assertIsNone(cache.data('a'))
+
+            cache.store('a', b'aaaa')
+            cache.store('b', b'bbbb')
+            self.assertEqual(cache.size(), 8)
+
+            # make b older than a
+            old = time.time() - 100
+            os.utime(os.path.join(temp_dir, ThumbnailDiskCache.cache_key('b')), (old, old))
+
+            cache.store('c', b'cccc')
+            self.assertEqual(cache.size(), 8)
+            self.assertIsNone(cache.data('b'))
+            self.assertEqual(cache.data('a'), b'aaaa')
+            self.assertEqual(cache.data('c'), b'cccc')
+
+            # entries persist
+            cache = ThumbnailDiskCache(temp_dir, max_size=10, max_age_days=1)
+            self.assertEqual(cache.size(), 8)
+            self.assertEqual(cache.data('a'), b'aaaa')
+
+            # expired entries are discarded
+            old = time.time() - 2 * 86400
+            os.utime(os.path.join(temp_dir, ThumbnailDiskCache.cache_key('a')), (old, old))
+            self.assertIsNone(cache.data('a'))
+            self.assertEqual(cache.size(), 4)
+
+            cache.clear()
+            self.assertEqual(cache.size(), 0)
+            self.assertIsNone(cache.data('c'))
+
+            cache = ThumbnailDiskCache(temp_dir, max_size=0)
+            self.assertFalse(cache.is_enabled())
+            cache.store('a', b'aaaa')
+            self.assertIsNone(cache.data('a'))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ThumbnailCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,87 @@
+# coding=utf-8
+"""Thumbnail manager Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.PyQt.QtCore import (
+    QBuffer,
+    QByteArray,
+    QIODevice,
+    QSize
+)
+from qgis.PyQt.QtGui import (
+    QColor,
+    QImage
+)
+
+from .utilities import get_qgis_app
+from ..gui.thumbnail_manager import render_card_thumbnail
+
+QGIS_APP = get_qgis_app()
+
+
+def _png_data(width: int, height: int, color: QColor) -> bytes:
+    """
+    Returns encoded PNG data for a solid color image
+    """
+    image = QImage(width, height, QImage.Format.Format_ARGB32)
+    image.fill(color)
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, 'PNG')
+    buffer.close()
+    return data.data()
+
+
+class ThumbnailManagerTest(unittest.TestCase):
+    """Test thumbnail manager work."""
+
+    def test_render_card_thumbnail(self):
+        """
+        Test rendering card thumbnails
+        """
+        data = _png_data(800, 400, QColor(0, 0, 255))
+
+        thumbnail = render_card_thumbnail(data, QSize(100, 102), 5, 1)
+        self.assertEqual(thumbnail.size(), QSize(100, 102))
+        self.assertEqual(thumbnail.devicePixelRatio(), 1)
+        # rounded corner is transparent
+        self.assertEqual(thumbnail.pixelColor(0, 0).alpha(), 0)
+        self.assertEqual(thumbnail.pixelColor(50, 50).name(), '#0000ff')
+        # right corners aren't rounded
+        self.assertEqual(thumbnail.pixelColor(99, 0).name(), '#0000ff')
+
+        thumbnail = render_card_thumbnail(data, QSize(100, 102), 5, 2)
+        self.assertEqual(thumbnail.size(), QSize(200, 204))
+        self.assertEqual(thumbnail.devicePixelRatio(), 2)
+        self.assertEqual(thumbnail.pixelColor(0, 0).alpha(), 0)
+        self.assertEqual(thumbnail.pixelColor(100, 100).name(), '#0000ff')
+        self.assertEqual(thumbnail.pixelColor(199, 203).name(), '#0000ff')
+
+        # invalid data results in a placeholder
+        thumbnail = render_card_thumbnail(b'not an image', QSize(100, 102), 5, 1)
+        self.assertEqual(thumbnail.size(), QSize(100, 102))
+        self.assertEqual(thumbnail.pixelColor(50, 50).name(), '#cccccc')
+
+        thumbnail = render_card_thumbnail(None, QSize(100, 102), 5, 1)
+        self.assertEqual(thumbnail.pixelColor(50, 50).name(), '#cccccc')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ThumbnailManagerTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,79 @@
+# coding=utf-8
+"""Tile grid Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import unittest
+
+from qgis.core import QgsRectangle
+
+from .utilities import get_qgis_app
+from ..core.tile_grid import (
+    MAX_LATITUDE,
+    snap_extent_to_tile_grid,
+    tile_zoom_for_extent
+)
+
+QGIS_APP = get_qgis_app()
+
+
+class TileGridTest(unittest.TestCase):
+    """Test tile grid work."""
+
+    def test_zoom(self):
+        """
+        Test calculating the zoom level for an extent
+        """
+        self.assertEqual(tile_zoom_for_extent(QgsRectangle(-180, -85, 180, 85)), 2)
+        self.assertEqual(tile_zoom_for_extent(QgsRectangle(0, 0, 1, 1)), 10)
+        self.assertEqual(tile_zoom_for_extent(QgsRectangle(0, 0, 0.1, 0.1)), 13)
+
+    def test_snap(self):
+        """
+        Test snapping extents to the tile grid
+        """
+        extent = snap_extent_to_tile_grid(QgsRectangle(0.1, 0.1, 0.9, 0.9))
+        self.assertAlmostEqual(extent.xMinimum(), 0, 6)
+        self.assertAlmostEqual(extent.yMinimum(), 0, 6)
+        self.assertAlmostEqual(extent.xMaximum(), 1.0546875, 6)
+        self.assertAlmostEqual(extent.yMaximum(), 1.054628, 6)
+
+        # nearby extents snap to an identical extent
+        self.assertEqual(
+            snap_extent_to_tile_grid(QgsRectangle(0.12, 0.13, 0.93, 0.92)).toString(),
+            extent.toString())
+
+        extent = snap_extent_to_tile_grid(QgsRectangle(-180, -MAX_LATITUDE, 180, MAX_LATITUDE))
+        self.assertAlmostEqual(extent.xMinimum(), -180, 6)
+        self.assertAlmostEqual(extent.yMinimum(), -MAX_LATITUDE, 6)
+        self.assertAlmostEqual(extent.xMaximum(), 180, 6)
+        self.assertAlmostEqual(extent.yMaximum(), MAX_LATITUDE, 6)
+
+        # extents beyond the web mercator limits are left unchanged, so that
+        # polar listings aren't excluded
+        self.assertEqual(snap_extent_to_tile_grid(QgsRectangle(-180, -90, 180, 90)),
+                         QgsRectangle(-180, -90, 180, 90))
+        self.assertEqual(snap_extent_to_tile_grid(QgsRectangle(10.1, 84, 20.2, 86)),
+                         QgsRectangle(10.1, 84, 20.2, 86))
+
+        # extents on the edge of the grid
+        extent = snap_extent_to_tile_grid(QgsRectangle(179.9, -1, 180, 1))
+        self.assertAlmostEqual(extent.xMinimum(), 179.296875, 6)
+        self.assertAlmostEqual(extent.xMaximum(), 180, 6)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TileGridTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
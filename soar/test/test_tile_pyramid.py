@@ -0,0 +1,108 @@
+# coding=utf-8
+"""Tile pyramid Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from .utilities import get_qgis_app
+from ..core.tile_pyramid import (
+    WEB_MERCATOR_HALF_EXTENT,
+    GeoPackageTilesWriter,
+    MBTilesWriter,
+    TilePyramidGenerator,
+    TilePyramidWriter,
+    python_executable,
+    tile_bounds,
+    tiles_for_bounds,
+    zoom_range_for_source
+)
+
+QGIS_APP = get_qgis_app()
+
+
+class TilePyramidTest(unittest.TestCase):
+    """Test tile pyramid work."""
+
+    def test_tiles(self):
+        """
+        Test tile calculations
+        """
+        half = WEB_MERCATOR_HALF_EXTENT
+        self.assertEqual(list(tiles_for_bounds((-half, -half, half, half), 0)),
+                         [(0, 0, 0)])
+        self.assertEqual(list(tiles_for_bounds((-half, -half, half, half), 1)),
+                         [(1, 0, 0), (1, 1, 0), (1, 0, 1), (1, 1, 1)])
+        # tiles which only touch the bounds are excluded
+        self.assertEqual(list(tiles_for_bounds((0, 0, half, half), 1)),
+                         [(1, 1, 0)])
+
+        self.assertEqual(tile_bounds((1, 1, 0)), (0, 0, half, half))
+
+        pixel_size = 2 * half / (256 * 2 ** 10)
+        self.assertEqual(zoom_range_for_source(pixel_size, 1000, 600), (8, 10))
+        self.assertEqual(zoom_range_for_source(pixel_size * 1.1, 256, 100), (10, 10))
+
+    def test_writers(self):
+        """
+        Test writing tiles to MBTiles and GeoPackage files
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for extension, writer_class in (('mbtiles', MBTilesWriter),
+                                            ('gpkg', GeoPackageTilesWriter)):
+                file_name = (Path(temp_dir) / f'tiles.{extension}').as_posix()
+                writer = TilePyramidWriter.for_file(file_name)
+                self.assertIsInstance(writer, writer_class)
+
+                writer.set_metadata('soar_source', 'source')
+                writer.set_bounds((0, 0, 1000000, 1000000), 2, 3)
+                writer.write_tile((3, 4, 1), b'tile 1')
+                writer.write_tile((2, 2, 1), b'tile 2')
+                writer.write_empty_tile((3, 5, 1))
+                writer.close()
+
+                # existing tiles (including transparent tiles) are found when
+                # reopening, for resuming generation
+                writer = TilePyramidWriter.for_file(file_name)
+                self.assertEqual(writer.metadata('soar_source'), 'source')
+                self.assertEqual(writer.existing_tiles(), {(3, 4, 1), (2, 2, 1), (3, 5, 1)})
+
+                writer.clear_tiles()
+                self.assertFalse(writer.existing_tiles())
+                writer.close()
+
+            # MBTiles rows are numbered from the south
+            writer = MBTilesWriter((Path(temp_dir) / 'flipped.mbtiles').as_posix())
+            writer.write_tile((3, 4, 1), b'tile')
+            self.assertEqual(writer.connection.execute(
+                'SELECT tile_row FROM tiles').fetchone()[0], 6)
+            writer.close()
+
+    def test_process_context(self):
+        """
+        Test that worker processes are spawned using the Python interpreter
+        """
+        self.assertTrue(Path(python_executable()).exists())
+
+        # pylint: disable=protected-access
+        context = TilePyramidGenerator._process_context()
+        self.assertEqual(context.get_start_method(), 'spawn')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TilePyramidTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
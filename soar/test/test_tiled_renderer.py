@@ -0,0 +1,175 @@
+# coding=utf-8
+"""Tiled map renderer Test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = '(C) 2022 by Nyall Dawson'
+__date__ = '23/11/2022'
+__copyright__ = 'Copyright 2022, North Road'
+# This will get replaced with a git SHA1 when you do a git archive
+__revision__ = '$Format:%H$'
+
+import threading
+import unittest
+
+from osgeo import gdal
+from qgis.PyQt.QtCore import (
+    QCoreApplication,
+    QRect,
+    QSize
+)
+from qgis.PyQt.QtGui import QColor
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsMapDecoration,
+    QgsMapSettings,
+    QgsRectangle
+)
+
+from .utilities import get_qgis_app
+from ..core.tiled_renderer import TiledMapRenderer
+
+QGIS_APP = get_qgis_app()
+
+
+def _map_settings(width: int, height: int) -> QgsMapSettings:
+    """
+    Returns map settings for testing
+    """
+    map_settings = QgsMapSettings()
+    map_settings.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:3857'))
+    map_settings.setExtent(QgsRectangle(0, 0, width * 10, height * 10))
+    map_settings.setOutputSize(QSize(width, height))
+    map_settings.setOutputDpi(96)
+    map_settings.setBackgroundColor(QColor(255, 0, 0))
+    return map_settings
+
+
+class CornerDecoration(QgsMapDecoration):
+    """
+    A decoration drawn in the bottom right corner of the map
+    """
+
+    SIZE = 20
+
+    def render(self, map_settings, context):  # pylint: disable=missing-function-docstring,unused-argument
+        device = context.painter().device()
+        context.painter().fillRect(device.width() - self.SIZE, device.height() - self.SIZE,
+                                   self.SIZE, self.SIZE, QColor(0, 0, 255))
+
+
+class TiledMapRendererTest(unittest.TestCase):
+    """Test tiled map renderer work."""
+
+    def test_tiles(self):
+        """
+        Test splitting a map into tiles
+        """
+        renderer = TiledMapRenderer(_map_settings(1000, 600), 512, 2)
+        self.assertEqual(renderer.tiles(), [QRect(0, 0, 512, 512),
+                                            QRect(512, 0, 488, 512),
+                                            QRect(0, 512, 512, 88),
+                                            QRect(512, 512, 488, 88)])
+
+        # render areas include a margin, clipped to the map
+        self.assertEqual(renderer.render_rect(QRect(512, 0, 488, 512)),
+                         QRect(256, 0, 744, 600))
+
+        renderer = TiledMapRenderer(_map_settings(500, 400), 512, 2)
+        self.assertEqual(renderer.tiles(), [QRect(0, 0, 500, 400)])
+
+        # no tile size, render as a single tile
+        renderer = TiledMapRenderer(_map_settings(1000, 600), 0, 2)
+        self.assertEqual(renderer.tiles(), [QRect(0, 0, 1000, 600)])
+
+    def test_tile_map_settings(self):
+        """
+        Test that tile map settings align with the whole map
+        """
+        map_settings = _map_settings(1000, 600)
+        renderer = TiledMapRenderer(map_settings, 512, 2)
+
+        tile_settings = renderer.tile_map_settings(QRect(256, 0, 744, 600))
+        self.assertEqual(tile_settings.outputSize(), QSize(744, 600))
+        self.assertAlmostEqual(tile_settings.mapUnitsPerPixel(),
+                               map_settings.mapUnitsPerPixel())
+
+        for x, y in ((0, 0), (100, 200), (744, 600)):
+            tile_point = tile_settings.mapToPixel().toMapCoordinates(x, y)
+            map_point = map_settings.mapToPixel().toMapCoordinates(x + 256, y)
+            self.assertAlmostEqual(tile_point.x(), map_point.x(), 3)
+            self.assertAlmostEqual(tile_point.y(), map_point.y(), 3)
+
+    def test_render(self):
+        """
+        Test rendering tiles into a dataset
+        """
+        renderer = TiledMapRenderer(_map_settings(300, 200), 128, 2)
+        dataset = gdal.GetDriverByName('MEM').Create('', 300, 200, 4, gdal.GDT_Byte)
+
+        self.assertTrue(renderer.render(dataset))
+
+        for band, expected in ((1, 255), (2, 0), (3, 0), (4, 255)):
+            data = dataset.GetRasterBand(band).ReadAsArray()
+            self.assertEqual(data.min(), expected)
+            self.assertEqual(data.max(), expected)
+
+    def test_render_decorations(self):
+        """
+        Test that decorations are positioned relative to the whole map
+        """
+        decoration = CornerDecoration()
+        renderer = TiledMapRenderer(_map_settings(300, 200), 128, 2, [decoration])
+        dataset = gdal.GetDriverByName('MEM').Create('', 300, 200, 4, gdal.GDT_Byte)
+
+        self.assertTrue(renderer.render(dataset))
+
+        blue = dataset.GetRasterBand(3).ReadAsArray()
+        size = CornerDecoration.SIZE
+        # drawn once, in the corner of the map
+        self.assertEqual(blue[200 - size:, 300 - size:].min(), 255)
+        self.assertEqual(int((blue == 255).sum()), size * size)
+
+    def test_render_mask_band(self):
+        """
+        Test rendering into a dataset with a mask band
+        """
+        renderer = TiledMapRenderer(_map_settings(300, 200), 128, 2)
+        dataset = gdal.GetDriverByName('MEM').Create('', 300, 200, 3, gdal.GDT_Byte)
+        dataset.CreateMaskBand(gdal.GMF_PER_DATASET)
+
+        self.assertTrue(renderer.render(dataset))
+
+        self.assertEqual(dataset.GetRasterBand(1).ReadAsArray().min(), 255)
+        mask = dataset.GetRasterBand(1).GetMaskBand().ReadAsArray()
+        self.assertEqual(mask.min(), 255)
+
+    def test_render_in_thread(self):
+        """
+        Test rendering from a background thread, with the render jobs
+        started on the main thread
+        """
+        renderer = TiledMapRenderer(_map_settings(300, 200), 128, 2)
+        dataset = gdal.GetDriverByName('MEM').Create('', 300, 200, 4, gdal.GDT_Byte)
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(renderer.render(dataset)))
+        thread.start()
+        while thread.is_alive():
+            QCoreApplication.processEvents()
+            thread.join(0.01)
+
+        self.assertEqual(results, [True])
+        data = dataset.GetRasterBand(4).ReadAsArray()
+        self.assertEqual(data.min(), 255)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TiledMapRendererTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)